@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+from ..model.PixelEncoder import D_KERNEL, D_LATENT
+from ..model.convolutions import CONV_BACKENDS, ConvBackend, make_conv
+
+SIZES = (256, 128, 64, 32, 16)
+BATCH_PIXELS = 1 << 18  # Tiles per measurement: as many as fit in this many pixels.
+BENCHMARK_VERSION = 1
+
+# Usage: python -m pixme.benchmarks.conv [--backends dense fft ...] [--sizes 256 32] [--bf16] [--backward] [--out results.json]
+# Every backend runs on the same (seeded) channels_last input of every trunk stage size; throughput is tiles/s and
+# megapixels/s of input, memory is the peak allocation on CUDA, and everything allocated during one call elsewhere.
+
+def run(backends: tuple[ConvBackend, ...] = CONV_BACKENDS, sizes: tuple[int, ...] = SIZES, channels: int = D_LATENT, kernel: int = D_KERNEL,
+        repeats: int = 5, bf16: bool = False, backward: bool = False, device: str = 'cpu', seed: int = 0) -> dict:
+    results = {
+        "version": BENCHMARK_VERSION,
+        "channels": channels, "kernel": kernel, "bf16": bf16, "backward": backward, "device": device,
+        "platform": {"python": platform.python_version(), "torch": torch.__version__, "machine": platform.machine(), "threads": torch.get_num_threads()},
+        "backends": {},
+    }
+    for backend in backends:
+        torch.manual_seed(seed)
+        conv = make_conv(backend, channels, kernel).to(device, memory_format=torch.channels_last)
+        results["backends"][backend] = {
+            "parameters": sum(p.numel() for p in conv.parameters()),
+            "sizes": [_run_size(conv, size, channels, repeats, bf16, backward, device, seed) for size in sizes],
+        }
+    return results
+
+def _run_size(conv: torch.nn.Module, size: int, channels: int, repeats: int, bf16: bool, backward: bool, device: str, seed: int) -> dict:
+    n = max(1, BATCH_PIXELS // (size * size))
+    x = torch.randn((n, channels, size, size), generator=torch.Generator().manual_seed(seed)).to(device, memory_format=torch.channels_last)
+    x.requires_grad_(backward)
+
+    def call():
+        with torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16, enabled=bf16):
+            y = conv(x)
+        if backward:
+            y.float().sum().backward()
+        return y
+
+    with torch.inference_mode(not backward):
+        y = call()  # Warm-up (and the output shape every backend has to agree on).
+        _synchronize(device)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            call()
+        _synchronize(device)
+        seconds = (time.perf_counter() - start) / repeats
+        memory = _memory_mb(call, device)
+
+    return {
+        "size": size,
+        "n_tiles": n,
+        "output_shape": list(y.shape),
+        "seconds": seconds,
+        "tiles_per_s": n / seconds,
+        "mpixels_per_s": n * size * size / seconds / 1e6,
+        "memory_mb": memory,
+    }
+
+def _memory_mb(call, device: str) -> float:
+    if device.startswith('cuda'):
+        torch.cuda.reset_peak_memory_stats(device)
+        base = torch.cuda.memory_allocated(device)
+        call()
+        return (torch.cuda.max_memory_allocated(device) - base) / 2 ** 20
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        call()
+    return sum(max(event.self_cpu_memory_usage, 0) for event in prof.key_averages()) / 2 ** 20
+
+def _synchronize(device: str) -> None:
+    if device.startswith('cuda'):
+        torch.cuda.synchronize(device)
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description="Throughput and memory of the PixelEncoder conv backends.")
+    parser.add_argument("--backends", nargs="+", choices=CONV_BACKENDS, default=list(CONV_BACKENDS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--channels", type=int, default=D_LATENT)
+    parser.add_argument("--kernel", type=int, default=D_KERNEL)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--bf16", action="store_true", help="run under bf16 autocast, like PixelEncoder.AUTOCAST")
+    parser.add_argument("--backward", action="store_true", help="time forward + backward")
+    parser.add_argument("--device", default='cpu')
+    parser.add_argument("--out", default=None, help="JSON file to write (stdout otherwise)")
+    args = parser.parse_args(argv)
+
+    results = run(tuple(args.backends), tuple(args.sizes), args.channels, args.kernel, args.repeats, args.bf16, args.backward, args.device)
+    for backend, result in results["backends"].items():
+        for row in result["sizes"]:
+            print(f"{backend:>9} {row['size']:>4}px  {row['tiles_per_s']:10.1f} tiles/s  {row['mpixels_per_s']:7.2f} MP/s  "
+                  f"{row['memory_mb']:8.1f} MB  {result['parameters']:>7} params", file=sys.stderr)
+    if args.out is None:
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == '__main__':
+    main()
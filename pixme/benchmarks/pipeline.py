@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+from contextlib import contextmanager, nullcontext
+from PIL import Image
+from pydantic import FilePath
+from typing import Iterator, Literal
+
+import argparse
+import cProfile
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+
+from ..extractors import DatasetManifest, ImageIndex, load_dataset_manifest
+from ..model.PixelEncoder import PixelEncoder
+from ..model.TileDataset import TileDataset
+from ..model.convolutions import CONV_BACKENDS
+from .synthetic import random_spec, sprite_sheet
+from .tiling import peak_rss_mb
+
+STAGES = ("sample", "decode", "tiling", "pad", "to_tensor", "encode")
+PERCENTILES = (50, 90, 99)
+TOLERANCE = 0.15  # Regression mode: how much slower than the baseline (relative) still passes.
+BENCHMARK_VERSION = 1
+
+# Usage: python -m pixme.benchmarks.pipeline [--data data | --synthetic 256] [--iterations 20] [--files 32]
+#                                           [--profile torch|cprofile --trace out] [--baseline base.json [--update-baseline]]
+# Every iteration is one decode-mode `TileDataset.sample` (the code every loader worker runs, here in-process and
+# timed through its `timer` hook) followed by a `PixelEncoder.encode` of it:
+#   sample    -> drawing image ids (`DatasetManifest.sample`, what `ExtractorBase.sample_random` does)
+#   decode    -> png decode (`ImageData.image`)
+#   tiling    -> periodicity detection + rounding + bbox (`ImageData.analyze_tiling`, or the cache with --tiling-cache)
+#   pad       -> crop/pad into the bucket buffers (`BucketBuffers.add`, the `pad_to_power_of_two_square` equivalent)
+#   to_tensor -> normalized tensors (`BucketBuffers.take`)
+#   encode    -> the `PixelEncoder.encode` pass over every bucket
+
+class StageTimer:
+    def __init__(self):
+        self.iterations: list[dict[str, float]] = []
+
+    def next_iteration(self) -> None:
+        self.iterations.append({stage: 0.0 for stage in STAGES})
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.iterations[-1][name] += time.perf_counter() - start
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        # Per-iteration milliseconds of every stage.
+        out = {}
+        for stage in STAGES:
+            ms = np.array([iteration[stage] for iteration in self.iterations]) * 1000
+            out[stage] = {"mean": float(ms.mean()), **{f"p{p}": float(np.percentile(ms, p)) for p in PERCENTILES}}
+        return out
+
+def synthetic_manifest(folder: FilePath, n_images: int, size: int = 256, seed: int = 0) -> DatasetManifest:
+    # Sprite sheets (see `synthetic.py`) split across a few fake extractors, frozen into a saved manifest.
+    rng = np.random.default_rng(seed)
+    indices = []
+    for e in range(4):
+        image_dir = os.path.join(folder, "image", f"synthetic{e}")
+        os.makedirs(image_dir, exist_ok=True)
+        for i in range(e, n_images, 4):
+            Image.fromarray(sprite_sheet(random_spec(rng, size), rng)).save(os.path.join(image_dir, f"{i}.png"))
+        indices.append(ImageIndex.build(f"synthetic{e}", image_dir))
+    return DatasetManifest.build(ImageIndex.concatenate(indices)).save(os.path.join(folder, "index", "manifest"))
+
+def run(manifest: DatasetManifest, iterations: int = 20, n_files: int = 32, warmup: int = 2, encode: bool = True, backend: str = 'dense',
+        autocast: bool = True, tiling_cache: bool = False, profiler: Literal['torch', 'cprofile'] | None = None, trace: FilePath | None = None,
+        seed: int = 0) -> dict:
+    random.seed(seed)  # `square_placement` pads with the `random` module.
+    torch.manual_seed(seed)
+    encoder = PixelEncoder(backend).eval() if encode else None
+    if encoder is not None:
+        encoder.AUTOCAST = autocast
+    n_files = min(n_files, len(manifest))
+    dropped = 0
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        dataset = TileDataset(manifest, n_files=n_files, tiling_cache=os.path.join(cache_dir, "tiling.sqlite") if tiling_cache else None, seed=seed)
+
+        def iteration(timer: StageTimer) -> int:
+            nonlocal dropped
+            timer.next_iteration()
+            dataset.timer = timer
+            sample = dataset.sample()
+            dropped += dataset._buffers.dropped
+            if encoder is not None:
+                with timer.stage("encode"), torch.inference_mode():
+                    encoder.encode(sample)
+            return sum(len(tiles) for tiles in sample.values())
+
+        warm = StageTimer()
+        for _ in range(warmup):
+            iteration(warm)
+        dropped = 0
+
+        timer = StageTimer()
+        tiles = 0
+        with _profiling(profiler, trace):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                tiles += iteration(timer)
+            seconds = time.perf_counter() - start
+        if dataset._cache is not None:
+            dataset._cache.close()
+
+    return {
+        "version": BENCHMARK_VERSION,
+        "config": {"iterations": iterations, "n_files": n_files, "encode": encode, "backend": backend, "autocast": autocast,
+                   "tiling_cache": tiling_cache, "seed": seed, "dataset_size": len(manifest)},
+        "platform": {"python": platform.python_version(), "numpy": np.__version__, "torch": torch.__version__,
+                     "machine": platform.machine(), "threads": torch.get_num_threads()},
+        "tiles": tiles,
+        "seconds": seconds,
+        "tiles_per_s": tiles / seconds if seconds else None,
+        "images_per_s": iterations * n_files / seconds if seconds else None,
+        "stages_ms": timer.summary(),
+        "dropped_tiles": dropped,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+@contextmanager
+def _profiling(profiler: str | None, trace: FilePath | None) -> Iterator[None]:
+    if profiler is None:
+        yield
+        return
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(trace or "pipeline.prof")
+        return
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True) as prof:
+        yield
+    prof.export_chrome_trace(trace or "pipeline.trace.json")
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> list[str]:
+    # Everything that got slower than the baseline by more than `tolerance`: throughput, and the p50 of every stage.
+    regressions = []
+    if baseline.get("config") != results.get("config"):
+        regressions.append(f"ran with {results.get('config')}, but the baseline was made with {baseline.get('config')}")
+    if baseline.get("tiles_per_s") and results["tiles_per_s"] < baseline["tiles_per_s"] / (1 + tolerance):
+        regressions.append(f"tiles/s {results['tiles_per_s']:.1f} vs {baseline['tiles_per_s']:.1f}")
+    for stage, stats in results["stages_ms"].items():
+        base = baseline.get("stages_ms", {}).get(stage, {}).get("p50")
+        # Sub-millisecond stages are all noise.
+        if base and max(base, stats["p50"]) >= 1.0 and stats["p50"] > base * (1 + tolerance):
+            regressions.append(f"{stage} p50 {stats['p50']:.2f}ms vs {base:.2f}ms")
+    return regressions
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Per-stage latency and tiles/s of the sample -> tiles -> PixelEncoder pipeline.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--data", default=None, help="outdir with a saved manifest (see `save_dataset_manifest`)")
+    source.add_argument("--synthetic", type=int, default=128, help="number of synthetic sprite sheets (the default source)")
+    parser.add_argument("--size", type=int, default=256, help="side of the synthetic sheets")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--files", type=int, default=32, help="images per sample (`ImageDataloader.N_FILES_PER_SAMPLE`)")
+    parser.add_argument("--no-encode", action="store_true")
+    parser.add_argument("--backend", choices=CONV_BACKENDS, default='dense')
+    parser.add_argument("--no-autocast", action="store_true")
+    parser.add_argument("--tiling-cache", action="store_true", help="analyze every image only once")
+    parser.add_argument("--profile", choices=['torch', 'cprofile'], default=None)
+    parser.add_argument("--trace", default=None, help="trace/stats file for --profile")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="JSON file to write (stdout otherwise)")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against; exits with 1 on a regression")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results to --baseline instead")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    with (tempfile.TemporaryDirectory() if args.data is None else nullcontext()) as folder:
+        manifest = synthetic_manifest(folder, args.synthetic, args.size, args.seed) if args.data is None else load_dataset_manifest(args.data)
+        if manifest is None:
+            parser.error(f"No saved manifest in `{args.data}`.")
+        results = run(manifest, args.iterations, args.files, args.warmup, not args.no_encode, args.backend, not args.no_autocast,
+                      args.tiling_cache, args.profile, args.trace, args.seed)
+
+    print(f"{results['tiles_per_s'] or 0:.1f} tiles/s, {results['images_per_s'] or 0:.1f} images/s", file=sys.stderr)
+    for stage, stats in results["stages_ms"].items():
+        print(f"{stage:>10}  " + "  ".join(f"p{p} {stats[f'p{p}']:8.2f}ms" for p in PERCENTILES), file=sys.stderr)
+    if args.out is None:
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is None:
+        return 0
+    if args.update_baseline or not os.path.isfile(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from ..image.ImageData import pad_to_power_of_two_square, split_tiles
+
+@dataclass(frozen=True)
+class SheetSpec:
+    t_y: int  # Tiles along each axis; this is what the tiling detection should find.
+    t_x: int
+    tile: int  # Side of a cell, in pixels.
+    margin: int  # Transparent border inside every cell (the gutter between sprites is twice that).
+    noise: float  # Std of the gaussian noise added to the RGB of the sprites.
+    translucent: float  # Fraction of sprite pixels with a random (non-opaque) alpha.
+    empty: float  # Fraction of cells left fully transparent.
+    n_colors: int  # Palette size of each sprite.
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.t_y * self.tile, self.t_x * self.tile
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+def random_spec(rng: np.random.Generator, size: int, tiles: tuple[int, ...] = (16, 32, 64), noise: tuple[float, ...] = (0.0, 4.0, 16.0)) -> SheetSpec:
+    # A sheet of about `size` x `size` pixels (half as tall one time out of four, like most item atlases).
+    tile = int(rng.choice([t for t in tiles if size // t >= 2] or [min(tiles)]))
+    height = size // 2 if rng.random() < 0.25 and size // 2 >= 2 * tile else size
+    return SheetSpec(
+        t_y=max(1, height // tile), t_x=max(1, size // tile), tile=tile,
+        margin=int(rng.integers(1, max(2, tile // 8) + 1)),
+        noise=float(rng.choice(noise)),
+        translucent=float(rng.choice([0.0, 0.1])),
+        empty=float(rng.choice([0.0, 0.1, 0.3])),
+        n_colors=int(rng.integers(4, 17)),
+    )
+
+def sprite_sheet(spec: SheetSpec, rng: np.random.Generator) -> np.ndarray:
+    # (H, W, 4) uint8 sheet of t_y x t_x cells, each holding a random left/right symmetric sprite (or nothing).
+    n, inner = spec.t_y * spec.t_x, spec.tile - 2 * spec.margin
+    half = (inner + 1) // 2
+
+    # Blobby shapes: a coarse random grid, upscaled, then mirrored.
+    coarse = rng.random((n, (inner + 3) // 4, (half + 3) // 4)) < 0.6
+    shape = coarse.repeat(4, axis=1).repeat(4, axis=2)[:, :inner, :half]
+    shape = np.concatenate([shape, shape[:, :, :inner - half][:, :, ::-1]], axis=2)
+    shape[rng.random(n) < spec.empty] = False
+
+    palettes = rng.integers(0, 256, (n, spec.n_colors, 3), dtype=np.uint8)
+    picks = rng.integers(0, spec.n_colors, (n, inner, inner))
+    rgb = np.take_along_axis(palettes, picks.reshape(n, -1, 1), axis=1).reshape(n, inner, inner, 3).astype(np.float32)
+    if spec.noise:
+        rgb += rng.normal(0, spec.noise, rgb.shape).astype(np.float32)
+    alpha = np.full((n, inner, inner), 255, dtype=np.uint8)
+    if spec.translucent:
+        soft = rng.random((n, inner, inner)) < spec.translucent
+        alpha[soft] = rng.integers(32, 255, int(soft.sum()), dtype=np.uint8)
+
+    cells = np.zeros((n, spec.tile, spec.tile, 4), dtype=np.uint8)
+    inside = cells[:, spec.margin:spec.margin + inner, spec.margin:spec.margin + inner]
+    inside[..., :3] = np.clip(rgb, 0, 255).astype(np.uint8)
+    inside[..., 3] = alpha
+    inside[~shape] = 0
+    return cells.reshape(spec.t_y, spec.t_x, spec.tile, spec.tile, 4).transpose(0, 2, 1, 3, 4).reshape(*spec.shape, 4)
+
+def reference_tiles(image: np.ndarray, spec: SheetSpec) -> np.ndarray:
+    # What `ImageData.create_tiles(random_pad=False)` should give for the sheet, from its true tiling.
+    return pad_to_power_of_two_square(split_tiles(image, spec.t_y, spec.t_x), random_pad=False)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from PIL import Image
+from pydantic import FilePath
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from ..image.ImageData import ImageData, MaskMode, Spectrum, detect_periodic
+from .synthetic import SheetSpec, random_spec, reference_tiles, sprite_sheet
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SIZES = (64, 128, 256, 512, 1024)
+N_IMAGES = 32
+BENCHMARK_VERSION = 1  # Bump whenever the generated sheets or the metrics change, so old results aren't compared blindly.
+
+# Usage: python -m pixme.benchmarks.tiling [--sizes 128 256 ...] [--images 32] [--seed 0] [--out results.json]
+# Every size gets its own freshly generated (seeded) sheets, written to png and decoded back, like real data.
+
+def run(sizes: tuple[int, ...] = SIZES, n_images: int = N_IMAGES, seed: int = 0, mask_mode: MaskMode = 'sat', spectrum: Spectrum = 'blue') -> dict:
+    results = {
+        "version": BENCHMARK_VERSION,
+        "seed": seed,
+        "mask_mode": mask_mode,
+        "spectrum": spectrum,
+        "platform": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(), "system": platform.system()},
+        "sizes": [],
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            results["sizes"].append(_run_size(folder, size, n_images, np.random.default_rng([seed, size]), mask_mode, spectrum))
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def _run_size(folder: FilePath, size: int, n_images: int, rng: np.random.Generator, mask_mode: MaskMode, spectrum: Spectrum) -> dict:
+    specs = [random_spec(rng, size) for _ in range(n_images)]
+    files = []
+    for i, spec in enumerate(specs):
+        files.append(os.path.join(folder, f"{size}_{i}.png"))
+        Image.fromarray(sprite_sheet(spec, rng)).save(files[-1])
+
+    timings = {"decode": 0.0, "detect": 0.0, "analyze": 0.0, "create_tiles": 0.0}
+    rows = []
+    tracemalloc.start()
+    for file, spec in zip(files, specs):
+        start = time.perf_counter()
+        data = ImageData(file, mask_mode=mask_mode, spectrum=spectrum)
+        image = data.image
+        timings["decode"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        raw = data._detect_periodic()
+        timings["detect"] += time.perf_counter() - start
+
+        # `analyze_tiling` detects again; its own time minus `detect` is the rounding + bbox.
+        start = time.perf_counter()
+        tiling = data.analyze_tiling()
+        timings["analyze"] += time.perf_counter() - start
+
+        # No tiling cache, so this is the full per-image cost (analysis included).
+        start = time.perf_counter()
+        tiles = data.create_tiles(random_pad=False)
+        timings["create_tiles"] += time.perf_counter() - start
+
+        rows.append(_score(spec, image, raw, (tiling.t_y, tiling.t_x), tiles))
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # The batched path, over the decoded images grouped by shape.
+    images = [ImageData(file).image for file in files]
+    start = time.perf_counter()
+    detect_periodic(images, mask_mode=mask_mode, spectrum=spectrum)
+    timings["detect_batched"] = time.perf_counter() - start
+
+    megabytes = sum(spec.shape[0] * spec.shape[1] * 4 for spec in specs) / 2 ** 20
+    return {
+        "size": size,
+        "n_images": n_images,
+        "megabytes": megabytes,
+        "accuracy": _summarize(rows),
+        "by_noise": {str(noise): _summarize([row for row in rows if row["noise"] == noise]) for noise in sorted({row["noise"] for row in rows})},
+        "by_tile": {str(tile): _summarize([row for row in rows if row["tile"] == tile]) for tile in sorted({row["tile"] for row in rows})},
+        "seconds": timings,
+        "images_per_s": {stage: n_images / t if t else None for stage, t in timings.items()},
+        "mb_per_s": {stage: megabytes / t if t else None for stage, t in timings.items()},
+        "peak_traced_mb": peak_traced / 2 ** 20,
+        "peak_rss_mb": peak_rss_mb(),
+        "failures": [row for row in rows if not row["tiling_exact"]],
+    }
+
+def _score(spec: SheetSpec, image: np.ndarray, raw: tuple[float, float], rounded: tuple[int, int], tiles: np.ndarray | None) -> dict:
+    truth = (spec.t_y, spec.t_x)
+    reference = reference_tiles(image, spec)
+    return {
+        **spec.to_dict(),
+        "raw": [float(t) for t in raw],
+        "rounded": [int(t) for t in rounded],
+        "raw_exact": all(float(t) == s for t, s in zip(raw, truth)),
+        "tiling_exact": tuple(rounded) == truth,
+        # Detected a coarser grid whose cells are whole multiples of the true ones (e.g. 2x2 sprites per tile).
+        "tiling_divisor": all(s % t == 0 for t, s in zip(rounded, truth)),
+        "tiles_exact": tiles is not None and tiles.shape == reference.shape and np.array_equal(tiles, reference),
+        "n_tiles": 0 if tiles is None else len(tiles),
+        "expected_tiles": len(reference),
+    }
+
+def _summarize(rows: list[dict]) -> dict:
+    if not rows:
+        return {}
+    return {
+        "n": len(rows),
+        "raw_exact": float(np.mean([row["raw_exact"] for row in rows])),
+        "raw_rel_error": _mean([abs(t - s) / s for row in rows for t, s in zip(row["raw"], (row["t_y"], row["t_x"])) if np.isfinite(t)]),
+        "tiling_exact": float(np.mean([row["tiling_exact"] for row in rows])),
+        "tiling_y": float(np.mean([row["rounded"][0] == row["t_y"] for row in rows])),
+        "tiling_x": float(np.mean([row["rounded"][1] == row["t_x"] for row in rows])),
+        "tiling_divisor": float(np.mean([row["tiling_divisor"] for row in rows])),
+        "tiles_exact": float(np.mean([row["tiles_exact"] for row in rows])),
+    }
+
+def _mean(values: list[float]) -> float | None:
+    # None rather than NaN, which isn't valid JSON.
+    return float(np.mean(values)) if values else None
+
+def peak_rss_mb() -> float | None:
+    # Peak resident memory of the whole process so far (None where `resource` doesn't exist).
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # bytes on macOS, KiB elsewhere
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description="Accuracy and throughput of the tile detection on synthetic sprite sheets.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--images", type=int, default=N_IMAGES, help="sheets per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mask-mode", choices=['sat', 'convolve'], default='sat')
+    parser.add_argument("--spectrum", choices=['blue', 'rgb'], default='blue', help="see `ImageData.SPECTRUM`")
+    parser.add_argument("--out", default=None, help="JSON file to write (stdout otherwise)")
+    args = parser.parse_args(argv)
+
+    results = run(tuple(args.sizes), args.images, args.seed, args.mask_mode, args.spectrum)
+    for row in results["sizes"]:
+        print(f"{row['size']:>5}px  tiling {row['accuracy']['tiling_exact']:6.1%}  tiles {row['accuracy']['tiles_exact']:6.1%}  "
+              f"{row['images_per_s']['create_tiles'] or 0:8.1f} img/s  {row['mb_per_s']['analyze'] or 0:7.1f} MB/s analyze", file=sys.stderr)
+    if args.out is None:
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import cached_property
+from pydantic import FilePath
+from typing import List
+
+import json
+import os
+import numpy as np
+
+from .ImageIndex import ImageIndex
+from .DatasetSampler import DatasetSampler
+
+@dataclass(frozen=True, eq=False)
+class DatasetManifest:
+    # Everything needed to sample and load images, frozen once the extractors are done; a saved one pickles as its path.
+    index: ImageIndex  # Global image ids, paths and metadata.
+    weights: np.ndarray  # Per-image weight of every extractor (see `DatasetSampler`), in index order.
+    balanced: bool = False
+    path: FilePath | None = None  # An index folder plus manifest.json, once saved.
+
+    def __post_init__(self):
+        if len(self.weights) != len(self.index.extractors):
+            raise ValueError(f"Expected {len(self.index.extractors)} extractor weights, got {len(self.weights)}.")
+        for array in (self.weights, self.index.records, self.index.names, self.index.metadata_blob):
+            if array.flags.writeable:
+                array.setflags(write=False)
+
+    def __reduce__(self):
+        if self.path is not None:
+            return DatasetManifest.load, (self.path,)
+        return DatasetManifest, (self.index, self.weights, self.balanced)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def extractors(self) -> List[str]:
+        return self.index.extractors
+
+    @cached_property
+    def sizes(self) -> np.ndarray:
+        return self.index.sizes
+
+    @cached_property
+    def partitions(self) -> np.ndarray:
+        return self.index.partitions
+
+    @cached_property
+    def sampler(self) -> DatasetSampler:
+        return self.make_sampler()
+
+    def make_sampler(self, seed: int | None = None) -> DatasetSampler:
+        return DatasetSampler(self.sizes, weights=self.weights, balanced=self.balanced, seed=seed)
+
+    def sample(self, n: int, replace: bool = False, rng: np.random.Generator | None = None) -> np.ndarray:
+        return self.sampler.sample(n, replace=replace, rng=rng)
+
+    def file(self, i: int) -> FilePath:
+        return self.index.path(int(i))
+
+    def metadata(self, i: int) -> dict:
+        return self.index.metadata(int(i))
+
+    @classmethod
+    def build(cls, index: ImageIndex, weights: dict[str, float] | None = None, balanced: bool = False) -> DatasetManifest:
+        # `weights` maps extractor ids to a per-image weight; missing ids default to 1.
+        weights = weights or {}
+        return cls(index, np.array([weights.get(id_, 1.0) for id_ in index.extractors], dtype=np.float64), balanced)
+
+    def save(self, path: FilePath) -> DatasetManifest:
+        # Returns the saved (memory-mapped) manifest; manifest.json goes first, so index.json still marks a finished save.
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "manifest.json"), "w") as f:
+            json.dump({"weights": self.weights.tolist(), "balanced": self.balanced}, f)
+        self.index.save(path)
+        return DatasetManifest.load(path)
+
+    @classmethod
+    def load(cls, path: FilePath) -> DatasetManifest | None:
+        index = ImageIndex.load(path)
+        manifest_file = os.path.join(path, "manifest.json")
+        if index is None or not os.path.isfile(manifest_file):
+            return None
+        with open(manifest_file) as f:
+            header = json.load(f)
+        return cls(index, np.asarray(header["weights"], dtype=np.float64), header.get("balanced", False), path)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import numpy as np
+
+class DatasetSampler:
+    # Draws global image ids (as in `ImageIndex`): an extractor by Vose's alias method, then any image inside it.
+
+    def __init__(self, sizes: np.ndarray, weights: np.ndarray | None = None, balanced: bool = False, seed: int | None = None):
+        # `weights` is per image of every extractor (uniform by default); `balanced` gives every extractor the same total.
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.partitions = np.concatenate([[0], np.cumsum(self.sizes)])
+        self.total_size = int(self.partitions[-1])
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+        weights = np.ones(len(self.sizes)) if weights is None else np.asarray(weights, dtype=np.float64)
+        if weights.shape != self.sizes.shape:
+            raise ValueError(f"Expected {len(self.sizes)} extractor weights, got {weights.shape}.")
+        if np.any(weights < 0):
+            raise ValueError("Extractor weights must be non-negative.")
+        if balanced:
+            weights = np.divide(weights, self.sizes, out=np.zeros_like(weights), where=self.sizes > 0)
+        self.weights = weights
+
+        mass = self.weights * self.sizes
+        if self.total_size == 0 or mass.sum() == 0:
+            raise ValueError("Cannot sample from an empty dataset (or one where every weight is 0).")
+        self.probabilities = mass / mass.sum()
+        # Computed once from the per-extractor weights; sampling without replacement never needs per-image weights for them.
+        filled = self.weights[self.sizes > 0]
+        self._uniform = bool(np.all(filled == filled[0]))
+        self._n_positive = int(self.sizes[self.weights > 0].sum())
+        self._alias_prob, self._alias = self.__build_alias_table(self.probabilities)
+
+    def __len__(self) -> int:
+        return self.total_size
+
+    @staticmethod
+    def __build_alias_table(probabilities: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        k = len(probabilities)
+        scaled = probabilities * k
+        prob = np.ones(k)
+        alias = np.arange(k)
+        small = [i for i in range(k) if scaled[i] < 1.0]
+        large = [i for i in range(k) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Whatever is left over is 1 up to floating point error.
+        return prob, alias
+
+    def sample_extractors(self, n: int, rng: np.random.Generator | None = None) -> np.ndarray:
+        rng = self.rng if rng is None else rng
+        column = rng.integers(0, len(self.sizes), size=n)
+        return np.where(rng.random(n) < self._alias_prob[column], column, self._alias[column])
+
+    def sample(self, n: int, replace: bool = True, rng: np.random.Generator | None = None) -> np.ndarray:
+        rng = self.rng if rng is None else rng
+        if replace:
+            extractors = self.sample_extractors(n, rng)
+            local = (rng.random(n) * self.sizes[extractors]).astype(np.int64)
+            return self.partitions[extractors] + local
+
+        # Zero-weight images would get -inf keys below and silently make up the difference.
+        if n > self._n_positive:
+            raise ValueError(f"Cannot draw {n} images without replacement from the {self._n_positive} with a non-zero weight.")
+        if self._uniform:
+            return rng.choice(self.total_size, size=n, replace=False)
+        # Efraimidis-Spirakis: the n largest u^(1/w) keys are a weighted sample without replacement.
+        with np.errstate(divide='ignore'):
+            keys = np.log(rng.random(self.total_size)) / np.repeat(self.weights, self.sizes)
+        chosen = np.argpartition(-keys, n - 1)[:n] if n else np.zeros(0, dtype=np.int64)
+        return chosen[np.argsort(-keys[chosen])]
+
+    def epoch(self, epoch: int, replace: bool = False) -> np.ndarray:
+        # With a seed, every epoch has its own stream derived from (seed, epoch), so any epoch can be replayed on its own.
+        rng = self.rng if self.seed is None else np.random.default_rng([self.seed, epoch])
+        n = self._n_positive if not replace else self.total_size
+        return self.sample(n, replace=replace, rng=rng)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from pydantic import FilePath
+
+import hashlib
+import json
+import os
+
+from ..utils.path import generate_random_string
+
+class ExtractionCache:
+    # Layout of `<outdir>/cache`:
+    #   * keys/<key>.json -> which extractor id (and image folder) holds the output for that key.
+    #   * ids/<id>.json   -> which key the images of an extractor id currently belong to.
+    # Every file is only ever written by the extractor that owns it, so parallel extraction never collides.
+
+    def __init__(self, outdir: FilePath = "data"):
+        self.outdir = outdir
+        self.directory = os.path.join(outdir, "cache")
+        self._key_dir = os.path.join(self.directory, "keys")
+        self._id_dir = os.path.join(self.directory, "ids")
+        os.makedirs(self._key_dir, exist_ok=True)
+        os.makedirs(self._id_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(signature: dict) -> str:
+        return hashlib.sha256(json.dumps(signature, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def lookup(self, key: str) -> FilePath | None:
+        # Returns the image folder holding the output for `key`, if it is still valid.
+        entry = self.__read(os.path.join(self._key_dir, key + ".json"))
+        if entry is None:
+            return None
+
+        # The owner may have been re-extracted from a different archive since.
+        owner = self.__read(os.path.join(self._id_dir, entry["id"] + ".json"))
+        if owner is None or owner["key"] != key:
+            return None
+
+        # Archives without any image are recorded as such, so they're a hit too instead of being re-extracted every run.
+        image_dir = os.path.join(self.outdir, entry["image_dir"])
+        if not os.path.isdir(image_dir) or (not entry.get("empty", False) and not os.listdir(image_dir)):
+            return None
+        return image_dir
+
+    def store(self, key: str, id_: str, image_dir: FilePath) -> None:
+        empty = not os.path.isdir(image_dir) or not os.listdir(image_dir)
+        entry = {"id": id_, "image_dir": os.path.relpath(image_dir, self.outdir), "empty": empty}
+        self.__write(os.path.join(self._key_dir, key + ".json"), entry)
+        self.__write(os.path.join(self._id_dir, id_ + ".json"), {"key": key})
+
+    def invalidate(self, id_: str) -> None:
+        try:
+            os.remove(os.path.join(self._id_dir, id_ + ".json"))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def __read(file: FilePath) -> dict | None:
+        try:
+            with open(file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def __write(file: FilePath, entry: dict) -> None:
+        # Write-then-rename so a reader never sees half a file.
+        temp_file = file + "." + generate_random_string(8)
+        with open(temp_file, "w") as f:
+            json.dump(entry, f)
+        os.replace(temp_file, file)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, Future
+from pydantic import FilePath
+from typing import List, Type
+
+import multiprocessing
+import os
+import warnings
+
+from .ExtractorBase import ExtractorBase
+from .MinecraftExtractor import MinecraftExtractor
+from .TerrariaExtractor import TerrariaExtractor
+from .ZipExtractor import ZipExtractor
+from ..wrappers.libpath import get_lib_path, change_lib_path
+from ..wrappers.limits import Tools, create_tool_limits, get_tool_limits, set_tool_limits
+
+EXTRACTOR_TYPES: dict[str, Type[ExtractorBase]] = {
+    '.jar': MinecraftExtractor,
+    '.tmod': TerrariaExtractor,
+    '.zip': ZipExtractor,
+}
+
+# JVMs and .NET runtimes are memory hungry, so don't let every worker start one at the same time.
+DEFAULT_TOOL_LIMITS: dict[Tools, int] = {
+    'vineflower': 2,
+    'ilspycmd': 4,
+    'tml_patcher': 4,
+    'terrariaxnb2png': 4,
+    'decompilermc': 1,
+}
+
+def _init_worker(lib_path: FilePath, semaphores: dict, save_extraction: bool) -> None:
+    # Module globals don't survive a spawned process, so hand over everything the extractors rely on.
+    change_lib_path(lib_path)
+    set_tool_limits(semaphores)
+    ExtractorBase.SAVE_EXTRACTION = save_extraction
+
+def _extract_worker(extractor_type: Type[ExtractorBase], file: FilePath, outdir: FilePath) -> None:
+    # Only the files on disk matter here; the parent registers the extractor afterwards.
+    extractor_type(file, outdir=outdir)
+
+
+class ExtractionScheduler:
+    def __init__(self, outdir: FilePath = "data", n_workers: int | None = None, tool_limits: dict[Tools, int] | None = None, batch_decompile: bool = True):
+        self.outdir = outdir
+        self.batch_decompile = batch_decompile
+        self.n_workers = (os.cpu_count() or 1) if n_workers is None else n_workers
+        self.tool_limits = dict(DEFAULT_TOOL_LIMITS)
+        if tool_limits is not None:
+            self.tool_limits.update(tool_limits)
+
+        if self.n_workers < 1:
+            raise ValueError(f"`n_workers` must be at least 1, got {self.n_workers}.")
+
+    @staticmethod
+    def get_extractor_type(file: FilePath) -> Type[ExtractorBase] | None:
+        return EXTRACTOR_TYPES.get(os.path.splitext(file)[1])
+
+    def collect(self, folder: FilePath) -> List[tuple[Type[ExtractorBase], FilePath]]:
+        # Sorted so that the registration order (and therefore the partitions) doesn't depend on the filesystem.
+        jobs = []
+        seen = set()
+        for file in sorted(os.listdir(folder)):
+            extractor_type = self.get_extractor_type(file)
+            if extractor_type is None:
+                continue
+            id_ = os.path.splitext(file)[0]
+            if id_ in seen or id_ in ExtractorBase.banned_extractors or id_ in ExtractorBase.registered_extractors:
+                continue
+            seen.add(id_)
+            jobs.append((extractor_type, os.path.join(folder, file)))
+        return jobs
+
+    def run(self, folder: FilePath) -> List[ExtractorBase]:
+        jobs = self.collect(folder)
+        # The same semaphores cover the batch decompilers here in the parent and the tools of every worker.
+        context = multiprocessing.get_context()
+        semaphores = create_tool_limits(self.tool_limits, context)
+        if self.batch_decompile:
+            previous = get_tool_limits()
+            set_tool_limits(semaphores)
+            try:
+                self.__predecompile(jobs)
+            finally:
+                set_tool_limits(previous)
+        if self.n_workers == 1 or len(jobs) <= 1:
+            return self.__run_sequential(jobs)
+        return self.__run_parallel(jobs, context, semaphores)
+
+    def __run_sequential(self, jobs: List[tuple[Type[ExtractorBase], FilePath]]) -> List[ExtractorBase]:
+        extractors = []
+        for extractor_type, file in jobs:
+            try:
+                extractors.append(extractor_type(file, outdir=self.outdir))
+            except Exception:
+                warnings.warn(f'Could not extract `{file}...`')
+        return extractors
+
+    def __run_parallel(self, jobs: List[tuple[Type[ExtractorBase], FilePath]], context, semaphores: dict) -> List[ExtractorBase]:
+        extractors = []
+        with ProcessPoolExecutor(
+            max_workers=min(self.n_workers, len(jobs)),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(get_lib_path(), semaphores, ExtractorBase.SAVE_EXTRACTION),
+        ) as pool:
+            futures: List[Future] = [pool.submit(_extract_worker, extractor_type, file, self.outdir) for extractor_type, file in jobs]
+
+            # Results are merged in submission order, not completion order, so the
+            # class globals end up exactly the way a sequential run would leave them.
+            for (extractor_type, file), future in zip(jobs, futures):
+                try:
+                    future.result()
+                    extractors.append(self.__register(extractor_type, file))
+                except Exception:
+                    warnings.warn(f'Could not extract `{file}...`')
+        return extractors
+
+    def __predecompile(self, jobs: List[tuple[Type[ExtractorBase], FilePath]]) -> None:
+        # One decompiler invocation per extractor type (and batch), instead of one per file.
+        grouped: dict[Type[ExtractorBase], List[FilePath]] = {}
+        for extractor_type, file in jobs:
+            grouped.setdefault(extractor_type, []).append(file)
+        for extractor_type, files in grouped.items():
+            try:
+                extractor_type.predecompile(files, self.outdir, n_workers=self.n_workers)
+            except Exception:
+                # Nothing is lost; every extractor just decompiles its own file again.
+                warnings.warn(f'Could not batch decompile the `{extractor_type.__name__}` files...')
+
+    def __register(self, extractor_type: Type[ExtractorBase], file: FilePath) -> ExtractorBase:
+        extract_on_init = ExtractorBase.EXTRACT_ON_INIT
+        ExtractorBase.EXTRACT_ON_INIT = False
+        try:
+            return extractor_type(file, outdir=self.outdir)
+        finally:
+            ExtractorBase.EXTRACT_ON_INIT = extract_on_init
@@ -8,14 +8,21 @@ from typing import List
 import os
 import random
 import shutil
-import json
 import warnings
+import numpy as np
 
 from .NullExtractor import NullExtractor
+from .ExtractionCache import ExtractionCache
+from .ImageIndex import ImageIndex
+from .DatasetSampler import DatasetSampler
+from .DatasetManifest import DatasetManifest
 from ..utils.image import copy_images_recursively
-from ..utils.misc import find_partition
+from ..utils.path import hash_file
+from ..wrappers.limits import Tools
+from ..wrappers.versions import get_tool_versions
 
 MIN_DATASET_SIZE = 4
+PREDECOMPILED_MARKER = ".predecompiled"
 
 class ExtractorBase(ABC):
 
@@ -27,24 +34,33 @@ class ExtractorBase(ABC):
     @dataclass
     class ImplicitDataset:
         directory: FilePath
-        size: int
+        index: ImageIndex
 
         def __len__(self) -> int:
-            return self.size
+            return len(self.index)
 
-        def get(self) -> List[FilePath]:
-            return os.listdir(self.directory)
+        def __getitem__(self, i: int) -> ExtractorBase.LabeledDataEntry:
+            return ExtractorBase.LabeledDataEntry(self.index.path(i), self.index.metadata(i))
 
-        def sample(self, n: int) -> List[FilePath]:
-            return random.sample(os.listdir(self.directory), n)
+        def get(self) -> List[ExtractorBase.LabeledDataEntry]:
+            return [self[i] for i in range(len(self))]
+
+        def sample(self, n: int) -> List[ExtractorBase.LabeledDataEntry]:
+            return [self[i] for i in random.sample(range(len(self)), n)]
 
     SAVE_EXTRACTION: bool = False
+    EXTRACT_ON_INIT: bool = True  # Turned off when the extraction cycle already ran somewhere else (e.g. a worker process).
+    USE_CACHE: bool = True  # Skips the extraction cycle when the exact same archive was already extracted with the same tools.
+    TOOLS: tuple[Tools, ...] = ()  # External tools whose versions invalidate the cache.
     JSON_WARNED: bool = False  # I haven't implemented the json logic yet, so this exists to do such a thing.
 
     registered_extractors: dict[str, ExtractorBase] = {}
     banned_extractors: set[str] = set()
     total_size: int = 0
     partitions: list[int] = [0]
+    sampler: DatasetSampler | None = None  # Rebuilt lazily whenever the registered extractors change.
+    sampler_weights: dict[str, float] | None = None  # The last `get_sampler` configuration; rebuilds and `manifest` keep it.
+    sampler_balanced: bool = False
 
     @staticmethod
     def __new__(cls, file: FilePath = None, *_, **__):
@@ -67,8 +83,10 @@ class ExtractorBase(ABC):
         self._image_dir = os.path.join(outdir, "image")
         self._json_dir = os.path.join(outdir, "json")
         self._extract_dir = os.path.join(outdir, "extract")
+        self._index_dir = os.path.join(outdir, "index", "extractors")
 
         self._make_important_directories()
+        self._cache = ExtractionCache(outdir) if self.USE_CACHE else None
 
         # Used later for sampling :)
         self._file = file
@@ -76,6 +94,7 @@ class ExtractorBase(ABC):
         self._dataset_explicit: bool = True
         self.__image_dataset_impl: ExtractorBase.ImplicitDataset | None = None
         self._dataset: List[ExtractorBase.LabeledDataEntry] = []
+        self._index_stale: bool = False
 
         # Should change the protected variables:
         #   * _dataset -> appends the image paths to _dataset.
@@ -94,33 +113,86 @@ class ExtractorBase(ABC):
 
     def __after_init__(self):
         # This is the hook that gets inserted after the subclasses' init. Add more if needed.
-        self._run_extraction_cycle()
+        if self.EXTRACT_ON_INIT:
+            self._run_extraction_cycle()
         self._get_image_dataset()
         self.__unload_dataset()
 
     def _run_extraction_cycle(self):
+        key = self.__cache_key()
+        if key is not None:
+            if self.__restore_cached(key):
+                return
+            # The archive changed (or is new), so whatever was extracted under this id before is stale.
+            self._cache.invalidate(self._id)
+            self.__clear_output()
+
         self._extract_files()
         self._extract_images()
         self._extract_json()
         self.__clean()
+        self._index_stale = True
 
-    def _get_image_dataset(self):
-        for file in os.listdir(self._image_dir):
-            image_file = os.path.join(self._image_dir, file)
-            json_file = os.path.join(self._json_dir, os.path.splitext(file)[0] + ".json")
+        if key is not None:
+            self._cache.store(key, self._id, self._image_dir)
+
+    @classmethod
+    def _cache_signature(cls, file: FilePath) -> dict | None:
+        # Vanilla extractors (`minecraft`, `terraria`) have no archive to hash, so they're never cached.
+        if not os.path.isfile(file):
+            return None
+        return {
+            "file": hash_file(file),
+            "extractor": cls.__name__,
+            "tools": get_tool_versions(cls.TOOLS),
+        }
+
+    @classmethod
+    def is_cached(cls, file: FilePath, outdir: FilePath = "data") -> bool:
+        # Whether constructing this extractor would just restore its images from the cache.
+        if not cls.USE_CACHE:
+            return False
+        signature = cls._cache_signature(file)
+        if signature is None:
+            return False
+        return ExtractionCache(outdir).lookup(ExtractionCache.make_key(signature)) is not None
+
+    def __cache_key(self) -> str | None:
+        if self._cache is None:
+            return None
+        signature = self._cache_signature(self._file)
+        if signature is None:
+            return None
+        return ExtractionCache.make_key(signature)
+
+    def __restore_cached(self, key: str) -> bool:
+        cached_dir = self._cache.lookup(key)
+        if cached_dir is None:
+            return False
+        if os.path.normpath(cached_dir) != os.path.normpath(self._image_dir):
+            # Renamed (but identical) archive; reuse the images that are already on disk.
+            self.__clear_output()
+            copy_images_recursively(cached_dir, self._image_dir)
+            self._cache.store(key, self._id, self._image_dir)
+        return True
+
+    def __clear_output(self):
+        shutil.rmtree(self._image_dir, ignore_errors=True)
+        shutil.rmtree(self._json_dir, ignore_errors=True)
+        self._make_important_directories()
 
-            if not os.path.isfile(json_file):
-                image_json = {}
-                self.__warn_json()
-            else:
-                image_json = json.load(open(json_file))
+    def _get_image_dataset(self):
+        # The index is only rebuilt when the image/json folders changed (i.e. the extraction cycle actually ran).
+        index = ImageIndex.load_or_build(os.path.join(self._index_dir, self._id), self._id, self._image_dir, self._json_dir, force=self._index_stale)
+        if len(index) and not index.has_metadata().all():
+            self.__warn_json()
 
-            self._dataset.append(ExtractorBase.LabeledDataEntry(image_file, image_json))
+        self.__image_dataset_impl = ExtractorBase.ImplicitDataset(self._image_dir, index)
+        self._dataset_explicit = False
 
         if len(self) >= MIN_DATASET_SIZE:
             ExtractorBase.total_size += len(self)
             ExtractorBase.partitions.append(ExtractorBase.partitions[-1] + len(self))
-            self.__image_dataset_impl = ExtractorBase.ImplicitDataset(self._image_dir, len(self))
         else:
             ExtractorBase.banned_extractors.add(self._id)
             del ExtractorBase.registered_extractors[self._id]
@@ -147,6 +219,35 @@ class ExtractorBase(ABC):
     @abstractmethod
     def _extract_files(self) -> None: pass
 
+    @classmethod
+    def predecompile(cls, files: List[FilePath], outdir: FilePath = "data", n_workers: int = 1) -> None:
+        # Hook for extractors built on external decompilers: decompile many files with one tool invocation
+        # (see `pixme.wrappers.decompile_jars`/`decompile_dlls`) before the extractors get constructed.
+        # Every file that made it gets marked, and its extractor skips the decompiler (`_consume_predecompiled`).
+        pass
+
+    @staticmethod
+    def _predecompiled_dir(file: FilePath, outdir: FilePath = "data") -> FilePath:
+        # Same folder the decompiling extractors use as `_extract_dir`.
+        return os.path.join(outdir, "extract", os.path.splitext(os.path.split(file)[1])[0])
+
+    @staticmethod
+    def _mark_predecompiled(file: FilePath, extract_dir: FilePath) -> None:
+        stat = os.stat(file)
+        with open(os.path.join(extract_dir, PREDECOMPILED_MARKER), "w") as f:
+            f.write(f"{stat.st_size}:{stat.st_mtime_ns}")
+
+    def _consume_predecompiled(self) -> bool:
+        # The marker holds the size/mtime of the file it was made from, so a stale one never matches.
+        marker = os.path.join(self._extract_dir, PREDECOMPILED_MARKER)
+        if not os.path.isfile(marker):
+            return False
+        with open(marker) as f:
+            source = f.read()
+        os.remove(marker)
+        stat = os.stat(self._file)
+        return source == f"{stat.st_size}:{stat.st_mtime_ns}"
+
     def _extract_images(self) -> None:
         copy_images_recursively(self._extract_dir, self._image_dir)
 
@@ -166,17 +267,61 @@ class ExtractorBase(ABC):
         self._dataset_explicit = True
 
     @classmethod
-    def sample_random(cls, n: int = 1) -> List[ExtractorBase.LabeledDataEntry]:
-        extractor_index = [find_partition(ExtractorBase.partitions, x)-1 for x in random.sample(range(ExtractorBase.total_size), n)]
-        return [list(ExtractorBase.registered_extractors.values())[i_].__sample_internal() for i_ in extractor_index]
+    def get_sampler(cls, weights: dict[str, float] | None = None, balanced: bool = False, seed: int | None = None) -> DatasetSampler:
+        # `weights` maps extractor ids to a per-image weight; missing ids default to 1.
+        ExtractorBase.sampler_weights, ExtractorBase.sampler_balanced = weights, balanced
+        extractors = list(ExtractorBase.registered_extractors.keys())
+        weights = None if weights is None else [weights.get(id_, 1.0) for id_ in extractors]
+        ExtractorBase.sampler = DatasetSampler(ExtractorBase.__sizes(), weights=weights, balanced=balanced, seed=seed)
+        return ExtractorBase.sampler
+
+    @classmethod
+    def sample_random(cls, n: int = 1, replace: bool = False) -> List[ExtractorBase.LabeledDataEntry]:
+        sampler = ExtractorBase.sampler
+        if sampler is None or sampler.total_size != ExtractorBase.total_size or len(sampler.sizes) != len(ExtractorBase.registered_extractors):
+            sampler = cls.get_sampler(ExtractorBase.sampler_weights, ExtractorBase.sampler_balanced)
+        return cls.lookup(sampler.sample(n, replace=replace))
+
+    @classmethod
+    def lookup(cls, ids) -> List[ExtractorBase.LabeledDataEntry]:
+        # Global image ids (see `partitions`) -> entries.
+        ids = np.asarray(ids, dtype=np.int64)
+        partitions = np.asarray(ExtractorBase.partitions)
+        extractor_index = np.searchsorted(partitions, ids, side='right') - 1
+        local_index = ids - partitions[extractor_index]
+
+        extractors = list(ExtractorBase.registered_extractors.values())
+        return [extractors[e].__image_dataset_impl[int(i)] for e, i in zip(extractor_index, local_index)]
+
+    @staticmethod
+    def __sizes() -> list[int]:
+        return [len(extractor) for extractor in ExtractorBase.registered_extractors.values()]
+
+    @property
+    def index(self) -> ImageIndex | None:
+        if self.__image_dataset_impl is None:
+            return None
+        return self.__image_dataset_impl.index
+
+    @classmethod
+    def dataset_index(cls) -> ImageIndex:
+        # Extractor i of the result is the i-th registered extractor, so ids line up with `partitions`.
+        return ImageIndex.concatenate([extractor.index for extractor in ExtractorBase.registered_extractors.values()])
 
-    def __sample_internal(self) -> ExtractorBase.LabeledDataEntry:
-        return random.choice(self.dataset)
+    @classmethod
+    def manifest(cls, weights: dict[str, float] | None = None, balanced: bool | None = None) -> DatasetManifest:
+        # Freezes the registered extractors into a `DatasetManifest`; sampling and loading from it (or from its saved
+        # copy, in any process) doesn't need any of the class state above anymore. Without `weights`/`balanced`, the
+        # ones given to `get_sampler` (i.e. what `sample_random` draws with) are used.
+        weights = ExtractorBase.sampler_weights if weights is None else weights
+        balanced = ExtractorBase.sampler_balanced if balanced is None else balanced
+        return DatasetManifest.build(cls.dataset_index(), weights, balanced)
 
     def __repr__(self):
         return self._file
 
     @classmethod
     def __warn_json(cls):
-        if cls.JSON_WARNED: return
+        if ExtractorBase.JSON_WARNED: return
+        ExtractorBase.JSON_WARNED = True
         warnings.warn(f"Could not find corresponding .json file for image file. This warning will only play once to not spam, but be wary. Either the .json isn't implemented or something went wrong!")
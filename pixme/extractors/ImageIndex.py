@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+from PIL import Image
+from pydantic import FilePath
+from typing import List
+
+import json
+import os
+import numpy as np
+
+from ..utils.image import is_image_file
+
+RECORD_DTYPE = np.dtype([
+    ('extractor', '<u4'),
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('nbytes', '<u8'),
+    ('mtime', '<i8'),
+    ('name_start', '<u8'),
+    ('name_end', '<u8'),
+    ('meta_start', '<u8'),
+    ('meta_end', '<u8'),
+])
+
+class ImageIndex:
+    # On-disk layout of an index folder:
+    #   * records.npy  -> one fixed-size record (RECORD_DTYPE) per image, so any id is an O(1) lookup.
+    #   * names.npy    -> utf-8 file names of every image, back to back (sliced by `name_start`/`name_end`).
+    #   * metadata.npy -> utf-8 json of every image, back to back (sliced by `meta_start`/`meta_end`).
+    #   * index.json   -> the extractor ids and image folders (relative to the index folder) + staleness info.
+    # Everything is loaded memory-mapped, so even the whole-dataset index opens in milliseconds.
+
+    def __init__(self, records: np.ndarray, names: np.ndarray, metadata: np.ndarray, extractors: List[str], directories: List[FilePath], sources: dict | None = None):
+        self.records = records
+        self.names = names
+        self.metadata_blob = metadata
+        self.extractors = extractors
+        self.directories = directories
+        self.sources = {} if sources is None else sources
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return np.bincount(self.records['extractor'], minlength=len(self.extractors))
+
+    @property
+    def partitions(self) -> np.ndarray:
+        return np.concatenate([[0], np.cumsum(self.sizes)])
+
+    def name(self, i: int) -> str:
+        record = self.records[i]
+        return bytes(self.names[record['name_start']:record['name_end']]).decode('utf-8')
+
+    def path(self, i: int) -> FilePath:
+        return os.path.join(self.directories[self.records[i]['extractor']], self.name(i))
+
+    def metadata(self, i: int) -> dict:
+        record = self.records[i]
+        if record['meta_start'] == record['meta_end']:
+            return {}
+        return json.loads(bytes(self.metadata_blob[record['meta_start']:record['meta_end']]).decode('utf-8'))
+
+    def has_metadata(self) -> np.ndarray:
+        return self.records['meta_end'] > self.records['meta_start']
+
+    # ===========================================================================
+    #                               BUILDING
+    # ===========================================================================
+
+    @classmethod
+    def build(cls, extractor: str, image_dir: FilePath, json_dir: FilePath | None = None, previous: ImageIndex | None = None) -> ImageIndex:
+        # Files whose size and mtime didn't change keep their old record, so only new images get their header read.
+        known = {}
+        if previous is not None:
+            for i in range(len(previous)):
+                known[previous.name(i)] = i
+
+        records = []
+        names, metadata = bytearray(), bytearray()
+        for file in sorted(os.listdir(image_dir)):
+            if not is_image_file(file):
+                continue
+            image_file = os.path.join(image_dir, file)
+            stat = os.stat(image_file)
+
+            i = known.get(file)
+            if i is not None and previous.records[i]['nbytes'] == stat.st_size and previous.records[i]['mtime'] == stat.st_mtime_ns:
+                width, height = int(previous.records[i]['width']), int(previous.records[i]['height'])
+            else:
+                width, height = cls.__read_dimensions(image_file)
+
+            image_json = b''
+            json_file = None if json_dir is None else os.path.join(json_dir, os.path.splitext(file)[0] + ".json")
+            if json_file is not None and os.path.isfile(json_file):
+                with open(json_file, 'rb') as f:
+                    image_json = json.dumps(json.load(f)).encode('utf-8')
+
+            encoded = file.encode('utf-8')
+            records.append((0, width, height, stat.st_size, stat.st_mtime_ns,
+                            len(names), len(names) + len(encoded), len(metadata), len(metadata) + len(image_json)))
+            names += encoded
+            metadata += image_json
+
+        return cls(
+            np.array(records, dtype=RECORD_DTYPE),
+            np.frombuffer(bytes(names), dtype=np.uint8),
+            np.frombuffer(bytes(metadata), dtype=np.uint8),
+            [extractor],
+            [image_dir],
+            cls.__source_info(image_dir, json_dir),
+        )
+
+    @classmethod
+    def load_or_build(cls, path: FilePath, extractor: str, image_dir: FilePath, json_dir: FilePath | None = None, force: bool = False) -> ImageIndex:
+        # Not memory-mapped, since the files get overwritten right after (which Windows refuses for mapped files).
+        previous = cls.load(path, mmap=False) if os.path.isdir(path) else None
+        if not force and previous is not None and previous.sources == cls.__source_info(image_dir, json_dir) and previous.__unchanged(image_dir):
+            return previous
+
+        index = cls.build(extractor, image_dir, json_dir, previous=previous)
+        index.save(path)
+        return index
+
+    @classmethod
+    def concatenate(cls, indices: List[ImageIndex]) -> ImageIndex:
+        records = []
+        names_offset, meta_offset, extractor_offset = 0, 0, 0
+        for index in indices:
+            shifted = np.array(index.records, dtype=RECORD_DTYPE)
+            shifted['extractor'] += extractor_offset
+            shifted['name_start'] += names_offset
+            shifted['name_end'] += names_offset
+            shifted['meta_start'] += meta_offset
+            shifted['meta_end'] += meta_offset
+            records.append(shifted)
+
+            names_offset += len(index.names)
+            meta_offset += len(index.metadata_blob)
+            extractor_offset += len(index.extractors)
+
+        return cls(
+            np.concatenate(records) if records else np.zeros(0, dtype=RECORD_DTYPE),
+            np.concatenate([index.names for index in indices]) if indices else np.zeros(0, dtype=np.uint8),
+            np.concatenate([index.metadata_blob for index in indices]) if indices else np.zeros(0, dtype=np.uint8),
+            [extractor for index in indices for extractor in index.extractors],
+            [directory for index in indices for directory in index.directories],
+        )
+
+    @staticmethod
+    def __read_dimensions(image_file: FilePath) -> tuple[int, int]:
+        # Only reads the header; the pixel data is never decoded here.
+        try:
+            with Image.open(image_file) as image:
+                return image.size
+        except OSError:
+            return 0, 0
+
+    def __unchanged(self, image_dir: FilePath) -> bool:
+        # Overwriting an image in place doesn't touch the folder's mtime, so every file's size and mtime is checked too.
+        files = {}
+        with os.scandir(image_dir) as entries:
+            for entry in entries:
+                if is_image_file(entry.name):
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        if len(files) != len(self):
+            return False
+        return all(files.get(self.name(i)) == (int(record['nbytes']), int(record['mtime'])) for i, record in enumerate(self.records))
+
+    @staticmethod
+    def __source_info(image_dir: FilePath, json_dir: FilePath | None) -> dict:
+        info = {"image_dir_mtime": os.stat(image_dir).st_mtime_ns}
+        if json_dir is not None and os.path.isdir(json_dir):
+            info["json_dir_mtime"] = os.stat(json_dir).st_mtime_ns
+        return info
+
+    # ===========================================================================
+    #                               SAVING/LOADING
+    # ===========================================================================
+
+    def save(self, path: FilePath) -> None:
+        os.makedirs(path, exist_ok=True)
+        header_file = os.path.join(path, "index.json")
+        if os.path.exists(header_file):
+            os.remove(header_file)
+        np.save(os.path.join(path, "records.npy"), np.asarray(self.records, dtype=RECORD_DTYPE))
+        np.save(os.path.join(path, "names.npy"), np.asarray(self.names, dtype=np.uint8))
+        np.save(os.path.join(path, "metadata.npy"), np.asarray(self.metadata_blob, dtype=np.uint8))
+        # index.json goes last; `load` treats a folder without it as missing.
+        with open(header_file, "w") as f:
+            json.dump({
+                "extractors": self.extractors,
+                "directories": [os.path.relpath(directory, path) for directory in self.directories],
+                "sources": self.sources,
+            }, f)
+
+    @classmethod
+    def load(cls, path: FilePath, mmap: bool = True) -> ImageIndex | None:
+        header_file = os.path.join(path, "index.json")
+        if not os.path.isfile(header_file):
+            return None
+        with open(header_file) as f:
+            header = json.load(f)
+
+        try:
+            records = cls.__load_array(os.path.join(path, "records.npy"), mmap)
+            names = cls.__load_array(os.path.join(path, "names.npy"), mmap)
+            metadata = cls.__load_array(os.path.join(path, "metadata.npy"), mmap)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        return cls(
+            records, names, metadata,
+            header["extractors"],
+            [os.path.normpath(os.path.join(path, directory)) for directory in header["directories"]],
+            header.get("sources", {}),
+        )
+
+    @staticmethod
+    def __load_array(file: FilePath, mmap: bool) -> np.ndarray:
+        if not mmap:
+            return np.load(file)
+        try:
+            return np.load(file, mmap_mode='r')
+        except ValueError:
+            return np.load(file)  # Empty arrays can't be memory-mapped.
@@ -1,7 +1,15 @@
 from .ExtractorBase import ExtractorBase
 from ..wrappers.minecraft import *
+from ..utils.image import extract_images_from_archive
+from typing import List
 
 class MinecraftExtractor(ExtractorBase):
+    TOOLS = ('vineflower',)
+    # Textures sit in the jar's `assets/` tree, so they're read straight out of it by default. Turn this on
+    # when the decompiled sources are needed as well (phase II `_extract_json`).
+    DECOMPILE_SOURCES: bool = False
+    N_STREAM_WORKERS: int = 1
+
     def __init__(self, file: FilePath = "minecraft", outdir: FilePath = "data"):
         super().__init__(file, outdir)
 
@@ -22,7 +30,41 @@ class MinecraftExtractor(ExtractorBase):
         decompile_minecraft('latest', self._extract_dir)
 
     def __extract_minecraft_mod(self):
-        decompile_jar(self._file, self._extract_dir)
+        if self.DECOMPILE_SOURCES:
+            if not self._consume_predecompiled():
+                decompile_jar(self._file, self._extract_dir)
+            return
+        extract_images_from_archive(self._file, self._image_dir, prefix='assets/', n_workers=self.N_STREAM_WORKERS)
+
+    def _extract_images(self) -> None:
+        if self._file != 'minecraft' and not self.DECOMPILE_SOURCES:
+            return  # Already streamed into the image folder.
+        super()._extract_images()
+
+    @classmethod
+    def predecompile(cls, files: List[FilePath], outdir: FilePath = "data", n_workers: int = 1) -> None:
+        # All the mod jars go through a single Vineflower JVM (per batch) instead of one JVM each.
+        if not cls.DECOMPILE_SOURCES:
+            return
+        jars = {}
+        for file in files:
+            if file == 'minecraft' or cls.is_cached(file, outdir):
+                continue
+            jars[file] = cls._predecompiled_dir(file, outdir)
+            os.makedirs(jars[file], exist_ok=True)
+        for jar, success in decompile_jars(jars).items():
+            if success:
+                cls._mark_predecompiled(jar, jars[jar])
+
+    @classmethod
+    def _cache_signature(cls, file: FilePath) -> dict | None:
+        signature = super()._cache_signature(file)
+        if signature is None:
+            return None
+        signature["decompile_sources"] = cls.DECOMPILE_SOURCES
+        if not cls.DECOMPILE_SOURCES:
+            signature["tools"] = {}  # Vineflower never runs, so its version doesn't matter.
+        return signature
 
     def _extract_json(self) -> None:
         # This is not implemented yet; this is for phase II when I'm training
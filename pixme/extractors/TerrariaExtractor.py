@@ -1,9 +1,9 @@
 import os
-import shutil
-from typing import Dict, Literal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Literal
 from pydantic import FilePath
 
-from ..utils.path import generate_temporary_folder_name, get_file_from_extension, copy_entity
+from ..utils.path import get_file_from_extension, LinkStrategy
 from ..wrappers.terraria import *
 
 from .ExtractorBase import ExtractorBase
@@ -11,6 +11,12 @@ from .ExtractorBase import ExtractorBase
 TERRARIA_FOLDER = r'C:\Program Files (x86)\Steam\steamapps\common\Terraria'
 
 class TerrariaExtractor(ExtractorBase):
+    TOOLS = ('tml_patcher', 'ilspycmd')
+    LINK_STRATEGY: LinkStrategy = 'auto'  # How the .xnb files get materialized in TerrariaXNB2PNG's scratch folders.
+    NATIVE_XNB: bool = True  # Decodes the .xnb textures in Python (`decode_xnbs`) instead of going through TerrariaXNB2PNG.
+    N_XNB_WORKERS: int | None = None  # Workers used for the .xnb conversion; None means one per core.
+    XNB_CACHE: bool = True  # Keeps the converted pngs in `<outdir>/cache/xnb`, so a refresh only converts what a patch changed.
+
     def __init__(self, file: FilePath = "terraria", outdir: FilePath = "data"):
         super().__init__(file, outdir)
 
@@ -19,6 +25,7 @@ class TerrariaExtractor(ExtractorBase):
         self._image_dir = os.path.join(self._image_dir, _raw_filename)
         self._json_dir = os.path.join(self._json_dir, _raw_filename)
         self._extract_dir = os.path.join(self._extract_dir, _raw_filename)
+        self._xnb_cache_dir = os.path.join(outdir, "cache", "xnb")
         self._make_important_directories()
 
     def _extract_files(self):
@@ -34,29 +41,51 @@ class TerrariaExtractor(ExtractorBase):
         pass
 
     def __extract_terraria(self):
-        paths = self.__copy_terraria()
+        # Neither converter writes into `Content`, so the exe and `Content` are both read straight from the install.
+        paths = self.__locate_terraria()
         decompile_dll(paths["exec"], self._extract_dir)
-        decompile_xnbs(paths["content"], self._extract_dir)
-        shutil.rmtree(os.path.dirname(paths["content"]))  # Remove temp folder
+        cache_dir = self._xnb_cache_dir if self.XNB_CACHE else None
+        if self.NATIVE_XNB:
+            decode_xnbs(paths["content"], self._extract_dir, n_workers=self.N_XNB_WORKERS, cache_dir=cache_dir)
+        else:
+            decompile_xnbs(paths["content"], self._extract_dir, n_workers=self.N_XNB_WORKERS, cache_dir=cache_dir, strategy=self.LINK_STRATEGY)
 
     @staticmethod
-    def __copy_terraria() -> Dict[Literal["exec", "content"], FilePath]:
+    def __locate_terraria() -> Dict[Literal["exec", "content"], FilePath]:
         exec_path = os.path.join(TERRARIA_FOLDER, 'Terraria.exe')
         cont_path = os.path.join(TERRARIA_FOLDER, 'Content')
         if not os.path.exists(exec_path) or not os.path.exists(cont_path):
             raise FileNotFoundError("Please change submodule value `extractors.TerrariaExtractor.TERRARIA_FOLDER` to the folder with the `Terraria.exe` file and the `Content` folder.")
-        temp_folder = generate_temporary_folder_name()
-        os.makedirs(temp_folder, exist_ok=True)
+        return {"exec": exec_path, "content": cont_path}
+
+    @classmethod
+    def predecompile(cls, files: List[FilePath], outdir: FilePath = "data", n_workers: int = 1) -> None:
+        # TML.Patcher only takes one .tmod at a time, but every mod's dll then goes through a single ilspycmd run.
+        tmods = {}
+        for file in files:
+            if file == 'terraria' or cls.is_cached(file, outdir):
+                continue
+            tmods[file] = cls._predecompiled_dir(file, outdir)
+            os.makedirs(tmods[file], exist_ok=True)
 
-        copy_entity(exec_path, temp_folder)
-        copy_entity(cont_path, temp_folder)
+        with ThreadPoolExecutor(max_workers=max(1, n_workers)) as pool:
+            unpacked = dict(zip(tmods, pool.map(lambda tmod: decompile_tmod(tmod, tmods[tmod]), tmods)))
+        dlls = {}
+        for tmod, success in unpacked.items():
+            try:
+                if success:
+                    dlls[get_file_from_extension(tmods[tmod], '.dll')] = tmod
+            except FileNotFoundError:
+                continue  # Let the extractor itself fail on it, with the usual warning.
 
-        return {
-            "exec": os.path.join(temp_folder, 'Terraria.exe'),
-            "content": os.path.join(temp_folder, 'Content')
-        }
+        results = decompile_dlls({dll: tmods[tmod] for dll, tmod in dlls.items()})
+        for dll, success in results.items():
+            if success:
+                cls._mark_predecompiled(dlls[dll], tmods[dlls[dll]])
 
     def __extract_tmod(self):
+        if self._consume_predecompiled():
+            return
         decompile_tmod(self._file, self._extract_dir)
         dll = get_file_from_extension(self._extract_dir, '.dll')
         decompile_dll(dll, self._extract_dir)
@@ -4,8 +4,12 @@ import os
 from pydantic import FilePath
 
 from .ExtractorBase import ExtractorBase
+from ..utils.image import extract_images_from_archive
 
 class ZipExtractor(ExtractorBase):
+    STREAM_EXTRACTION: bool = True  # Writes only the .png members straight into the image folder.
+    N_STREAM_WORKERS: int = 1
+
     def __init__(self, file: FilePath = None, outdir: FilePath = "data"):
         super().__init__(file, outdir)
 
@@ -17,9 +21,17 @@ class ZipExtractor(ExtractorBase):
         self._make_important_directories()
 
     def _extract_files(self) -> None:
+        if self.STREAM_EXTRACTION:
+            extract_images_from_archive(self._file, self._image_dir, n_workers=self.N_STREAM_WORKERS)
+            return
         with zipfile.ZipFile(self._file, 'r') as zf:
             zf.extractall(self._extract_dir)
 
+    def _extract_images(self) -> None:
+        if self.STREAM_EXTRACTION:
+            return  # Already done while streaming.
+        super()._extract_images()
+
     def _extract_json(self) -> None:
         # This is not implemented yet; this is for phase II when I'm training
         # a transformer on a diffusion basis. I will have a lot of data, such as
@@ -1,13 +1,17 @@
 import os
-import warnings
 
 from .MinecraftExtractor import MinecraftExtractor
 from .TerrariaExtractor import TerrariaExtractor
 from .PreexistingExtractor import PreexistingExtractor
 from .ZipExtractor import ZipExtractor
 from .NullExtractor import NullExtractor
+from .ExtractionScheduler import ExtractionScheduler
+from .ImageIndex import ImageIndex
+from .DatasetSampler import DatasetSampler
+from .DatasetManifest import DatasetManifest
 
 from .ExtractorBase import ExtractorBase
+from ..wrappers.limits import Tools
 from pydantic import FilePath
 from typing import List, Type
 
@@ -21,17 +25,22 @@ def convert_preexisting(folder: FilePath = "data/image") -> List[Type[ExtractorB
         extractors.append(PreexistingExtractor(path, outdir=os.path.dirname(folder)))
     return extractors
 
-def convert_executables(folder: FilePath, outdir: FilePath = "data") -> List[Type[ExtractorBase]]:
-    extractors = []
-    for file in os.listdir(folder):
-        try:
-            file = os.path.join(folder, file)
-            if file.endswith(".jar"):
-                extractors.append(MinecraftExtractor(file, outdir=outdir))
-            elif file.endswith(".tmod"):
-                extractors.append(TerrariaExtractor(file, outdir=outdir))
-            elif file.endswith(".zip"):
-                extractors.append(ZipExtractor(file, outdir=outdir))
-        except:
-            warnings.warn(f'Could not extract `{file}...`')
-    return extractors
+def convert_executables(folder: FilePath, outdir: FilePath = "data", n_workers: int = 1, tool_limits: dict[Tools, int] | None = None, batch_decompile: bool = True) -> List[Type[ExtractorBase]]:
+    # n_workers > 1 extracts in a process pool; the extractors are still registered in a deterministic order.
+    # batch_decompile runs the external decompilers once for all the files of a kind, before extracting.
+    return ExtractionScheduler(outdir, n_workers=n_workers, tool_limits=tool_limits, batch_decompile=batch_decompile).run(folder)
+
+def save_dataset_index(outdir: FilePath = "data") -> ImageIndex:
+    # Merges the per-extractor indices (no filesystem scan), in registration order.
+    index = ExtractorBase.dataset_index()
+    index.save(os.path.join(outdir, "index", "dataset"))
+    return index
+
+def load_dataset_index(outdir: FilePath = "data") -> ImageIndex | None:
+    return ImageIndex.load(os.path.join(outdir, "index", "dataset"))
+
+def save_dataset_manifest(outdir: FilePath = "data", weights: dict[str, float] | None = None, balanced: bool = False) -> DatasetManifest:
+    return ExtractorBase.manifest(weights, balanced).save(os.path.join(outdir, "index", "manifest"))
+
+def load_dataset_manifest(outdir: FilePath = "data") -> DatasetManifest | None:
+    return DatasetManifest.load(os.path.join(outdir, "index", "manifest"))
@@ -6,6 +6,9 @@ from scipy.stats import mode
 import random
 
 from pydantic import FilePath
+from typing import Literal
+
+from .TilingCache import Tiling, TilingCache
 
 CUTOFF_PERCENTILE = 95
 TILE_CUTOFF = 0.07
@@ -13,17 +16,35 @@ MIN_TILE_SIZE = 16
 MAX_TILE_SIZE = 256
 KERNEL = np.ones((64, 64)) / (64*64)
 EPS = 1e-8
-
-def pad_to_power_of_two_square(arr: np.ndarray, random_pad: bool = True) -> np.ndarray | None:
-
-    empty_images = np.sum(arr, axis=(1, 2, 3)) == 0
-    arr = np.delete(arr, empty_images, axis=0)
-    empty_x = np.sum(arr, axis=(0, 1, 3)) == 0
-    arr = np.delete(arr, empty_x, axis=2)
-    empty_y = np.sum(arr, axis=(0, 2, 3)) == 0
-    arr = np.delete(arr, empty_y, axis=1)
-
-    _, h, w = arr.shape[:3]
+# `convolve` is the dense KERNEL convolution, `sat` gets the exact same mask from summed-area tables.
+MaskMode = Literal['convolve', 'sat']
+# `blue` picks the period from the blue spectrum alone, like the detector always has; `rgb` sums all three (opt-in).
+Spectrum = Literal['blue', 'rgb']
+PERIODIC_BATCH_SIZE = 64  # Images per FFT call in `detect_periodic`; bounds the memory of the complex spectra.
+
+def tile_view(image: np.ndarray, t_y: int, t_x: int) -> np.ndarray:
+    # (H, W, 4) -> (t_y, t_x, H // t_y, W // t_x, 4), as a view of `image`.
+    h, w, _ = image.shape
+    n_w, n_h = w // t_x, h // t_y
+    return image.reshape(t_y, n_h, t_x, n_w, 4).transpose(0, 2, 1, 3, 4)
+
+def split_tiles(image: np.ndarray, t_y: int, t_x: int) -> np.ndarray:
+    # (H, W, 4) -> (t_y * t_x, H // t_y, W // t_x, 4)
+    view = tile_view(image, t_y, t_x)
+    return view.reshape(t_y*t_x, *view.shape[2:])
+
+def content_bbox(tiles: np.ndarray) -> tuple[int, int, int, int]:
+    # (y0, y1, x0, x1) of everything that isn't fully empty, across all the tiles.
+    rows = np.flatnonzero(np.any(tiles, axis=(0, 2, 3)))
+    cols = np.flatnonzero(np.any(tiles, axis=(0, 1, 3)))
+    if not rows.size:
+        return 0, 0, 0, 0
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+def square_placement(h: int, w: int, random_pad: bool = True) -> tuple[int, int, int, int, int, int, int]:
+    # Where an h x w (content) tile ends up in its power of two square:
+    # (size, off_y, off_x, crop_h, crop_w, pad_y, pad_x) -> tile[off_y:off_y+crop_h, off_x:off_x+crop_w]
+    # is pasted at [pad_y:pad_y+crop_h, pad_x:pad_x+crop_w] of a zeroed size x size square.
 
     # Step 1: Crop if too big
     off_x, off_y = 0, 0
@@ -31,9 +52,7 @@ def pad_to_power_of_two_square(arr: np.ndarray, random_pad: bool = True) -> np.n
         off_y = random.randint(0, h - MAX_TILE_SIZE - 1)
     if random_pad and w > MAX_TILE_SIZE:
         off_x = random.randint(0, w - MAX_TILE_SIZE - 1)
-
-    cropped = arr[:, off_y:min(h, MAX_TILE_SIZE)+off_y, off_x:min(w, MAX_TILE_SIZE)+off_x]
-    _, h, w = cropped.shape[:3]
+    h, w = min(h, MAX_TILE_SIZE), min(w, MAX_TILE_SIZE)
 
     # Step 2: Find next power of two for both dimensions (not exceeding max_size)
     target_size = 2 ** int(np.ceil(np.log2(max(h, w))))
@@ -49,22 +68,46 @@ def pad_to_power_of_two_square(arr: np.ndarray, random_pad: bool = True) -> np.n
     if random_pad and pad_height:
         pad_y = random.randint(0, pad_height - 1)
 
-    if arr.ndim == 2:
-        padded = np.pad(cropped, ((pad_y, pad_height-pad_y), (pad_x, pad_width-pad_x)), mode='constant')
-    elif arr.ndim == 3:
-        # 1 image
-        padded = np.pad(cropped, ((pad_y, pad_height-pad_y), (pad_x, pad_width-pad_x), (0, 0)), mode='constant')
-    else:
-        # array of images
-        padded = np.pad(cropped, ((0, 0), (pad_y, pad_height-pad_y), (pad_x, pad_width-pad_x), (0, 0)), mode='constant')
-
+    return target_size, off_y, off_x, h, w, pad_y, pad_x
+
+def remove_empty_lines(tiles: np.ndarray) -> np.ndarray:
+    # Drops every row and column that is empty in all the (n, h, w, 4) tiles, interior ones included.
+    # Returns `tiles` itself when there are none (the usual case), a copy otherwise.
+    occupied = np.any(tiles, axis=-1)
+    rows, cols = occupied.any(axis=(0, 2)), occupied.any(axis=(0, 1))
+    if not rows.all():
+        tiles = tiles[:, rows]
+    if not cols.all():
+        tiles = tiles[:, :, cols]
+    return tiles
+
+def pad_to_power_of_two_square(arr: np.ndarray, random_pad: bool = True, bbox: tuple[int, int, int, int] | None = None) -> np.ndarray | None:
+    # `bbox` (see `Tiling.bbox`) only saves looking at the empty border; the empty rows/columns inside it go too.
+    arr = arr[np.any(arr, axis=(1, 2, 3))]
+    if bbox is not None:
+        y0, y1, x0, x1 = bbox
+        arr = arr[:, y0:y1, x0:x1]
+    arr = remove_empty_lines(arr)
+
+    size, off_y, off_x, h, w, pad_y, pad_x = square_placement(arr.shape[1], arr.shape[2], random_pad)
+    padded = np.zeros((len(arr), size, size, 4), dtype=arr.dtype)
+    padded[:, pad_y:pad_y+h, pad_x:pad_x+w] = arr[:, off_y:off_y+h, off_x:off_x+w]
     return padded
 
 class ImageData:
-    def __init__(self, file: FilePath, data: dict = None):
+    MASK_MODE: MaskMode = 'sat'
+    SPECTRUM: Spectrum = 'blue'
+
+    def __init__(self, file: FilePath, data: dict = None, mask_mode: MaskMode | None = None, tiling_cache: TilingCache | None = None,
+                 spectrum: Spectrum | None = None):
+        self.file = file
         self.image_file = Image.open(file).convert('RGBA')
+        self.tiling_cache = tiling_cache
+        self._tiling: Tiling | None = None
         self._image = None
         self._grayscale = None
+        self.mask_mode = self.MASK_MODE if mask_mode is None else mask_mode
+        self.spectrum = self.SPECTRUM if spectrum is None else spectrum
         self.data = data
         if data is None:
             self.data = {}
@@ -81,16 +124,39 @@ class ImageData:
             self._grayscale = np.array(self.image_file.convert("L"))
         return self._grayscale
 
-    def create_tiles(self):
+    def create_tiles(self, random_pad: bool = True):
+        tiling = self.tiling
+        return pad_to_power_of_two_square(split_tiles(self.image, tiling.t_y, tiling.t_x), random_pad, bbox=tiling.bbox)
+
+    def tile_view(self, tiling: Tiling | None = None) -> np.ndarray:
+        # The (t_y, t_x, tile_h, tile_w, 4) tiles, without copying anything (see `BucketBuffers.add`).
+        tiling = self.tiling if tiling is None else tiling
+        return tile_view(self.image, tiling.t_y, tiling.t_x)
+
+    @property
+    def tiling(self) -> Tiling:
+        # Analyzed (or looked up) once per instance.
+        if self._tiling is not None:
+            return self._tiling
+        if self.tiling_cache is None:
+            self._tiling = self.analyze_tiling()
+            return self._tiling
+        key = self.tiling_cache.key(self.file, self.spectrum)
+        tiling = self.tiling_cache.get(key)
+        if tiling is None:
+            tiling = self.analyze_tiling()
+            self.tiling_cache.put(key, tiling)
+        self._tiling = tiling
+        return tiling
+
+    def analyze_tiling(self) -> Tiling:
         h, w, _ = self.image.shape
         t_y, t_x = self._detect_periodic()
 
         t_x = self.__round_tiling(w, t_x)
         t_y = self.__round_tiling(h, t_y)
 
-        n_w, n_h = w // t_x, h // t_y
-
-        return pad_to_power_of_two_square(self.image.reshape(t_y, n_h, t_x, n_w, 4).transpose(0, 2, 1, 3, 4).reshape(t_y*t_x, n_h, n_w, 4))
+        return Tiling(t_y, t_x, content_bbox(split_tiles(self.image, t_y, t_x)))
 
     @staticmethod
     def __round_tiling(s: int, t: int):
@@ -113,51 +179,80 @@ class ImageData:
 
         return 1
 
-    @staticmethod
-    def __vertical_channel_fft(c_data: np.ndarray) -> np.ndarray:
-        return np.fft.fft(c_data, axis=0)
-
-    @staticmethod
-    def __horizontal_channel_fft(c_data: np.ndarray) -> np.ndarray:
-        return np.fft.fft(c_data, axis=1)
-
-    @staticmethod
-    def __reduce_parallel_fft(fft_data: np.ndarray, axis: int) -> np.ndarray:
-        return np.sum(np.abs(fft_data), axis=axis)
-
-    @staticmethod
-    def __extract_dominant_frequency(fft_data: np.ndarray, fft_freqs: np.ndarray) -> int:
-        spectra = np.abs(fft_data)
-        spectra[spectra < np.percentile(spectra, CUTOFF_PERCENTILE)] = 0.0
-        freqs = np.diff(np.sort(fft_freqs[find_peaks(spectra)[0]]))
-        freqs = freqs[freqs >= MIN_TILE_SIZE // 4]
-        if freqs.size:
-            return mode(freqs).mode
-        return fft_freqs[np.argmax(spectra)]
-
     def _detect_periodic(self):
-        pixel_mask = convolve(self.image[:, :, 3], KERNEL, mode='nearest').astype(bool).astype(float)  # alpha mask
-
-        v_freqs = np.fft.fftfreq(pixel_mask.shape[0], 1.0 / pixel_mask.shape[0])
-        h_freqs = np.fft.fftfreq(pixel_mask.shape[1], 1.0 / pixel_mask.shape[1])
-        v_tot = None
-        h_tot = None
-
-        for channel in [self.image[:, :, 0], self.image[:, :, 1], self.image[:, :, 2]]:
-            pixel_img = channel * pixel_mask / 255
-
-            v_fft = self.__vertical_channel_fft(pixel_img)
-            v_fmask = self.__vertical_channel_fft(pixel_mask)
-            v_fnorm = v_fft / (v_fmask + EPS)
-            v_trans = self.__reduce_parallel_fft(v_fnorm, axis=1)
-            if v_tot is None: v_tot = v_trans
-            else: v_tot += v_trans
-
-            h_fft = self.__horizontal_channel_fft(pixel_img)
-            h_fmask = self.__horizontal_channel_fft(pixel_mask)
-            h_fnorm = h_fft / (h_fmask + EPS)
-            h_trans = self.__reduce_parallel_fft(h_fnorm, axis=0)
-            if h_tot is None: h_tot = h_trans
-            else: h_tot += h_trans
-
-        return self.__extract_dominant_frequency(v_trans, v_freqs), self.__extract_dominant_frequency(h_trans, h_freqs)
+        t_y, t_x = detect_periodic(self.image[None], mask_mode=self.mask_mode, spectrum=self.spectrum)[0]
+        return t_y, t_x
+
+def detect_periodic(images: np.ndarray | list[np.ndarray], batch_size: int = PERIODIC_BATCH_SIZE, mask_mode: MaskMode = 'sat',
+                    spectrum: Spectrum = 'blue') -> np.ndarray:
+    # (t_y, t_x) of every RGBA image, as an (N, 2) array. A stack (N, H, W, 4) goes through the FFTs in chunks of
+    # `batch_size`; a list of differently sized images is grouped by shape first.
+    if isinstance(images, np.ndarray):
+        if not len(images):
+            return np.zeros((0, 2))
+        return np.concatenate([_detect_periodic_stack(images[i:i + batch_size], mask_mode, spectrum) for i in range(0, len(images), batch_size)])
+
+    periods = np.zeros((len(images), 2))
+    groups: dict[tuple, list[int]] = {}
+    for i, image in enumerate(images):
+        groups.setdefault(image.shape, []).append(i)
+    for indices in groups.values():
+        periods[indices] = detect_periodic(np.stack([images[i] for i in indices]), batch_size, mask_mode, spectrum)
+    return periods
+
+def alpha_mask(alpha: np.ndarray, mode: MaskMode = 'sat') -> np.ndarray:
+    # 1 wherever the KERNEL average of the alpha channel is at least 1, for an (H, W) alpha channel or an (N, H, W) stack.
+    if mode == 'convolve':
+        kernel = KERNEL if alpha.ndim == 2 else KERNEL.reshape((1,) * (alpha.ndim - 2) + KERNEL.shape)
+        return convolve(alpha, kernel, mode='nearest').astype(bool).astype(float)
+    if mode != 'sat':
+        raise ValueError(f"Unknown mask mode `{mode}`.")
+
+    # Same as the uint8 `convolve`: a pixel survives iff its window sum (`nearest` edges) is at least KERNEL.size.
+    k_y, k_x = KERNEL.shape
+    pad = [(0, 0)] * (alpha.ndim - 2) + [((k_y - 1) // 2, k_y // 2), ((k_x - 1) // 2, k_x // 2)]
+    table = np.pad(alpha, pad, mode='edge').astype(np.int64)
+    table = np.pad(table.cumsum(axis=-2).cumsum(axis=-1), [(0, 0)] * (alpha.ndim - 2) + [(1, 0), (1, 0)])
+    window = table[..., k_y:, k_x:] - table[..., :-k_y, k_x:] - table[..., k_y:, :-k_x] + table[..., :-k_y, :-k_x]
+    return (window >= KERNEL.size).astype(float)
+
+def _detect_periodic_stack(images: np.ndarray, mask_mode: MaskMode = 'sat', spectrum: Spectrum = 'blue') -> np.ndarray:
+    n, h, w = images.shape[:3]
+    if spectrum not in ('blue', 'rgb'):
+        raise ValueError(f"Unknown spectrum `{spectrum}`.")
+    pixel_masks = alpha_mask(images[..., 3], mask_mode)
+    channels = images[..., 2:3] if spectrum == 'blue' else images[..., :3]
+    pixel_imgs = channels * (pixel_masks[..., None] / 255)
+
+    # The inputs are real, so only half of every spectrum is computed; the mask spectrum is shared by the channels.
+    v_fft = np.fft.rfft(pixel_imgs, axis=1)
+    v_fmask = np.fft.rfft(pixel_masks, axis=1)[..., None]
+    v_tot = np.sum(np.abs(v_fft / (v_fmask + EPS)), axis=(2, 3))
+
+    h_fft = np.fft.rfft(pixel_imgs, axis=2)
+    h_fmask = np.fft.rfft(pixel_masks, axis=2)[..., None]
+    h_tot = np.sum(np.abs(h_fft / (h_fmask + EPS)), axis=(1, 3))
+
+    # |X[-k]| == |X[k]|, so mirroring the half spectra gives exactly what a full `fft` would (in `fftfreq` order).
+    v_tot = v_tot[:, _mirror_indices(h)]
+    h_tot = h_tot[:, _mirror_indices(w)]
+    v_freqs = np.fft.fftfreq(h, 1.0 / h)
+    h_freqs = np.fft.fftfreq(w, 1.0 / w)
+
+    periods = np.empty((n, 2))
+    for i in range(n):
+        periods[i] = _extract_dominant_frequency(v_tot[i], v_freqs), _extract_dominant_frequency(h_tot[i], h_freqs)
+    return periods
+
+def _mirror_indices(n: int) -> np.ndarray:
+    k = np.arange(n)
+    return np.minimum(k, n - k)
+
+def _extract_dominant_frequency(spectra: np.ndarray, fft_freqs: np.ndarray) -> int:
+    spectra = spectra.copy()
+    spectra[spectra < np.percentile(spectra, CUTOFF_PERCENTILE)] = 0.0
+    freqs = np.diff(np.sort(fft_freqs[find_peaks(spectra)[0]]))
+    freqs = freqs[freqs >= MIN_TILE_SIZE // 4]
+    if freqs.size:
+        return mode(freqs).mode
+    return fft_freqs[np.argmax(spectra)]
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+
+@dataclass
+class PaletteTiles:
+    # One small palette per tile, back to back (CSR style): a 16x16 sprite is ~300 bytes, against 1 KiB as RGBA.
+    indices: np.ndarray  # (N, H, W) uint8 (uint16 past 256 colors in a tile), into the tile's own palette.
+    colors: np.ndarray  # (M, 4) uint8 RGBA; tile i's palette is colors[offsets[i]:offsets[i + 1]].
+    offsets: np.ndarray  # (N + 1,) int64.
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, item: slice) -> PaletteTiles:
+        # Contiguous ranges only; everything but the (tiny) offsets stays a view.
+        start, stop, step = item.indices(len(self))
+        if step != 1:
+            raise ValueError("PaletteTiles can only be sliced contiguously.")
+        offsets = self.offsets[start:stop + 1]
+        return PaletteTiles(self.indices[start:stop], self.colors[offsets[0]:offsets[-1]], offsets - offsets[0])
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indices.nbytes + self.colors.nbytes + self.offsets.nbytes
+
+    @classmethod
+    def encode(cls, tiles: np.ndarray) -> PaletteTiles:
+        # (N, H, W, 4) uint8 -> palette form, in one `np.unique` over (tile, color) keys.
+        n, h, w, _ = tiles.shape
+        packed = np.ascontiguousarray(tiles).view(np.uint32).reshape(n, h * w).astype(np.uint64)
+        keys = (np.arange(n, dtype=np.uint64)[:, None] << np.uint64(32)) | packed
+        unique, inverse = np.unique(keys.ravel(), return_inverse=True)
+
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount((unique >> np.uint64(32)).astype(np.int64), minlength=n))
+        local = inverse.reshape(n, h * w) - offsets[:-1, None]
+        dtype = np.uint8 if n == 0 or np.diff(offsets).max() <= 256 else np.uint16
+        colors = (unique & np.uint64(0xFFFFFFFF)).astype(np.uint32).view(np.uint8).reshape(-1, 4)
+        return cls(local.astype(dtype).reshape(n, h, w), colors, offsets)
+
+    def decode(self) -> np.ndarray:
+        # Lossless inverse of `encode`.
+        return self.colors[self.offsets[:-1, None, None] + self.indices]
+
+    def to_torch(self) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        # Shares memory with the arrays, except uint16 indices (torch can't index with those), which become int32.
+        indices = self.indices if self.indices.dtype == np.uint8 else self.indices.astype(np.int32)
+        return torch.from_numpy(indices), torch.from_numpy(self.colors), torch.from_numpy(self.offsets)
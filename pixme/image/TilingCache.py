@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from pydantic import FilePath
+
+import os
+import sqlite3
+
+from ..utils.path import hash_file
+
+TILING_VERSION = 1  # Part of every key; bump it whenever `ImageData.analyze_tiling` starts giving different results.
+
+@dataclass(frozen=True)
+class Tiling:
+    t_y: int  # Tiles along each axis (after `__round_tiling`).
+    t_x: int
+    bbox: tuple[int, int, int, int]  # (y0, y1, x0, x1) of the non-empty part of the tiles, in tile coordinates.
+
+class TilingCache:
+    # `ImageData.analyze_tiling` results by image sha256: an LRU of `capacity` entries over an optional sqlite file.
+
+    def __init__(self, path: FilePath | None = None, capacity: int = 1 << 16):
+        self.path = path
+        self.capacity = capacity
+        self._lru: OrderedDict[str, Tiling] = OrderedDict()
+        self._hashes: OrderedDict[FilePath, tuple[int, int, str]] = OrderedDict()
+        self._connection: sqlite3.Connection | None = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        return state
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def key(self, file: FilePath, variant: str = '') -> str:
+        # `variant` tells apart settings that give different tilings; a file is only rehashed when its size/mtime move.
+        stat = os.stat(file)
+        known = self._hashes.get(file)
+        if known is None or known[:2] != (stat.st_size, stat.st_mtime_ns):
+            known = (stat.st_size, stat.st_mtime_ns, hash_file(file))
+        self.__remember(self._hashes, file, known)
+        return f"{known[2]}:{TILING_VERSION}:{variant}"
+
+    def get(self, key: str) -> Tiling | None:
+        tiling = self._lru.get(key)
+        if tiling is not None:
+            self._lru.move_to_end(key)
+            return tiling
+
+        connection = self.__connect()
+        if connection is None:
+            return None
+        row = connection.execute("SELECT t_y, t_x, y0, y1, x0, x1 FROM tilings WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        tiling = Tiling(row[0], row[1], tuple(row[2:]))
+        self.__remember(self._lru, key, tiling)
+        return tiling
+
+    def put(self, key: str, tiling: Tiling) -> None:
+        self.__remember(self._lru, key, tiling)
+        connection = self.__connect()
+        if connection is None:
+            return
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO tilings VALUES (?, ?, ?, ?, ?, ?, ?)", (key, tiling.t_y, tiling.t_x, *tiling.bbox))
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __remember(self, lru: OrderedDict, key, value) -> None:
+        lru[key] = value
+        lru.move_to_end(key)
+        while len(lru) > self.capacity:
+            lru.popitem(last=False)
+
+    def __connect(self) -> sqlite3.Connection | None:
+        if self.path is None:
+            return None
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Several loader workers may share the file; sqlite serializes their writes.
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS tilings (hash TEXT PRIMARY KEY, t_y INTEGER, t_x INTEGER, y0 INTEGER, y1 INTEGER, x0 INTEGER, x1 INTEGER)"
+                )
+        return self._connection
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+from PIL import Image
+from pydantic import FilePath
+
+import numpy as np
+
+from ..utils.compression import decompress_xnb_lzx, decompress_lz4_block
+
+XNB_VERSION = 5  # XNA 4.0, which is what Terraria ships.
+XNB_HEADER_SIZE = 10
+XNB_FLAG_LZ4 = 0x40
+XNB_FLAG_LZX = 0x80
+TEXTURE2D_READER = 'Microsoft.Xna.Framework.Content.Texture2DReader'
+
+# XNA 4.0 `SurfaceFormat` values that can show up in a Texture2D.
+SURFACE_COLOR = 0
+SURFACE_BGR565 = 1
+SURFACE_BGRA5551 = 2
+SURFACE_BGRA4444 = 3
+SURFACE_DXT1 = 4
+SURFACE_DXT3 = 5
+SURFACE_DXT5 = 6
+
+class XnbError(ValueError):
+    pass
+
+class XnbTypeError(XnbError):
+    # The .xnb is valid, it just holds something other than a texture.
+    pass
+
+class XnbTexture:
+    def __init__(self, file: FilePath, unpremultiply: bool = False):
+        with open(file, 'rb') as f:
+            data = f.read()
+        self.file = file
+        self.unpremultiply = unpremultiply
+        self._image = None
+
+        content = self.read_content(data)
+        self.reader, pos = self.__read_primary_reader(content)
+        if self.reader != TEXTURE2D_READER:
+            raise XnbTypeError(f"`{file}` is not a Texture2D (found `{self.reader}`).")
+
+        self.surface_format = int.from_bytes(content[pos:pos + 4], 'little', signed=True)
+        self.width = int.from_bytes(content[pos + 4:pos + 8], 'little')
+        self.height = int.from_bytes(content[pos + 8:pos + 12], 'little')
+        level_count = int.from_bytes(content[pos + 12:pos + 16], 'little')
+        if level_count < 1:
+            raise XnbError(f"`{file}` has no mip levels.")
+        # Only the full resolution level matters; the others are just downscaled copies.
+        size = int.from_bytes(content[pos + 16:pos + 20], 'little')
+        self._data = content[pos + 20:pos + 20 + size]
+
+    @property
+    def image(self) -> np.ndarray:
+        if self._image is None:
+            self._image = decode_surface(self.surface_format, self.width, self.height, self._data)
+            if self.unpremultiply:
+                self._image = unpremultiply_alpha(self._image)
+        return self._image
+
+    def save(self, file: FilePath) -> None:
+        Image.fromarray(self.image, 'RGBA').save(file)
+
+    @staticmethod
+    def read_content(data: bytes) -> bytes:
+        if data[:3] != b'XNB':
+            raise XnbError("Not an .xnb file (bad magic).")
+        version, flags = data[4], data[5]
+        if version != XNB_VERSION:
+            raise XnbError(f"Unsupported .xnb version {version} (only XNA 4.0 is supported).")
+        file_size = int.from_bytes(data[6:10], 'little')
+
+        if not flags & (XNB_FLAG_LZX | XNB_FLAG_LZ4):
+            return data[XNB_HEADER_SIZE:file_size]
+        decompressed_size = int.from_bytes(data[10:14], 'little')
+        if flags & XNB_FLAG_LZX:
+            return decompress_xnb_lzx(data, XNB_HEADER_SIZE + 4, file_size - XNB_HEADER_SIZE - 4, decompressed_size)
+        return decompress_lz4_block(data[XNB_HEADER_SIZE + 4:file_size], decompressed_size)
+
+    @staticmethod
+    def __read_primary_reader(content: bytes) -> tuple[str, int]:
+        readers = []
+        reader_count, pos = _read_7bit_int(content, 0)
+        for _ in range(reader_count):
+            length, pos = _read_7bit_int(content, pos)
+            readers.append(content[pos:pos + length].decode('utf-8').split(',')[0].strip())
+            pos += length + 4  # Reader version (int32), unused.
+        _, pos = _read_7bit_int(content, pos)  # Shared resource count.
+
+        type_id, pos = _read_7bit_int(content, pos)
+        if type_id == 0 or type_id > len(readers):
+            raise XnbError("The primary asset of this .xnb is null or has no type reader.")
+        return readers[type_id - 1], pos
+
+def _read_7bit_int(data: bytes, pos: int) -> tuple[int, int]:
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+# ===========================================================================
+#                           SURFACE DECODING
+# ===========================================================================
+
+def decode_surface(surface_format: int, width: int, height: int, data: bytes) -> np.ndarray:
+    n = width * height
+    if surface_format == SURFACE_COLOR:
+        return np.frombuffer(data, dtype=np.uint8, count=n * 4).reshape(height, width, 4).copy()
+    if surface_format in (SURFACE_BGR565, SURFACE_BGRA5551, SURFACE_BGRA4444):
+        return _decode_packed(surface_format, np.frombuffer(data, dtype='<u2', count=n).reshape(height, width))
+    if surface_format in (SURFACE_DXT1, SURFACE_DXT3, SURFACE_DXT5):
+        return _decode_dxt(surface_format, width, height, data)
+    raise XnbError(f"Unsupported surface format {surface_format}.")
+
+def _expand(value: np.ndarray, bits: int) -> np.ndarray:
+    # Bit replication, so the max value maps to exactly 255.
+    value = value.astype(np.uint16)
+    return ((value << (8 - bits)) | (value >> (2 * bits - 8) if bits >= 4 else 0)).astype(np.uint8)
+
+def _decode_packed(surface_format: int, packed: np.ndarray) -> np.ndarray:
+    out = np.empty(packed.shape + (4,), dtype=np.uint8)
+    if surface_format == SURFACE_BGR565:
+        out[..., 0] = _expand((packed >> 11) & 0x1F, 5)
+        out[..., 1] = _expand((packed >> 5) & 0x3F, 6)
+        out[..., 2] = _expand(packed & 0x1F, 5)
+        out[..., 3] = 255
+    elif surface_format == SURFACE_BGRA5551:
+        out[..., 0] = _expand((packed >> 10) & 0x1F, 5)
+        out[..., 1] = _expand((packed >> 5) & 0x1F, 5)
+        out[..., 2] = _expand(packed & 0x1F, 5)
+        out[..., 3] = ((packed >> 15) & 1) * 255
+    else:
+        out[..., 0] = ((packed >> 8) & 0xF) * 17
+        out[..., 1] = ((packed >> 4) & 0xF) * 17
+        out[..., 2] = (packed & 0xF) * 17
+        out[..., 3] = ((packed >> 12) & 0xF) * 17
+    return out
+
+def _rgb565(color: np.ndarray) -> np.ndarray:
+    return np.stack([
+        _expand((color >> 11) & 0x1F, 5),
+        _expand((color >> 5) & 0x3F, 6),
+        _expand(color & 0x1F, 5),
+    ], axis=-1).astype(np.int32)
+
+def _decode_dxt(surface_format: int, width: int, height: int, data: bytes) -> np.ndarray:
+    blocks_x, blocks_y = (width + 3) // 4, (height + 3) // 4
+    n = blocks_x * blocks_y
+    block_size = 8 if surface_format == SURFACE_DXT1 else 16
+    blocks = np.frombuffer(data, dtype=np.uint8, count=n * block_size).reshape(n, block_size)
+
+    # Color part (the whole block for DXT1, the last 8 bytes otherwise).
+    color = blocks[:, -8:].astype(np.uint32)
+    c0 = color[:, 0] | (color[:, 1] << 8)
+    c1 = color[:, 2] | (color[:, 3] << 8)
+    codes = color[:, 4] | (color[:, 5] << 8) | (color[:, 6] << 16) | (color[:, 7] << 24)
+    rgb0, rgb1 = _rgb565(c0), _rgb565(c1)
+
+    four_colors = (c0 > c1)[:, None] | (surface_format != SURFACE_DXT1)
+    palette = np.empty((n, 4, 4), dtype=np.uint8)
+    palette[:, 0, :3] = rgb0
+    palette[:, 1, :3] = rgb1
+    palette[:, 2, :3] = np.where(four_colors, (2 * rgb0 + rgb1) // 3, (rgb0 + rgb1) // 2)
+    palette[:, 3, :3] = np.where(four_colors, (rgb0 + 2 * rgb1) // 3, 0)
+    palette[:, :, 3] = 255
+    palette[:, 3, 3] = np.where(four_colors[:, 0], 255, 0)
+
+    indices = (codes[:, None] >> (2 * np.arange(16, dtype=np.uint32))) & 3
+    pixels = palette[np.arange(n)[:, None], indices]
+
+    if surface_format == SURFACE_DXT3:
+        alpha = blocks[:, :8]
+        nibbles = np.stack([alpha & 0xF, alpha >> 4], axis=-1).reshape(n, 16)
+        pixels[:, :, 3] = nibbles * 17
+    elif surface_format == SURFACE_DXT5:
+        a0, a1 = blocks[:, 0].astype(np.int32), blocks[:, 1].astype(np.int32)
+        alpha_bits = np.zeros(n, dtype=np.uint64)
+        for i in range(6):
+            alpha_bits |= blocks[:, 2 + i].astype(np.uint64) << np.uint64(8 * i)
+        alpha_codes = ((alpha_bits[:, None] >> (3 * np.arange(16, dtype=np.uint64))) & np.uint64(7)).astype(np.intp)
+
+        steps = np.arange(1, 7)
+        eight = a0 > a1
+        alpha_palette = np.empty((n, 8), dtype=np.int32)
+        alpha_palette[:, 0], alpha_palette[:, 1] = a0, a1
+        alpha_palette[:, 2:8] = np.where(
+            eight[:, None],
+            ((7 - steps) * a0[:, None] + steps * a1[:, None]) // 7,
+            np.concatenate([((5 - steps[:4]) * a0[:, None] + steps[:4] * a1[:, None]) // 5,
+                            np.zeros((n, 1), dtype=np.int32), np.full((n, 1), 255, dtype=np.int32)], axis=1),
+        )
+        pixels[:, :, 3] = alpha_palette[np.arange(n)[:, None], alpha_codes]
+
+    image = pixels.reshape(blocks_y, blocks_x, 4, 4, 4).transpose(0, 2, 1, 3, 4).reshape(blocks_y * 4, blocks_x * 4, 4)
+    return np.ascontiguousarray(image[:height, :width])
+
+def unpremultiply_alpha(image: np.ndarray) -> np.ndarray:
+    alpha = image[..., 3:].astype(np.uint32)
+    rgb = image[..., :3].astype(np.uint32)
+    restored = np.where(alpha > 0, np.minimum((rgb * 255 + alpha // 2) // np.maximum(alpha, 1), 255), 0)
+    return np.concatenate([restored.astype(np.uint8), image[..., 3:]], axis=-1)
@@ -1 +1,4 @@
-from .ImageData import ImageData
\ No newline at end of file
+from .ImageData import ImageData
+from .PaletteTiles import PaletteTiles
+from .TilingCache import Tiling, TilingCache
+from .XnbTexture import XnbTexture, XnbError, XnbTypeError
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from typing import Iterable, Iterator
+
+import torch
+
+BATCH_PIXELS = 1 << 20  # Default batch size of a bucket: as many tiles as fit in this many pixels (16x16 -> 4096, 256x256 -> 16).
+
+class BucketBatcher:
+    # Carries tiles over between samples so every batch of a bucket has the same shape; `mix` sets each bucket's share.
+
+    def __init__(self, batch_sizes: dict[str, int] | int | None = None, mix: dict[str, float] | None = None, max_pending: int = 4):
+        self.batch_sizes = batch_sizes
+        self.mix = mix
+        self.max_pending = max_pending  # Batches a bucket that's ahead of its share may pile up before it goes anyway.
+        self._pending: dict[str, list[torch.Tensor]] = {}
+        self._counts: dict[str, int] = {}
+        self.emitted: dict[str, int] = {}
+
+    def batch_size(self, bucket: str) -> int:
+        if isinstance(self.batch_sizes, int):
+            return self.batch_sizes
+        if self.batch_sizes is not None and bucket in self.batch_sizes:
+            return self.batch_sizes[bucket]
+        h, w = (int(s) for s in bucket.split('x'))
+        return max(1, BATCH_PIXELS // (h * w))
+
+    def share(self, bucket: str) -> float:
+        if self.mix is None:
+            return 1.0
+        return self.mix.get(bucket, 0.0)
+
+    @property
+    def pending(self) -> dict[str, int]:
+        # Tiles waiting per bucket.
+        return dict(self._counts)
+
+    def add(self, sample: dict[str, torch.Tensor], copy: bool = False) -> None:
+        # Tiles are kept by reference unless `copy` (for samples whose tensors get reused).
+        for bucket, tiles in sample.items():
+            if not len(tiles) or self.share(bucket) <= 0:
+                continue
+            self._pending.setdefault(bucket, []).append(tiles.clone() if copy else tiles)
+            self._counts[bucket] = self._counts.get(bucket, 0) + len(tiles)
+
+    def pop(self) -> tuple[str, torch.Tensor] | None:
+        # The next batch (bucket, (batch_size, ...) tiles), or None when more samples are needed first.
+        bucket = self.__next_bucket()
+        if bucket is None:
+            return None
+        return bucket, self.__take(bucket, self.batch_size(bucket))
+
+    def batches(self, samples: Iterable[dict[str, torch.Tensor]], copy: bool = False) -> Iterator[tuple[str, torch.Tensor]]:
+        # Endless (as long as `samples` is) stream of batches; pulls a new sample whenever no batch is due.
+        for sample in samples:
+            self.add(sample, copy)
+            while (batch := self.pop()) is not None:
+                yield batch
+
+    def __next_bucket(self) -> str | None:
+        ready = [bucket for bucket, count in self._counts.items() if count >= self.batch_size(bucket)]
+        if not ready:
+            return None
+        total = sum(self.share(bucket) for bucket in self._counts)
+        n = sum(self.emitted.values()) + 1
+        deficit = {bucket: self.share(bucket) / total * n - self.emitted.get(bucket, 0) for bucket in ready}
+        bucket = max(ready, key=deficit.get)
+        if deficit[bucket] > 0:
+            return bucket
+        # Everybody that's ready is ahead of its share; only relieve buckets that are piling up.
+        full = [bucket for bucket in ready if self._counts[bucket] >= self.max_pending * self.batch_size(bucket)]
+        return max(full, key=deficit.get) if full else None
+
+    def __take(self, bucket: str, n: int) -> torch.Tensor:
+        parts, taken = [], 0
+        pending = self._pending[bucket]
+        while taken < n:
+            tiles = pending[0]
+            need = n - taken
+            if len(tiles) <= need:
+                parts.append(pending.pop(0))
+                taken += len(tiles)
+            else:
+                parts.append(tiles[:need])
+                pending[0] = tiles[need:]
+                taken = n
+        self._counts[bucket] -= n
+        self.emitted[bucket] = self.emitted.get(bucket, 0) + 1
+        # A batch that's exactly one pending chunk goes out as is.
+        return parts[0] if len(parts) == 1 else torch.cat(parts)
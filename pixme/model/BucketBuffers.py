@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import warnings
+import numpy as np
+import torch
+
+from ..image.ImageData import square_placement
+
+BUCKET_SIZES = (16, 32, 64, 128, 256)
+BUCKET_BYTES = 1 << 20  # Initial uint8 bytes per bucket (the float32 buffers, if any, are 4x that); they grow as needed.
+
+class BucketBuffers:
+    # Per-size tile tensors that samples are cropped/padded straight into; a bucket doubles whenever it runs out.
+
+    def __init__(self, capacity: dict[int, int] | None = None, bucket_bytes: int = BUCKET_BYTES, pin_memory: bool = False, normalized: bool = True):
+        if capacity is None:
+            capacity = {size: max(1, bucket_bytes // (size * size * 4)) for size in BUCKET_SIZES}
+        self.capacity = dict(capacity)
+        self.pin_memory = pin_memory
+        self.tiles = {size: self.__empty(n, size, torch.uint8) for size, n in capacity.items()}
+        self.normalized = {size: self.__empty(n, size, torch.float32) for size, n in capacity.items()} if normalized else {}
+        self._arrays = {size: tiles.numpy() for size, tiles in self.tiles.items()}
+        self.counts = {size: 0 for size in capacity}
+        self.dropped = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(t.nbytes for t in self.tiles.values()) + sum(t.nbytes for t in self.normalized.values())
+
+    def reset(self) -> None:
+        self.counts = {size: 0 for size in self.capacity}
+        self.dropped = 0
+
+    def add(self, tiles: np.ndarray, random_pad: bool = True, bbox: tuple[int, int, int, int] | None = None) -> int:
+        # Same as `pad_to_power_of_two_square` on (t_y, t_x, h, w, 4) or (n, h, w, 4) tiles; returns how many were added.
+        if tiles.ndim == 4:
+            tiles = tiles[None]
+        if bbox is not None:
+            y0, y1, x0, x1 = bbox
+            tiles = tiles[:, :, y0:y1, x0:x1]
+        # Like `remove_empty_lines`; only images with empty lines inside their content get copied here.
+        occupied = np.any(tiles, axis=-1)
+        keep = occupied.any(axis=(2, 3))
+        rows, cols = occupied.any(axis=(0, 1, 3)), occupied.any(axis=(0, 1, 2))
+        n = int(keep.sum())
+        if n == 0:
+            return 0
+        if not rows.all():
+            tiles = tiles[:, :, rows]
+        if not cols.all():
+            tiles = tiles[:, :, :, cols]
+
+        size, off_y, off_x, h, w, pad_y, pad_x = square_placement(tiles.shape[2], tiles.shape[3], random_pad)
+        if size not in self._arrays:
+            self.__drop(n)
+            return 0
+        self.__reserve(size, n)
+        start = self.counts[size]
+
+        block = self._arrays[size][start:start + n]
+        # Zero the padding only; the content area gets overwritten right after.
+        block[:, :pad_y] = 0
+        block[:, pad_y + h:] = 0
+        block[:, pad_y:pad_y + h, :pad_x] = 0
+        block[:, pad_y:pad_y + h, pad_x + w:] = 0
+
+        source = tiles[:, :, off_y:off_y + h, off_x:off_x + w]
+        if n == keep.size:
+            block.reshape(tiles.shape[0], tiles.shape[1], size, size, 4)[:, :, pad_y:pad_y + h, pad_x:pad_x + w] = source
+        else:
+            for k, (i, j) in enumerate(np.argwhere(keep)):
+                block[k, pad_y:pad_y + h, pad_x:pad_x + w] = source[i, j]
+        self.counts[size] = start + n
+        return n
+
+    def views(self, normalize: bool = False) -> dict[int, torch.Tensor]:
+        # The filled part of every bucket, as views that the next `reset` overwrites.
+        if not normalize:
+            return {size: self.tiles[size][:n] for size, n in self.counts.items()}
+        if not self.normalized:
+            raise ValueError("These buffers were made with `normalized=False`.")
+        return {size: torch.div(self.tiles[size][:n], 255, out=self.normalized[size][:n]) for size, n in self.counts.items()}
+
+    def take(self, normalize: bool = False) -> dict[int, torch.Tensor]:
+        # Like `views`, but as new tensors of just the filled part, so they're the caller's to keep.
+        if normalize:
+            return {size: torch.div(self.tiles[size][:n], 255) for size, n in self.counts.items()}
+        return {size: self.tiles[size][:n].clone() for size, n in self.counts.items()}
+
+    def __empty(self, n: int, size: int, dtype: torch.dtype) -> torch.Tensor:
+        return torch.empty((n, size, size, 4), dtype=dtype, pin_memory=self.pin_memory)
+
+    def __reserve(self, size: int, n: int) -> None:
+        # Makes room for `n` more tiles, keeping the ones already in the bucket.
+        count = self.counts[size]
+        if count + n <= self.capacity[size]:
+            return
+        capacity = max(count + n, 2 * self.capacity[size])
+        tiles = self.__empty(capacity, size, torch.uint8)
+        tiles[:count] = self.tiles[size][:count]
+        self.tiles[size], self._arrays[size], self.capacity[size] = tiles, tiles.numpy(), capacity
+        if self.normalized:
+            self.normalized[size] = self.__empty(capacity, size, torch.float32)
+
+    def __drop(self, n: int) -> None:
+        if not self.dropped:
+            warnings.warn("Some tiles have a size without a bucket; they are dropped.")
+        self.dropped += n
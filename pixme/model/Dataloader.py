@@ -1,15 +1,27 @@
 from pydantic import FilePath
-from typing import Literal
+from typing import Iterator, Literal
+import os
 import numpy as np
 import torch
 
-from ..extractors import convert_preexisting, ExtractorBase
-from ..image import ImageData
+from torch.utils.data import DataLoader
+
+from ..extractors import convert_preexisting, DatasetManifest, ExtractorBase
+from ..image import ImageData, PaletteTiles, TilingCache
+from .TileShards import TileShards
+from .BucketBuffers import BucketBuffers, BUCKET_BYTES
+from .TileDataset import TileDataset
+from .BucketBatcher import BucketBatcher
+from .TileAugment import TileAugment
 
 Sizes = Literal['16x16', '32x32', '64x64', '128x128', '256x256']
 
 class ImageDataloader:
     N_FILES_PER_SAMPLE: int = 128
+    USE_TILING_CACHE: bool = True  # Keeps every image's tiling in `<outdir>/cache/tiling.sqlite`, so it's only analyzed once.
+    N_TILES_PER_SAMPLE: int = 4096  # Shard mode only; split across the buckets in proportion to their tile counts.
+    BUCKET_BYTES: int = BUCKET_BYTES  # Decode mode only; initial size of every bucket buffer, they grow as needed (see `BucketBuffers`).
+    PIN_MEMORY: bool = False  # Pins the bucket buffers, for faster (async) copies to the GPU.
     SIZE_MAP: dict[int, Sizes] = {
         16: '16x16',
         32: '32x32',
@@ -18,19 +30,85 @@ class ImageDataloader:
         256: '256x256'
     }
 
-    def __init__(self, path: FilePath):
-        self.__extractors = convert_preexisting(path)
-
-    def generate_sample(self) -> dict[Sizes, np.ndarray]:
-        files = ExtractorBase.sample_random(self.N_FILES_PER_SAMPLE)
-        dataset = {
-            '16x16': [],
-            '32x32': [],
-            '64x64': [],
-            '128x128': [],
-            '256x256': []
-        }
-        for file in files:
-            images = ImageData(file.file).create_tiles()
-            dataset[self.SIZE_MAP[images.shape[1]]].append(images)
-        return {k: torch.from_numpy(np.concatenate(v, axis=0)) / 255 for k, v in dataset.items()}
+    def __init__(self, path: FilePath, shard_dir: FilePath | None = None, seed: int | None = None, manifest: DatasetManifest | None = None,
+                 weights: dict[str, float] | None = None, balanced: bool | None = None):
+        # With `shard_dir` (see `build_shards`), samples are read from the pre-tiled shards instead of decoding pngs.
+        # Without a `manifest`, the preexisting extractors of `path` get frozen into one (see `ExtractorBase.manifest`).
+        self.__path = path
+        if manifest is None:
+            self.__extractors = convert_preexisting(path)
+            manifest = ExtractorBase.manifest(weights, balanced)
+        else:
+            self.__extractors = []
+        self.__manifest = manifest
+        self.__tiling_cache = TilingCache(os.path.join(os.path.dirname(path), "cache", "tiling.sqlite")) if self.USE_TILING_CACHE else None
+        self.__shards = None if shard_dir is None else TileShards(shard_dir)
+        self.__rng = np.random.default_rng(seed)
+        self.__buffers: BucketBuffers | None = None
+
+    @property
+    def manifest(self) -> DatasetManifest:
+        return self.__manifest
+
+    def build_shards(self, shard_dir: FilePath, n_workers: int = 1, palette: bool = False) -> TileShards:
+        # Offline step: tiles every image once and switches this loader over to the shards.
+        self.__shards = TileShards.build(self.__manifest.index, shard_dir, tiling_cache=self.__tiling_cache, n_workers=n_workers, palette=palette)
+        return self.__shards
+
+    def dataset(self, normalize: bool = True, seed: int | None = None, augment: TileAugment | None = None) -> TileDataset:
+        # The same samples as `generate_sample`; decode mode saves the manifest first, so workers just map it.
+        manifest = None
+        if self.__shards is None:
+            if self.__manifest.path is None:
+                self.__manifest = self.__manifest.save(os.path.join(os.path.dirname(self.__path), "index", "manifest"))
+            manifest = self.__manifest
+        return TileDataset(
+            manifest, n_files=self.N_FILES_PER_SAMPLE,
+            shard_dir=None if self.__shards is None else self.__shards.directory,
+            tiling_cache=None if self.__tiling_cache is None else self.__tiling_cache.path,
+            n_tiles=self.N_TILES_PER_SAMPLE, normalize=normalize, seed=seed, bucket_bytes=self.BUCKET_BYTES, augment=augment,
+        )
+
+    def loader(self, n_workers: int = 4, prefetch: int = 2, normalize: bool = True, seed: int | None = None, augment: TileAugment | None = None) -> DataLoader:
+        # Decodes samples in `n_workers` processes while training runs; iterate it instead of calling `generate_sample`.
+        return self.dataset(normalize, seed, augment).loader(n_workers, prefetch, pin_memory=self.PIN_MEMORY)
+
+    def generate_sample(self, normalize: bool = True, reuse_buffers: bool = False) -> dict[Sizes, torch.Tensor]:
+        # `normalize=False` keeps the uint8 tiles (zero-copy views of the shards in shard mode).
+        # `reuse_buffers` (decode mode) hands out views of the bucket buffers instead, only valid until the next call.
+        if self.__shards is not None:
+            return self.__generate_shard_sample(normalize)
+        return self.__generate_decoded_sample(normalize, reuse_buffers)
+
+    def generate_batches(self, batch_sizes: dict[Sizes, int] | int | None = None, mix: dict[Sizes, float] | None = None,
+                         normalize: bool = True) -> Iterator[tuple[Sizes, torch.Tensor]]:
+        # Endless fixed-size (bucket, tiles) batches (see `BucketBatcher`); only carried-over decode-mode tiles get copied.
+        def samples():
+            while True:
+                yield self.generate_sample(normalize, reuse_buffers=True)
+        yield from BucketBatcher(batch_sizes, mix).batches(samples(), copy=self.__shards is None)
+
+    def generate_palette_sample(self) -> dict[Sizes, PaletteTiles]:
+        # Same sample as `PaletteTiles` (see `PixelEncoder.embed_palette`), far cheaper to hold and to send around.
+        if self.__shards is not None:
+            return {bucket: self.__shards.sample_palette(bucket, n, self.__rng) for bucket, n in self.__shards.split(self.N_TILES_PER_SAMPLE).items()}
+        return {k: PaletteTiles.encode(v.numpy()) for k, v in self.__generate_decoded_sample(False, reuse_buffers=True).items()}
+
+    def __generate_decoded_sample(self, normalize: bool, reuse_buffers: bool) -> dict[Sizes, torch.Tensor]:
+        if self.__buffers is None:
+            self.__buffers = BucketBuffers(bucket_bytes=self.BUCKET_BYTES, pin_memory=self.PIN_MEMORY)
+        self.__buffers.reset()
+
+        for i in self.__manifest.sample(self.N_FILES_PER_SAMPLE, rng=self.__rng):
+            image = ImageData(self.__manifest.file(i), tiling_cache=self.__tiling_cache)
+            tiling = image.tiling
+            self.__buffers.add(image.tile_view(tiling), bbox=tiling.bbox)
+        tiles = self.__buffers.views(normalize) if reuse_buffers else self.__buffers.take(normalize)
+        return {self.SIZE_MAP[size]: bucket for size, bucket in tiles.items()}
+
+    def __generate_shard_sample(self, normalize: bool) -> dict[Sizes, torch.Tensor]:
+        dataset = {}
+        for bucket, n in self.__shards.split(self.N_TILES_PER_SAMPLE).items():
+            tiles = self.__shards.sample(bucket, n, self.__rng)
+            dataset[bucket] = tiles / 255 if normalize else tiles
+        return dataset
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+from pydantic import FilePath
+from typing import Literal
+
+import json
+import os
+import numpy as np
+
+from ..utils.path import generate_random_string
+
+Metric = Literal['l2', 'cosine']
+KMEANS_SAMPLE = 64  # Training vectors per list (at most) for k-means.
+KMEANS_ITERATIONS = 20
+CHUNK = 1 << 16  # Vectors per distance matrix while training/assigning; bounds memory to CHUNK * n_lists floats.
+
+class IVFIndex:
+    # Inverted-file approximate nearest neighbours in NumPy: a query only scans the `n_probe` lists closest to it.
+
+    def __init__(self, centroids: np.ndarray, metric: Metric = 'l2', vectors: np.ndarray | None = None, ids: np.ndarray | None = None,
+                 offsets: np.ndarray | None = None, n_probe: int = 8, norms: np.ndarray | None = None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.metric = metric
+        self.n_probe = n_probe
+        n_lists, dim = self.centroids.shape
+        self.vectors = np.zeros((0, dim), dtype=np.float32) if vectors is None else vectors
+        self.ids = np.zeros(0, dtype=np.int64) if ids is None else ids
+        self.offsets = np.zeros(n_lists + 1, dtype=np.int64) if offsets is None else offsets  # List i is vectors[offsets[i]:offsets[i + 1]].
+        self._norms = np.einsum('ij,ij->i', self.vectors, self.vectors) if norms is None else norms
+        self._centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self._pending: dict[int, list[tuple[np.ndarray, np.ndarray]]] = {}  # Added vectors per list, until `compact`.
+        self._n_pending = 0
+
+    def __len__(self) -> int:
+        return len(self.ids) + self._n_pending
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, n_lists: int | None = None, metric: Metric = 'l2', n_probe: int = 8,
+              iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> IVFIndex:
+        # Only learns the centroids (from at most KMEANS_SAMPLE vectors per list); `add` the vectors afterwards.
+        rng = np.random.default_rng(seed)
+        n_lists = max(1, int(4 * np.sqrt(len(vectors)))) if n_lists is None else n_lists
+        n_lists = min(n_lists, len(vectors))
+        sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), n_lists * KMEANS_SAMPLE), replace=False))]
+        sample = _prepare(sample, metric)
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = _nearest(sample, centroids)
+            counts = np.bincount(assign, minlength=n_lists)
+            sums = np.stack([np.bincount(assign, weights=sample[:, d], minlength=n_lists) for d in range(sample.shape[1])], axis=1)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # Empty lists restart from random vectors instead of wasting a centroid.
+            centroids[~filled] = sample[rng.choice(len(sample), int((~filled).sum()), replace=False)]
+        return cls(centroids, metric, n_probe=n_probe)
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray | None = None) -> np.ndarray:
+        # Returns the ids (consecutive from `len(self)` when not given).
+        vectors = _prepare(vectors, self.metric)
+        ids = np.arange(len(self), len(self) + len(vectors), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        assign = _nearest(vectors, self.centroids, self._centroid_norms)
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(self.n_lists + 1))
+        for i in np.flatnonzero(np.diff(bounds)):
+            rows = order[bounds[i]:bounds[i + 1]]
+            self._pending.setdefault(int(i), []).append((vectors[rows], ids[rows]))
+        self._n_pending += len(vectors)
+        return ids
+
+    def compact(self) -> None:
+        # Folds the pending chunks into the CSR arrays (one pass over everything).
+        if not self._n_pending:
+            return
+        vectors, ids, offsets = [], [], [0]
+        for i in range(self.n_lists):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            chunks = [(self.vectors[start:end], self.ids[start:end])] + self._pending.get(i, [])
+            for chunk_vectors, chunk_ids in chunks:
+                vectors.append(chunk_vectors)
+                ids.append(chunk_ids)
+            offsets.append(offsets[-1] + sum(len(chunk_ids) for _, chunk_ids in chunks))
+        self.vectors = np.concatenate(vectors)
+        self.ids = np.concatenate(ids)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self._norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self._pending, self._n_pending = {}, 0
+
+    def search(self, queries: np.ndarray, k: int = 10, n_probe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        # (Q, dim) or (dim,) queries -> (Q, k) squared l2 distances and ids, closest first (inf/-1 past the end).
+        single = queries.ndim == 1
+        queries = _prepare(np.atleast_2d(queries), self.metric)
+        n_probe = min(self.n_probe if n_probe is None else n_probe, self.n_lists)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        found = np.full((len(queries), k), -1, dtype=np.int64)
+
+        to_centroids = self._centroid_norms[None] - 2 * queries @ self.centroids.T
+        probes = np.argpartition(to_centroids, n_probe - 1, axis=1)[:, :n_probe]
+        for q, (query, lists) in enumerate(zip(queries, probes)):
+            vectors, norms, ids = self.__candidates(lists)
+            if not len(ids):
+                continue
+            d = norms - 2 * (vectors @ query) + query @ query
+            top = np.argpartition(d, min(k, len(d)) - 1)[:k] if len(d) > k else np.arange(len(d))
+            top = top[np.argsort(d[top])]
+            distances[q, :len(top)] = np.maximum(d[top], 0)
+            found[q, :len(top)] = ids[top]
+        return (distances[0], found[0]) if single else (distances, found)
+
+    def __candidates(self, lists: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        vectors, norms, ids = [], [], []
+        for i in lists:
+            start, end = self.offsets[i], self.offsets[i + 1]
+            if end > start:
+                vectors.append(self.vectors[start:end])
+                norms.append(self._norms[start:end])
+                ids.append(self.ids[start:end])
+            for chunk_vectors, chunk_ids in self._pending.get(int(i), []):
+                vectors.append(chunk_vectors)
+                norms.append(np.einsum('ij,ij->i', chunk_vectors, chunk_vectors))
+                ids.append(chunk_ids)
+        if not ids:
+            return np.zeros((0, self.dim), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        return np.concatenate(vectors), np.concatenate(norms), np.concatenate(ids)
+
+    # ===========================================================================
+    #                               SAVING/LOADING
+    # ===========================================================================
+
+    def save(self, path: FilePath) -> None:
+        self.compact()
+        os.makedirs(path, exist_ok=True)
+        header_file = os.path.join(path, "index.json")
+        if os.path.exists(header_file):
+            os.remove(header_file)
+        # Through temp files, since the arrays may be memory-mapped from the very files being replaced.
+        arrays = {name: getattr(self, name) for name in ("centroids", "vectors", "ids", "offsets")}
+        arrays["norms"] = self._norms
+        for name, array in arrays.items():
+            file = os.path.join(path, f"{name}.npy")
+            temp_file = f"{file}.{generate_random_string(8)}"
+            with open(temp_file, "wb") as f:
+                np.save(f, array)
+            os.replace(temp_file, file)
+        # index.json goes last; `load` treats a folder without it as missing.
+        with open(header_file, "w") as f:
+            json.dump({"metric": self.metric, "n_probe": self.n_probe, "n_lists": self.n_lists, "dim": self.dim, "size": len(self)}, f)
+
+    @classmethod
+    def load(cls, path: FilePath, mmap: bool = True) -> IVFIndex | None:
+        header_file = os.path.join(path, "index.json")
+        if not os.path.isfile(header_file):
+            return None
+        with open(header_file) as f:
+            header = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap and name in ("vectors", "ids", "norms") else None)
+                  for name in ("centroids", "vectors", "ids", "offsets", "norms")}
+        return cls(arrays["centroids"], header["metric"], arrays["vectors"], arrays["ids"], arrays["offsets"], header["n_probe"], arrays["norms"])
+
+def _prepare(vectors: np.ndarray, metric: Metric) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if metric == 'cosine':
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+    elif metric != 'l2':
+        raise ValueError(f"Unknown metric `{metric}`.")
+    return vectors
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, centroid_norms: np.ndarray | None = None) -> np.ndarray:
+    # Index of the closest centroid of every vector (||v||^2 is the same for every centroid, so it's left out).
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids) if centroid_norms is None else centroid_norms
+    out = np.empty(len(vectors), dtype=np.int64)
+    for i in range(0, len(vectors), CHUNK):
+        out[i:i + CHUNK] = np.argmin(centroid_norms[None] - 2 * vectors[i:i + CHUNK] @ centroids.T, axis=1)
+    return out
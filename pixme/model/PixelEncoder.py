@@ -5,6 +5,10 @@ from torch import nn
 
 from dataclasses import dataclass
 
+from ..image import PaletteTiles
+from .Dataloader import Sizes
+from .convolutions import ConvBackend, make_conv
+
 D_LATENT: int = 24
 D_KERNEL: int = 16
 
@@ -15,6 +19,7 @@ class Conv2DDownsampler(nn.Module):
         d_in: int
         d_kernel: int
         f_downsample: int
+        backend: ConvBackend = 'dense'  # See `convolutions.py`; every backend gives the same size after the pool.
 
         # Non-user defined properties
         @property
@@ -23,12 +28,7 @@ class Conv2DDownsampler(nn.Module):
     def __init__(self, config: Conv2DDownsampler.Config = None):
         super().__init__()
         self.__cfg = config
-        self.conv = nn.Conv2d(
-            in_channels=self.__cfg.d_latent,
-            out_channels=self.__cfg.d_latent,
-            kernel_size=self.__cfg.d_kernel,
-            padding=self.__cfg.d_kernel//2,
-        )
+        self.conv = make_conv(self.__cfg.backend, self.__cfg.d_latent, self.__cfg.d_kernel)
         self.pool = nn.MaxPool2d(self.__cfg.f_downsample)
         self.act = nn.GELU()
 
@@ -40,32 +40,76 @@ class Conv2DDownsampler(nn.Module):
 
 
 class PixelEncoder(nn.Module):
-    def __init__(self):
+    # One shared downsampling trunk: 256 -> 128 -> 64 -> 32 -> 16 -> 8, then a spatial mean -> (N, D_LATENT).
+    # Every bucket enters the trunk at the stage matching its size, so a 32x32 batch joins the 256x256 one once
+    # that one got downsampled to 32x32, and they go through the rest together (see `encode`).
+    AUTOCAST: bool = True  # bf16 autocast (CPU included) for the trunk; the embeddings come out as float32.
+    CONV_BACKEND: ConvBackend = 'dense'
+    SIZES: tuple[int, ...] = (256, 128, 64, 32, 16)
+
+    def __init__(self, backend: ConvBackend | None = None):
         super().__init__()
+        backend = self.CONV_BACKEND if backend is None else backend
 
         self.latent = nn.Linear(4, D_LATENT)
-        self.samp256 = Conv2DDownsampler(Conv2DDownsampler.Config(
-            d_latent=D_LATENT,
-            d_in=256,
-            d_kernel=D_KERNEL,
-            f_downsample=2
-        ))
-        samp128 = Conv2DDownsampler(Conv2DDownsampler.Config(
-            d_latent=D_LATENT,
-            d_in=128,
-            d_kernel=D_KERNEL,
-            f_downsample=2
-        ))
-        samp64 = Conv2DDownsampler(Conv2DDownsampler.Config(
-            d_latent=D_LATENT,
-            d_in=64,
-            d_kernel=D_KERNEL,
-            f_downsample=2
-        ))
-        samp32 = Conv2DDownsampler(Conv2DDownsampler.Config(
-            d_latent=D_LATENT,
-            d_in=32,
-            d_kernel=D_KERNEL,
-            f_downsample=2
-        ))
+        for size in self.SIZES:
+            setattr(self, f"samp{size}", Conv2DDownsampler(Conv2DDownsampler.Config(
+                d_latent=D_LATENT,
+                d_in=size,
+                d_kernel=D_KERNEL,
+                f_downsample=2,
+                backend=backend,
+            )))
+        self.to(memory_format=torch.channels_last)
+
+    def stage(self, size: int) -> Conv2DDownsampler:
+        return getattr(self, f"samp{size}")
+
+    def embed(self, tiles: torch.Tensor) -> torch.Tensor:
+        # (N, H, W, 4) RGBA in [0, 1] -> (N, H, W, D_LATENT)
+        return self.latent(tiles)
+
+    def embed_palette(self, indices: torch.Tensor, colors: torch.Tensor, offsets: torch.Tensor) -> torch.Tensor:
+        # Same as `embed` on the decoded tiles, but the linear layer runs once per palette color instead of per pixel.
+        latent = self.latent(colors.to(self.latent.weight.dtype) / 255)
+        return latent[offsets[:-1, None, None] + indices.long()]
+
+    def forward(self, tiles: torch.Tensor) -> torch.Tensor:
+        # (N, S, S, 4) tiles of one bucket -> (N, D_LATENT)
+        return self.encode({f"{tiles.shape[1]}x{tiles.shape[2]}": tiles})[f"{tiles.shape[1]}x{tiles.shape[2]}"]
+
+    def encode(self, buckets: dict[Sizes, torch.Tensor | PaletteTiles]) -> dict[Sizes, torch.Tensor]:
+        # Every bucket (RGBA tiles, float in [0, 1] or uint8, or `PaletteTiles`) -> (N, D_LATENT) embeddings, in one
+        # pass down the trunk: the running batch is the concatenation of every bucket that already joined, so each
+        # stage runs once, on everything at that resolution.
+        device = self.latent.weight.device
+        by_size = {int(bucket.split('x')[0]): bucket for bucket in buckets}
+        unknown = [bucket for size, bucket in by_size.items() if size not in self.SIZES]
+        if unknown:
+            raise ValueError(f"No trunk stage for bucket(s) {unknown}; expected sizes {self.SIZES}.")
+
+        if not buckets:
+            return {}
+        with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=self.AUTOCAST):
+            x, counts = None, []
+            for size in self.SIZES:
+                if size in by_size:
+                    latent = self.__embed(buckets[by_size[size]], device)
+                    counts.append((by_size[size], len(latent)))
+                    # Empty buckets (which `BucketBuffers.views` hands out too) never join; they just get 0 rows below.
+                    if len(latent):
+                        # (N, H, W, D) memory viewed as (N, D, H, W) is exactly channels_last, so this is free.
+                        latent = latent.permute(0, 3, 1, 2)
+                        x = latent if x is None else torch.cat([x, latent]).contiguous(memory_format=torch.channels_last)
+                if x is not None:
+                    x = self.stage(size)(x)
+            embeddings = torch.zeros((0, D_LATENT), device=device) if x is None else x.mean(dim=(2, 3)).float()
+        return dict(zip([bucket for bucket, _ in counts], torch.split(embeddings, [n for _, n in counts])))
 
+    def __embed(self, tiles: torch.Tensor | PaletteTiles, device: torch.device) -> torch.Tensor:
+        if isinstance(tiles, PaletteTiles):
+            return self.embed_palette(*(t.to(device) for t in tiles.to_torch()))
+        tiles = tiles.to(device, non_blocking=True)
+        if tiles.dtype == torch.uint8:
+            tiles = tiles.to(self.latent.weight.dtype) / 255
+        return self.embed(tiles)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import math
+import torch
+
+# RGB <-> YIQ; a hue shift is a rotation of the (I, Q) plane.
+_TO_YIQ = torch.tensor([[0.299, 0.587, 0.114], [0.596, -0.274, -0.322], [0.211, -0.523, 0.312]])
+_FROM_YIQ = torch.linalg.inv(_TO_YIQ)
+_PERMUTATIONS = torch.tensor([[0, 1, 2], [0, 2, 1], [1, 0, 2], [1, 2, 0], [2, 0, 1], [2, 1, 0]])
+
+class TileAugment:
+    # Random geometry (one gather) and colors (one 3x3 matrix) for every tile of a batch, without a loop over the tiles.
+
+    def __init__(self, translate: bool = True, flip: float = 0.5, rotate: float = 0.5, palette_swap: float = 0.25,
+                 hue: float = 0.1, alpha_jitter: float = 0.1, seed: int | None = None):
+        self.translate = translate  # Moves the content inside its padding; it never gets cropped.
+        self.flip = flip  # Probability of a horizontal flip.
+        self.rotate = rotate  # Probability of a rotation (by 90, 180 or 270 degrees).
+        self.palette_swap = palette_swap  # Probability of permuting the RGB channels.
+        self.hue = hue  # Max hue rotation, as a fraction of a full turn.
+        self.alpha_jitter = alpha_jitter  # Scales every non-transparent alpha by 1 +- this; empty pixels stay empty.
+        self.generator = torch.Generator()
+        self.reseed(seed)
+
+    def reseed(self, seed: int | None = None) -> None:
+        if seed is None:
+            self.generator.seed()
+        else:
+            self.generator.manual_seed(seed)
+
+    def __call__(self, sample: dict[str, torch.Tensor] | torch.Tensor) -> dict[str, torch.Tensor] | torch.Tensor:
+        if isinstance(sample, dict):
+            return {bucket: self.augment(tiles) for bucket, tiles in sample.items()}
+        return self.augment(sample)
+
+    def augment(self, tiles: torch.Tensor) -> torch.Tensor:
+        if not len(tiles):
+            return tiles
+        tiles = self.__geometry(tiles)
+        if self.palette_swap or self.hue or self.alpha_jitter:
+            tiles = self.__colors(tiles)
+        return tiles
+
+    def __rand(self, *shape: int) -> torch.Tensor:
+        return torch.rand(shape, generator=self.generator)
+
+    def __geometry(self, tiles: torch.Tensor) -> torch.Tensor:
+        n, s = tiles.shape[0], tiles.shape[1]
+        flip = self.__rand(n) < self.flip
+        turns = torch.where(self.__rand(n) < self.rotate, torch.randint(1, 4, (n,), generator=self.generator), 0)
+
+        # Content bbox of every tile, then where flipping and rotating moves it.
+        occupied = tiles.any(dim=-1).bool().cpu()  # `any` keeps uint8 for uint8 inputs.
+        rows, cols = occupied.any(dim=2), occupied.any(dim=1)
+        y0, y1 = rows.int().argmax(dim=1), s - rows.flip(1).int().argmax(dim=1)
+        x0, x1 = cols.int().argmax(dim=1), s - cols.flip(1).int().argmax(dim=1)
+        x0, x1 = torch.where(flip, s - x1, x0), torch.where(flip, s - x0, x1)
+        for k in range(1, 4):
+            # One counter-clockwise turn maps rows [y0, y1) x cols [x0, x1) to rows [s - x1, s - x0) x cols [y0, y1).
+            turn = turns >= k
+            y0, y1, x0, x1 = (torch.where(turn, s - x1, y0), torch.where(turn, s - x0, y1),
+                              torch.where(turn, y0, x0), torch.where(turn, y1, x1))
+
+        # Uniform new position of the bbox inside the square (empty tiles stay put).
+        dy, dx = torch.zeros(n, dtype=torch.long), torch.zeros(n, dtype=torch.long)
+        if self.translate:
+            empty = ~rows.any(dim=1)
+            dy = torch.where(empty, 0, (self.__rand(n) * (s - (y1 - y0) + 1)).long() - y0)
+            dx = torch.where(empty, 0, (self.__rand(n) * (s - (x1 - x0) + 1)).long() - x0)
+
+        # Output pixel -> source pixel: undo the translation (a roll; only padding wraps around), the turns, the flip.
+        grid = torch.arange(s)
+        a = (grid[None, :, None] - dy[:, None, None]) % s
+        b = (grid[None, None, :] - dx[:, None, None]) % s
+        a, b = a.expand(n, s, s), b.expand(n, s, s)
+        t = turns[:, None, None]
+        src_y = torch.where(t == 0, a, torch.where(t == 1, b, torch.where(t == 2, s - 1 - a, s - 1 - b)))
+        src_x = torch.where(t == 0, b, torch.where(t == 1, s - 1 - a, torch.where(t == 2, s - 1 - b, a)))
+        src_x = torch.where(flip[:, None, None], s - 1 - src_x, src_x)
+
+        index = (torch.arange(n)[:, None, None] * s + src_y) * s + src_x
+        return tiles.reshape(n * s * s, -1)[index.to(tiles.device)].reshape(tiles.shape)
+
+    def __colors(self, tiles: torch.Tensor) -> torch.Tensor:
+        n = tiles.shape[0]
+        scale = 255.0 if tiles.dtype == torch.uint8 else 1.0
+        out = tiles.float() / scale if scale != 1.0 else tiles.clone()
+
+        swap = self.__rand(n) < self.palette_swap
+        permutation = _PERMUTATIONS[torch.where(swap, torch.randint(1, 6, (n,), generator=self.generator), 0)]
+        matrices = torch.eye(3)[permutation]  # out_rgb = matrices @ rgb
+        if self.hue:
+            angle = (self.__rand(n) * 2 - 1) * self.hue * 2 * math.pi
+            cos, sin = torch.cos(angle), torch.sin(angle)
+            rotation = torch.zeros(n, 3, 3)
+            rotation[:, 0, 0] = 1
+            rotation[:, 1, 1], rotation[:, 1, 2] = cos, -sin
+            rotation[:, 2, 1], rotation[:, 2, 2] = sin, cos
+            matrices = _FROM_YIQ @ rotation @ _TO_YIQ @ matrices
+        out[..., :3] = torch.einsum('nhwc,ndc->nhwd', out[..., :3], matrices.to(out.device)).clamp_(0, 1)
+
+        if self.alpha_jitter:
+            factor = 1 + (self.__rand(n) * 2 - 1) * self.alpha_jitter
+            alpha = out[..., 3]
+            visible = alpha > 0
+            # Visible pixels stay visible (at least one uint8 step).
+            jittered = (alpha * factor.to(out.device)[:, None, None]).clamp_(1 / 255, 1)
+            out[..., 3] = torch.where(visible, jittered, alpha)
+
+        if scale != 1.0:
+            return out.mul_(scale).round_().to(tiles.dtype)
+        return out
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from contextlib import nullcontext
+from pydantic import FilePath
+from typing import Iterator
+
+import random
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from ..extractors import DatasetManifest
+from ..image import ImageData, TilingCache
+from .TileShards import TileShards
+from .BucketBuffers import BucketBuffers, BUCKET_BYTES
+from .TileAugment import TileAugment
+
+class TileDataset(IterableDataset):
+    # Endless samples (like `ImageDataloader.generate_sample`) from files on disk alone, so every loader worker can open it.
+
+    def __init__(self, manifest: DatasetManifest | None, n_files: int = 128, shard_dir: FilePath | None = None, tiling_cache: FilePath | None = None,
+                 n_tiles: int = 4096, normalize: bool = True, seed: int | None = None, bucket_bytes: int = BUCKET_BYTES,
+                 augment: TileAugment | None = None):
+        super().__init__()
+        self.manifest = manifest
+        self.n_files = n_files  # Decode mode: images per sample.
+        self.shard_dir = shard_dir
+        self.tiling_cache = tiling_cache
+        self.n_tiles = n_tiles  # Shard mode: tiles per sample.
+        self.normalize = normalize
+        self.seed = seed
+        self.bucket_bytes = bucket_bytes
+        self.augment = augment
+        self.timer = None  # Anything with a `stage(name)` context manager; times the decode-mode stages.
+        self._passes = 0
+        self.__reset_state()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for key in ("_shards", "_buffers", "_cache", "_rng", "timer"):
+            state[key] = None
+        return state
+
+    def __reset_state(self) -> None:
+        self._shards: TileShards | None = None
+        self._buffers: BucketBuffers | None = None
+        self._cache: TilingCache | None = None
+        self._rng: np.random.Generator | None = None
+
+    def __iter__(self) -> Iterator[dict[str, torch.Tensor]]:
+        self.__open()
+        self._rng = self.__worker_rng()
+        # `square_placement` pads with the `random` module.
+        random.seed(int(self._rng.integers(1 << 63)))
+        if self.augment is not None:
+            self.augment.reseed(int(self._rng.integers(1 << 63)))
+        while True:
+            yield self.sample()
+
+    def sample(self, rng: np.random.Generator | None = None) -> dict[str, torch.Tensor]:
+        self.__open()
+        if rng is None:
+            if self._rng is None:
+                self._rng = np.random.default_rng(self.seed)
+            rng = self._rng
+        if self._shards is not None:
+            sample = {}
+            for bucket, n in self._shards.split(self.n_tiles).items():
+                tiles = self._shards.sample(bucket, n, rng)
+                if self.augment is not None:
+                    tiles = self.augment.augment(tiles)
+                sample[bucket] = tiles / 255 if self.normalize else tiles
+            return sample
+
+        stage = (lambda _: nullcontext()) if self.timer is None else self.timer.stage
+        self._buffers.reset()
+        with stage("sample"):
+            ids = self.manifest.sample(self.n_files, rng=rng)
+        for i in ids:
+            try:
+                with stage("decode"):
+                    image = ImageData(self.manifest.file(i), tiling_cache=self._cache)
+                    image.image  # Decoded on first access.
+                with stage("tiling"):
+                    tiling = image.tiling
+                with stage("pad"):
+                    self._buffers.add(image.tile_view(tiling), bbox=tiling.bbox)
+            except (OSError, ValueError, OverflowError, ZeroDivisionError):
+                continue
+        # The next sample refills the buffers while this one may still be queued; augmenting writes fresh tensors anyway.
+        with stage("to_tensor"):
+            if self.augment is not None:
+                return {f"{size}x{size}": self.augment.augment(tiles) for size, tiles in self._buffers.views(self.normalize).items()}
+            return {f"{size}x{size}": tiles for size, tiles in self._buffers.take(self.normalize).items()}
+
+    def __open(self) -> None:
+        if self._buffers is not None or self._shards is not None:
+            return
+        if self.shard_dir is not None:
+            self._shards = TileShards(self.shard_dir)
+            return
+        if self.manifest is None or not len(self.manifest):
+            raise ValueError("Decoding tiles needs a (non-empty) dataset manifest.")
+        self._cache = None if self.tiling_cache is None else TilingCache(self.tiling_cache)
+        # The float buffers are only for `views`, i.e. for augmenting; `take` normalizes into fresh tensors.
+        self._buffers = BucketBuffers(bucket_bytes=self.bucket_bytes, normalized=self.normalize and self.augment is not None)
+
+    def __worker_rng(self) -> np.random.Generator:
+        info = get_worker_info()
+        worker = 0 if info is None else info.id
+        self._passes += 1
+        # Pass counting needs `persistent_workers`; fresh workers would all start over at pass 1.
+        if self.seed is not None:
+            return np.random.default_rng([self.seed, worker, self._passes])
+        # A persistent worker keeps its torch seed for good, so the pass goes in too.
+        return np.random.default_rng([torch.initial_seed(), self._passes] if info is not None else None)
+
+    def loader(self, n_workers: int = 4, prefetch: int = 2, pin_memory: bool = True, **kwargs) -> DataLoader:
+        # Samples are already batched, so no collation; at most `n_workers * prefetch` of them wait at a time.
+        return DataLoader(
+            self, batch_size=None, num_workers=n_workers, prefetch_factor=prefetch if n_workers else None,
+            pin_memory=pin_memory and torch.cuda.is_available(), persistent_workers=n_workers > 0, **kwargs,
+        )
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from pydantic import FilePath
+from typing import List
+
+import json
+import os
+import numpy as np
+import torch
+
+from ..extractors import DatasetManifest, ExtractorBase
+from .BucketBatcher import BATCH_PIXELS
+from .IVFIndex import IVFIndex, Metric
+from .PixelEncoder import D_LATENT, PixelEncoder
+from .TileShards import TileShards
+
+class TileEmbeddings:
+    # On-disk layout of an embedding folder:
+    #   * embeddings.npy -> (N, D_LATENT) float32, one row per tile of the shards, bucket after bucket.
+    #   * ids.npy        -> global image id (see `DatasetManifest`/`ImageIndex`) of every row.
+    #   * index.json     -> the [start, end) rows of every bucket.
+    # Both arrays are memory-mapped; row numbers are what `IVFIndex` hands back from `search`.
+
+    def __init__(self, directory: FilePath):
+        self.directory = directory
+        with open(os.path.join(directory, "index.json")) as f:
+            self.buckets: dict[str, List[int]] = json.load(f)["buckets"]
+        self.embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode='r')
+        self.image_ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def entries(self, rows: np.ndarray, manifest: DatasetManifest) -> List[ExtractorBase.LabeledDataEntry | None]:
+        # Rows (e.g. `IVFIndex.search` results; -1 gives None) -> the image every tile came from.
+        return [None if row < 0 else ExtractorBase.LabeledDataEntry(manifest.file(self.image_ids[row]), manifest.metadata(self.image_ids[row]))
+                for row in np.asarray(rows).ravel()]
+
+    def build_index(self, n_lists: int | None = None, metric: Metric = 'cosine', n_probe: int = 8, chunk: int = 1 << 20) -> IVFIndex:
+        index = IVFIndex.train(self.embeddings, n_lists, metric, n_probe)
+        for start in range(0, len(self), chunk):
+            index.add(self.embeddings[start:start + chunk], np.arange(start, min(start + chunk, len(self))))
+        index.compact()
+        return index
+
+    @classmethod
+    def build(cls, shards: TileShards, encoder: PixelEncoder, directory: FilePath, device: str | torch.device = 'cpu',
+              batch_pixels: int = BATCH_PIXELS) -> TileEmbeddings:
+        # Encodes every tile of the shards once, batch by batch (`batch_pixels` pixels each), straight into the
+        # memory-mapped matrix; nothing but one batch is ever held in memory.
+        if os.path.exists(os.path.join(directory, "index.json")):
+            os.remove(os.path.join(directory, "index.json"))
+        os.makedirs(directory, exist_ok=True)
+        n = sum(shards.n_tiles(bucket) for bucket in shards.buckets)
+        embeddings = np.lib.format.open_memmap(os.path.join(directory, "embeddings.npy"), mode='w+', dtype=np.float32, shape=(n, D_LATENT))
+        ids = np.lib.format.open_memmap(os.path.join(directory, "ids.npy"), mode='w+', dtype=np.uint64, shape=(n,))
+
+        encoder = encoder.to(device).eval()
+        row, buckets = 0, {}
+        with torch.inference_mode():
+            for bucket in shards.buckets:
+                start = row
+                size = int(bucket.split('x')[0])
+                batch = max(1, batch_pixels // (size * size))
+                for i in range(len(shards.shards[bucket])):
+                    tiles = shards.shard(bucket, i)
+                    ids[row:row + len(tiles)] = shards.image_ids(bucket, i)
+                    for j in range(0, len(tiles), batch):
+                        encoded = encoder.encode({bucket: torch.from_numpy(tiles[j:j + batch])})[bucket]
+                        embeddings[row + j:row + j + len(encoded)] = encoded.cpu().numpy()
+                    row += len(tiles)
+                buckets[bucket] = [start, row]
+        embeddings.flush()
+        ids.flush()
+        del embeddings, ids
+
+        # index.json goes last; a folder without it is an unfinished export.
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump({"buckets": buckets, "dim": D_LATENT}, f)
+        return cls(directory)
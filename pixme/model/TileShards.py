@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pydantic import FilePath
+from typing import Iterator, List
+
+import json
+import os
+import warnings
+import numpy as np
+import torch
+
+from ..extractors import ImageIndex
+from ..image import ImageData, PaletteTiles, TilingCache
+
+SHARD_BYTES = 64 << 20  # Size of one shard (and of the per-bucket write buffer while building).
+TILE_CHUNK = 16  # Images per task when building with workers; every worker has at most 2 tasks queued or done ahead.
+
+class TileShards:
+    # <bucket>/shard_<i>.npy (+ .ids.npy; .colors/.offsets.npy for palette shards) and index.json, mapped copy-on-write.
+
+    def __init__(self, directory: FilePath):
+        self.directory = directory
+        with open(os.path.join(directory, "index.json")) as f:
+            header = json.load(f)
+        self.shards: dict[str, List[int]] = header["buckets"]
+        self.palette: bool = header.get("palette", False)
+        self._arrays: dict[tuple[str, int, str], np.ndarray] = {}
+        self._offsets = {bucket: np.concatenate([[0], np.cumsum(counts)]) for bucket, counts in self.shards.items()}
+
+    @property
+    def buckets(self) -> List[str]:
+        return list(self.shards.keys())
+
+    def n_tiles(self, bucket: str) -> int:
+        return int(self._offsets[bucket][-1]) if bucket in self._offsets else 0
+
+    def split(self, n: int) -> dict[str, int]:
+        # n tiles split across the non-empty buckets in proportion to their tile counts (at least 1 each).
+        buckets = [bucket for bucket in self.buckets if self.n_tiles(bucket)]
+        counts = np.array([self.n_tiles(bucket) for bucket in buckets])
+        return {bucket: max(1, round(n * count / counts.sum())) for bucket, count in zip(buckets, counts)}
+
+    def shard(self, bucket: str, i: int) -> np.ndarray:
+        # RGBA tiles of a shard (decoded, so a copy, for palette shards).
+        if self.palette:
+            return self.palette_shard(bucket, i).decode()
+        return self.__load(bucket, i, ".npy")
+
+    def palette_shard(self, bucket: str, i: int) -> PaletteTiles:
+        if not self.palette:
+            return PaletteTiles.encode(self.shard(bucket, i))
+        return PaletteTiles(self.__load(bucket, i, ".npy"), self.__load(bucket, i, ".colors.npy"), self.__load(bucket, i, ".offsets.npy"))
+
+    def __load(self, bucket: str, i: int, suffix: str) -> np.ndarray:
+        array = self._arrays.get((bucket, i, suffix))
+        if array is None:
+            array = np.load(self.__shard_file(self.directory, bucket, i, suffix), mmap_mode='c')
+            self._arrays[(bucket, i, suffix)] = array
+        return array
+
+    def image_ids(self, bucket: str, i: int) -> np.ndarray:
+        return np.load(self.__shard_file(self.directory, bucket, i, ".ids.npy"), mmap_mode='r')
+
+    def read(self, bucket: str, start: int, n: int) -> torch.Tensor:
+        # Tiles [start, start + n) of a bucket; zero-copy when they sit in a single (RGBA) shard.
+        offsets = self._offsets[bucket]
+        first = int(np.searchsorted(offsets, start, side='right')) - 1
+        last = int(np.searchsorted(offsets, start + max(n, 1) - 1, side='right')) - 1
+        parts = []
+        for i in range(first, last + 1):
+            lo = max(start - offsets[i], 0)
+            hi = min(start + n - offsets[i], offsets[i + 1] - offsets[i])
+            parts.append(self.palette_shard(bucket, i)[lo:hi].decode() if self.palette else self.shard(bucket, i)[lo:hi])
+        if len(parts) == 1:
+            return torch.from_numpy(parts[0])
+        return torch.from_numpy(np.concatenate(parts))
+
+    def sample(self, bucket: str, n: int, rng: np.random.Generator | None = None) -> torch.Tensor:
+        # A random run of tiles inside one shard (picked by size); the shards are shuffled, and a run is zero-copy.
+        i, start, n = self.__pick(bucket, n, rng)
+        if self.palette:
+            return torch.from_numpy(self.palette_shard(bucket, i)[start:start + n].decode())
+        return torch.from_numpy(self.shard(bucket, i)[start:start + n])
+
+    def sample_palette(self, bucket: str, n: int, rng: np.random.Generator | None = None) -> PaletteTiles:
+        # Same as `sample`, in palette form (views of the shard for palette shards, encoded otherwise).
+        i, start, n = self.__pick(bucket, n, rng)
+        if self.palette:
+            return self.palette_shard(bucket, i)[start:start + n]
+        return PaletteTiles.encode(self.shard(bucket, i)[start:start + n])
+
+    def __pick(self, bucket: str, n: int, rng: np.random.Generator | None) -> tuple[int, int, int]:
+        rng = np.random.default_rng() if rng is None else rng
+        counts = np.asarray(self.shards[bucket])
+        i = int(rng.choice(len(counts), p=counts / counts.sum()))
+        n = min(n, int(counts[i]))
+        return i, int(rng.integers(0, counts[i] - n + 1)), n
+
+    @staticmethod
+    def __shard_file(directory: FilePath, bucket: str, i: int, suffix: str = ".npy") -> FilePath:
+        return os.path.join(directory, bucket, f"shard_{i:05d}{suffix}")
+
+    # ===========================================================================
+    #                               BUILDING
+    # ===========================================================================
+
+    @classmethod
+    def build(cls, index: ImageIndex, directory: FilePath, tiling_cache: TilingCache | None = None, random_pad: bool = False,
+              n_workers: int = 1, seed: int = 0, shard_bytes: int = SHARD_BYTES, palette: bool = False) -> TileShards:
+        # Tiles every image of `index` once; a bucket is flushed as a shuffled shard every `shard_bytes` of RGBA tiles.
+        if os.path.exists(os.path.join(directory, "index.json")):
+            os.remove(os.path.join(directory, "index.json"))
+        os.makedirs(directory, exist_ok=True)
+        rng = np.random.default_rng(seed)
+        buffers: dict[str, list[tuple[np.ndarray, np.ndarray]]] = {}
+        buffered: dict[str, int] = {}
+        shards: dict[str, List[int]] = {}
+
+        def flush(bucket: str) -> None:
+            tiles = np.concatenate([tiles for tiles, _ in buffers[bucket]])
+            ids = np.concatenate([ids for _, ids in buffers[bucket]])
+            order = rng.permutation(len(tiles))
+            i = len(shards.setdefault(bucket, []))
+            os.makedirs(os.path.join(directory, bucket), exist_ok=True)
+            if palette:
+                encoded = PaletteTiles.encode(tiles[order])
+                np.save(cls.__shard_file(directory, bucket, i), encoded.indices)
+                np.save(cls.__shard_file(directory, bucket, i, ".colors.npy"), encoded.colors)
+                np.save(cls.__shard_file(directory, bucket, i, ".offsets.npy"), encoded.offsets)
+            else:
+                np.save(cls.__shard_file(directory, bucket, i), tiles[order])
+            np.save(cls.__shard_file(directory, bucket, i, ".ids.npy"), ids[order])
+            shards[bucket].append(len(tiles))
+            buffers[bucket], buffered[bucket] = [], 0
+
+        failed = 0
+        for image_id, tiles in _tile_images(index, tiling_cache, random_pad, n_workers):
+            if tiles is None or not len(tiles):
+                failed += 1
+                continue
+            bucket = f"{tiles.shape[1]}x{tiles.shape[2]}"
+            buffers.setdefault(bucket, []).append((tiles, np.full(len(tiles), image_id, dtype=np.uint64)))
+            buffered[bucket] = buffered.get(bucket, 0) + tiles.nbytes
+            if buffered[bucket] >= shard_bytes:
+                flush(bucket)
+        for bucket in list(buffers):
+            if buffered[bucket]:
+                flush(bucket)
+        if failed:
+            warnings.warn(f"Could not tile {failed} of {len(index)} images; they were left out of the shards.")
+
+        # index.json goes last; a folder without it is an unfinished build.
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump({
+                "buckets": {bucket: shards[bucket] for bucket in sorted(shards, key=lambda b: int(b.split('x')[0]))},
+                "palette": palette,
+            }, f)
+        return cls(directory)
+
+def _tile_images(index: ImageIndex, tiling_cache: TilingCache | None, random_pad: bool, n_workers: int) -> Iterator[tuple[int, np.ndarray | None]]:
+    # In id order either way, so a build is reproducible no matter how many workers it used.
+    paths = [index.path(i) for i in range(len(index))]
+    if n_workers <= 1:
+        results = (_tile_image(path, tiling_cache, random_pad) for path in paths)
+        yield from enumerate(results)
+        return
+    # Every worker opens the cache once, rather than every task pickling it (LRU included).
+    cache = None if tiling_cache is None else (tiling_cache.path, tiling_cache.capacity)
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(cache,)) as pool:
+        # `pool.map` would queue every image at once and let their tiles pile up while the shards get written.
+        starts = iter(range(0, len(paths), TILE_CHUNK))
+        submit = lambda start: pool.submit(_tile_worker_images, paths[start:start + TILE_CHUNK], random_pad)
+        pending = deque(submit(start) for _, start in zip(range(2 * n_workers), starts))
+        image_id = 0
+        while pending:
+            results = pending.popleft().result()
+            start = next(starts, None)
+            if start is not None:
+                pending.append(submit(start))
+            for tiles in results:
+                yield image_id, tiles
+                image_id += 1
+
+_worker_cache: TilingCache | None = None
+
+def _init_worker(cache: tuple[FilePath | None, int] | None) -> None:
+    global _worker_cache
+    _worker_cache = None if cache is None else TilingCache(*cache)
+
+def _tile_worker_images(paths: List[FilePath], random_pad: bool) -> List[np.ndarray | None]:
+    return [_tile_image(path, _worker_cache, random_pad) for path in paths]
+
+def _tile_image(path: FilePath, tiling_cache: TilingCache | None, random_pad: bool) -> np.ndarray | None:
+    try:
+        return ImageData(path, tiling_cache=tiling_cache).create_tiles(random_pad=random_pad)
+    except (OSError, ValueError, OverflowError, ZeroDivisionError):
+        return None
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from typing import Literal
+
+import math
+import torch
+from torch import nn
+
+# Interchangeable k x k convolutions; all of them pad by k//2 on every side, like the original conv.
+ConvBackend = Literal['dense', 'separable', 'fft', 'dilated']
+CONV_BACKENDS: tuple[ConvBackend, ...] = ('dense', 'separable', 'fft', 'dilated')
+
+def make_conv(backend: ConvBackend, channels: int, kernel: int) -> nn.Module:
+    if backend == 'dense':
+        return nn.Conv2d(channels, channels, kernel, padding=kernel // 2)
+    if backend == 'separable':
+        return SeparableConv2d(channels, kernel)
+    if backend == 'fft':
+        return FFTConv2d(channels, kernel)
+    if backend == 'dilated':
+        return DilatedConv2d(channels, kernel)
+    raise ValueError(f"Unknown conv backend `{backend}`; expected one of {CONV_BACKENDS}.")
+
+class SeparableConv2d(nn.Module):
+    def __init__(self, channels: int, kernel: int):
+        super().__init__()
+        self.depthwise = nn.Conv2d(channels, channels, kernel, padding=kernel // 2, groups=channels, bias=False)
+        self.pointwise = nn.Conv2d(channels, channels, 1)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.pointwise(self.depthwise(x))
+
+class DilatedConv2d(nn.Module):
+    # 3x3 convs with dilations 1, 2, 4, ... (no activation in between) until they see the whole k x k window.
+    def __init__(self, channels: int, kernel: int):
+        super().__init__()
+        dilations, field = [], 1
+        while field < kernel:
+            dilation = min(2 ** len(dilations), math.ceil((kernel - field) / 2))
+            dilations.append(dilation)
+            field += 2 * dilation
+        self.dilations = tuple(dilations)
+        self.layers = nn.Sequential(*[nn.Conv2d(channels, channels, 3, padding='same', dilation=d) for d in dilations])
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.layers(x)
+
+class FFTConv2d(nn.Module):
+    # Same parameters and output as the dense `nn.Conv2d`, as a product of spectra (X * conj(W), summed over channels).
+    def __init__(self, channels: int, kernel: int):
+        super().__init__()
+        reference = nn.Conv2d(channels, channels, kernel)
+        self.kernel = kernel
+        self.weight = nn.Parameter(reference.weight.detach().clone())
+        self.bias = nn.Parameter(reference.bias.detach().clone())
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        k = self.kernel
+        h, w = (s + 2 * (k // 2) - k + 1 for s in x.shape[-2:])
+        # No bf16/half FFTs on CPU (and only power of two sizes on GPU), so the spectra are always float32.
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            padded = nn.functional.pad(x.float(), (k // 2,) * 4)
+            size = padded.shape[-2:]
+            x_f = torch.fft.rfft2(padded, s=size)
+            w_f = torch.fft.rfft2(self.weight.float(), s=size)
+            y = torch.fft.irfft2(torch.einsum('bchw,ochw->bohw', x_f, w_f.conj()), s=size)[..., :h, :w]
+            y = y + self.bias.float()[:, None, None]
+        y = y.to(x.dtype)
+        if x.is_contiguous(memory_format=torch.channels_last):
+            return y.contiguous(memory_format=torch.channels_last)
+        return y
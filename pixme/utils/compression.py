@@ -0,0 +1,498 @@
+import io
+
+# ===========================================================================
+#                                 LZX
+# ===========================================================================
+# Port of the LZX decoder XNA uses for compressed .xnb files (same algorithm as libmspack/MonoGame's
+# `LzxDecoder`). XNB content always uses a 64Kb window and 32Kb output frames.
+
+LZX_MIN_MATCH = 2
+LZX_NUM_CHARS = 256
+LZX_BLOCKTYPE_VERBATIM = 1
+LZX_BLOCKTYPE_ALIGNED = 2
+LZX_BLOCKTYPE_UNCOMPRESSED = 3
+LZX_PRETREE_NUM_ELEMENTS = 20
+LZX_ALIGNED_NUM_ELEMENTS = 8
+LZX_NUM_PRIMARY_LENGTHS = 7
+LZX_NUM_SECONDARY_LENGTHS = 249
+
+LZX_PRETREE_MAXSYMBOLS = LZX_PRETREE_NUM_ELEMENTS
+LZX_PRETREE_TABLEBITS = 6
+LZX_MAINTREE_MAXSYMBOLS = LZX_NUM_CHARS + 50 * 8
+LZX_MAINTREE_TABLEBITS = 12
+LZX_LENGTH_MAXSYMBOLS = LZX_NUM_SECONDARY_LENGTHS + 1
+LZX_LENGTH_TABLEBITS = 12
+LZX_ALIGNED_MAXSYMBOLS = LZX_ALIGNED_NUM_ELEMENTS
+LZX_ALIGNED_TABLEBITS = 7
+
+LZX_FRAME_SIZE = 0x8000
+
+def _lzx_tables() -> tuple[list[int], list[int]]:
+    extra_bits = [0] * 52
+    j = 0
+    for i in range(0, 51, 2):
+        extra_bits[i] = extra_bits[i + 1] = j
+        if i != 0 and j < 17:
+            j += 1
+    position_base = [0] * 51
+    j = 0
+    for i in range(51):
+        position_base[i] = j
+        j += 1 << extra_bits[i]
+    return extra_bits, position_base
+
+LZX_EXTRA_BITS, LZX_POSITION_BASE = _lzx_tables()
+
+
+class LzxError(ValueError):
+    pass
+
+
+class _BitReader:
+    # LZX reads 16-bit little-endian words, and consumes the bits of each word MSB first.
+    __slots__ = ('data', 'pos', 'buffer', 'bits_left')
+
+    def __init__(self, data: bytes, pos: int):
+        self.data = data
+        self.pos = pos
+        self.buffer = 0
+        self.bits_left = 0
+
+    def reset(self) -> None:
+        self.buffer = 0
+        self.bits_left = 0
+
+    def ensure(self, bits: int) -> None:
+        while self.bits_left < bits:
+            word = self.data[self.pos:self.pos + 2]
+            self.pos += 2
+            # Reading past the end yields zeros; the caller decides whether those bits were used.
+            value = int.from_bytes(word.ljust(2, b'\x00'), 'little')
+            self.buffer |= value << (16 - self.bits_left)
+            self.bits_left += 16
+
+    def peek(self, bits: int) -> int:
+        return self.buffer >> (32 - bits)
+
+    def remove(self, bits: int) -> None:
+        self.buffer = (self.buffer << bits) & 0xFFFFFFFF
+        self.bits_left -= bits
+
+    def read(self, bits: int) -> int:
+        if bits == 0:
+            return 0
+        self.ensure(bits)
+        result = self.buffer >> (32 - bits)
+        self.buffer = (self.buffer << bits) & 0xFFFFFFFF
+        self.bits_left -= bits
+        return result
+
+
+class _HuffmanTable:
+    __slots__ = ('nsyms', 'nbits', 'lengths', 'table')
+
+    def __init__(self, nsyms: int, nbits: int):
+        self.nsyms = nsyms
+        self.nbits = nbits
+        self.lengths = [0] * (nsyms + 64)  # Zero-runs may overshoot the last symbol.
+        self.table = [0] * ((1 << nbits) + (nsyms << 1))
+
+    def build(self) -> None:
+        nsyms, nbits, lengths, table = self.nsyms, self.nbits, self.lengths, self.table
+        pos = 0
+        table_mask = 1 << nbits
+        bit_mask = table_mask >> 1
+        next_symbol = bit_mask
+
+        # Codes that fit in the direct lookup table.
+        bit_num = 1
+        while bit_num <= nbits:
+            for sym in range(nsyms):
+                if lengths[sym] != bit_num:
+                    continue
+                leaf = pos
+                pos += bit_mask
+                if pos > table_mask:
+                    raise LzxError("Huffman table overrun.")
+                for fill in range(leaf, pos):
+                    table[fill] = sym
+            bit_mask >>= 1
+            bit_num += 1
+
+        # Longer codes hang off the table as a binary tree.
+        if pos != table_mask:
+            for sym in range(pos, table_mask):
+                table[sym] = 0
+            pos <<= 16
+            table_mask <<= 16
+            bit_mask = 1 << 15
+            while bit_num <= 16:
+                for sym in range(nsyms):
+                    if lengths[sym] != bit_num:
+                        continue
+                    leaf = pos >> 16
+                    for fill in range(bit_num - nbits):
+                        if table[leaf] == 0:
+                            table[next_symbol << 1] = 0
+                            table[(next_symbol << 1) + 1] = 0
+                            table[leaf] = next_symbol
+                            next_symbol += 1
+                        leaf = table[leaf] << 1
+                        if (pos >> (15 - fill)) & 1:
+                            leaf += 1
+                    table[leaf] = sym
+                    pos += bit_mask
+                    if pos > table_mask:
+                        raise LzxError("Huffman table overrun.")
+                bit_mask >>= 1
+                bit_num += 1
+
+        if pos == table_mask:
+            return
+        # Either an erroneous table, or every length is 0 (which is fine).
+        if any(lengths[sym] for sym in range(nsyms)):
+            raise LzxError("Incomplete Huffman table.")
+
+    def read(self, bits: _BitReader) -> int:
+        bits.ensure(16)
+        i = self.table[bits.peek(self.nbits)]
+        if i >= self.nsyms:
+            j = 1 << (32 - self.nbits)
+            while True:
+                j >>= 1
+                if j == 0:
+                    raise LzxError("Invalid Huffman code.")
+                i = self.table[(i << 1) | (1 if bits.buffer & j else 0)]
+                if i < self.nsyms:
+                    break
+        bits.remove(self.lengths[i])
+        return i
+
+
+class LzxDecoder:
+    def __init__(self, window_bits: int = 16):
+        if window_bits < 15 or window_bits > 21:
+            raise LzxError(f"Unsupported LZX window size (2^{window_bits}).")
+        self.window_size = 1 << window_bits
+        self.window = bytearray(self.window_size)
+        if window_bits == 20:
+            posn_slots = 42
+        elif window_bits == 21:
+            posn_slots = 50
+        else:
+            posn_slots = window_bits << 1
+        self.main_elements = LZX_NUM_CHARS + (posn_slots << 3)
+
+        self.r0 = self.r1 = self.r2 = 1
+        self.header_read = False
+        self.frames_read = 0
+        self.block_remaining = 0
+        self.block_length = 0
+        self.block_type = 0
+        self.intel_filesize = 0
+        self.intel_curpos = 0
+        self.intel_started = False
+        self.window_posn = 0
+
+        self.pretree = _HuffmanTable(LZX_PRETREE_MAXSYMBOLS, LZX_PRETREE_TABLEBITS)
+        self.maintree = _HuffmanTable(LZX_MAINTREE_MAXSYMBOLS, LZX_MAINTREE_TABLEBITS)
+        self.length = _HuffmanTable(LZX_LENGTH_MAXSYMBOLS, LZX_LENGTH_TABLEBITS)
+        self.aligned = _HuffmanTable(LZX_ALIGNED_MAXSYMBOLS, LZX_ALIGNED_TABLEBITS)
+
+    def __read_lengths(self, bits: _BitReader, lengths: list[int], first: int, last: int) -> None:
+        for x in range(LZX_PRETREE_NUM_ELEMENTS):
+            self.pretree.lengths[x] = bits.read(4)
+        self.pretree.build()
+
+        x = first
+        while x < last:
+            z = self.pretree.read(bits)
+            if z == 17:
+                y = bits.read(4) + 4
+                lengths[x:x + y] = [0] * y
+                x += y
+            elif z == 18:
+                y = bits.read(5) + 20
+                lengths[x:x + y] = [0] * y
+                x += y
+            elif z == 19:
+                y = bits.read(1) + 4
+                z = self.pretree.read(bits)
+                z = lengths[x] - z
+                if z < 0:
+                    z += 17
+                lengths[x:x + y] = [z] * y
+                x += y
+            else:
+                z = lengths[x] - z
+                if z < 0:
+                    z += 17
+                lengths[x] = z
+                x += 1
+
+    def decompress(self, data: bytes, pos: int, in_len: int, out_len: int) -> bytes:
+        # Decodes one frame of `out_len` bytes out of `data[pos:pos + in_len]`.
+        bits = _BitReader(data, pos)
+        end_pos = pos + in_len
+        window, window_size = self.window, self.window_size
+        window_posn = self.window_posn
+        r0, r1, r2 = self.r0, self.r1, self.r2
+
+        if not self.header_read:
+            if bits.read(1):
+                high = bits.read(16)
+                low = bits.read(16)
+                self.intel_filesize = (high << 16) | low
+            self.header_read = True
+
+        togo = out_len
+        while togo > 0:
+            if self.block_remaining == 0:
+                if self.block_type == LZX_BLOCKTYPE_UNCOMPRESSED:
+                    if self.block_length & 1:
+                        bits.pos += 1  # Realign to 16 bits.
+                    bits.reset()
+
+                self.block_type = bits.read(3)
+                high = bits.read(16)
+                low = bits.read(8)
+                self.block_remaining = self.block_length = (high << 8) | low
+
+                if self.block_type == LZX_BLOCKTYPE_ALIGNED:
+                    for i in range(LZX_ALIGNED_NUM_ELEMENTS):
+                        self.aligned.lengths[i] = bits.read(3)
+                    self.aligned.build()
+                if self.block_type in (LZX_BLOCKTYPE_ALIGNED, LZX_BLOCKTYPE_VERBATIM):
+                    self.__read_lengths(bits, self.maintree.lengths, 0, 256)
+                    self.__read_lengths(bits, self.maintree.lengths, 256, self.main_elements)
+                    self.maintree.build()
+                    if self.maintree.lengths[0xE8] != 0:
+                        self.intel_started = True
+                    self.__read_lengths(bits, self.length.lengths, 0, LZX_NUM_SECONDARY_LENGTHS)
+                    self.length.build()
+                elif self.block_type == LZX_BLOCKTYPE_UNCOMPRESSED:
+                    self.intel_started = True
+                    bits.ensure(16)
+                    if bits.bits_left > 16:
+                        bits.pos -= 2
+                    r0 = int.from_bytes(data[bits.pos:bits.pos + 4], 'little')
+                    r1 = int.from_bytes(data[bits.pos + 4:bits.pos + 8], 'little')
+                    r2 = int.from_bytes(data[bits.pos + 8:bits.pos + 12], 'little')
+                    bits.pos += 12
+                elif self.block_type != LZX_BLOCKTYPE_ALIGNED:
+                    raise LzxError(f"Invalid LZX block type {self.block_type}.")
+
+            # Reading the trees may run a little past the end of the input; that's fine as long as
+            # none of those bits are actually used.
+            if bits.pos > end_pos:
+                if bits.pos > end_pos + 2 or bits.bits_left < 16:
+                    raise LzxError("LZX input ran out mid-block.")
+
+            while self.block_remaining > 0 and togo > 0:
+                this_run = min(self.block_remaining, togo)
+                togo -= this_run
+                self.block_remaining -= this_run
+                window_posn &= window_size - 1
+                if window_posn + this_run > window_size:
+                    raise LzxError("LZX frame crosses the window boundary.")
+
+                if self.block_type == LZX_BLOCKTYPE_UNCOMPRESSED:
+                    if bits.pos + this_run > end_pos:
+                        raise LzxError("LZX uncompressed block runs past the input.")
+                    window[window_posn:window_posn + this_run] = data[bits.pos:bits.pos + this_run]
+                    bits.pos += this_run
+                    window_posn += this_run
+                    continue
+
+                aligned = self.block_type == LZX_BLOCKTYPE_ALIGNED
+                while this_run > 0:
+                    main_element = self.maintree.read(bits)
+                    if main_element < LZX_NUM_CHARS:
+                        window[window_posn] = main_element
+                        window_posn += 1
+                        this_run -= 1
+                        continue
+
+                    main_element -= LZX_NUM_CHARS
+                    match_length = main_element & LZX_NUM_PRIMARY_LENGTHS
+                    if match_length == LZX_NUM_PRIMARY_LENGTHS:
+                        match_length += self.length.read(bits)
+                    match_length += LZX_MIN_MATCH
+
+                    match_offset = main_element >> 3
+                    if match_offset > 2:
+                        # Not a repeated offset.
+                        extra = LZX_EXTRA_BITS[match_offset]
+                        if not aligned:
+                            if match_offset != 3:
+                                match_offset = LZX_POSITION_BASE[match_offset] - 2 + bits.read(extra)
+                            else:
+                                match_offset = 1
+                        else:
+                            match_offset = LZX_POSITION_BASE[match_offset] - 2
+                            if extra > 3:
+                                match_offset += bits.read(extra - 3) << 3
+                                match_offset += self.aligned.read(bits)
+                            elif extra == 3:
+                                match_offset += self.aligned.read(bits)
+                            elif extra > 0:
+                                match_offset += bits.read(extra)
+                            else:
+                                match_offset = 1
+                        r2, r1, r0 = r1, r0, match_offset
+                    elif match_offset == 0:
+                        match_offset = r0
+                    elif match_offset == 1:
+                        match_offset = r1
+                        r1, r0 = r0, match_offset
+                    else:
+                        match_offset = r2
+                        r2, r0 = r0, match_offset
+
+                    if window_posn + match_length > window_size:
+                        raise LzxError("LZX match runs past the end of the window.")
+                    this_run -= match_length
+                    window_posn = self.__copy_match(window, window_size, window_posn, match_offset, match_length)
+
+                # Like MonoGame, a match may run past the end of the frame: the overrun comes out of the block,
+                # and the frame is the last `out_len` bytes decoded.
+                if this_run < 0:
+                    if -this_run > self.block_remaining:
+                        raise LzxError("LZX match runs past the end of the block.")
+                    self.block_remaining += this_run
+
+        if togo != 0:
+            raise LzxError("LZX frame did not decode to the expected size.")
+
+        start = window_posn if window_posn else window_size
+        start -= out_len
+        out = bytearray(window[start:start + out_len])
+
+        self.window_posn = window_posn
+        self.r0, self.r1, self.r2 = r0, r1, r2
+
+        self.__intel_e8(out)
+        return bytes(out)
+
+    @staticmethod
+    def __copy_match(window: bytearray, window_size: int, window_posn: int, match_offset: int, match_length: int) -> int:
+        dest = window_posn
+        if window_posn >= match_offset:
+            src = dest - match_offset
+        else:
+            # The source wraps around the end of the window.
+            src = dest + (window_size - match_offset)
+            copy_length = match_offset - window_posn
+            if copy_length < match_length:
+                window[dest:dest + copy_length] = window[src:src + copy_length]
+                dest += copy_length
+                match_length -= copy_length
+                src = 0
+
+        if dest - src >= match_length or src > dest:
+            window[dest:dest + match_length] = window[src:src + match_length]
+        else:
+            # Overlapping copy: the match repeats the last `dest - src` bytes.
+            period = window[src:dest]
+            repeats = -(-match_length // len(period))
+            window[dest:dest + match_length] = (period * repeats)[:match_length]
+        return dest + match_length
+
+    def __intel_e8(self, out: bytearray) -> None:
+        curpos = self.intel_curpos
+        self.intel_curpos += len(out)
+        self.frames_read += 1
+        if self.frames_read > 32768 or self.intel_filesize == 0 or len(out) <= 10 or not self.intel_started:
+            return
+
+        filesize = self.intel_filesize
+        i, data_end = 0, len(out) - 10
+        while i < data_end:
+            i = out.find(0xE8, i, data_end)
+            if i < 0:
+                break
+            abs_off = int.from_bytes(out[i + 1:i + 5], 'little', signed=True)
+            pos = curpos + i
+            if -pos <= abs_off < filesize:
+                rel_off = abs_off - pos if abs_off >= 0 else abs_off + filesize
+                out[i + 1:i + 5] = (rel_off & 0xFFFFFFFF).to_bytes(4, 'little')
+            i += 5
+
+
+def decompress_xnb_lzx(data: bytes, pos: int, compressed_size: int, decompressed_size: int) -> bytes:
+    # XNB wraps the LZX stream in frames: a big-endian u16 compressed size (32Kb output by default),
+    # or 0xFF + u16 output size + u16 compressed size for a frame with an explicit output size.
+    decoder = LzxDecoder(16)
+    out = io.BytesIO()
+    start = pos
+    while pos - start < compressed_size:
+        high, low = data[pos], data[pos + 1]
+        block_size = (high << 8) | low
+        frame_size = LZX_FRAME_SIZE
+        if high == 0xFF:
+            frame_size = (low << 8) | data[pos + 2]
+            block_size = (data[pos + 3] << 8) | data[pos + 4]
+            pos += 5
+        else:
+            pos += 2
+        if block_size == 0 or frame_size == 0:
+            break
+        out.write(decoder.decompress(data, pos, block_size, frame_size))
+        pos += block_size
+
+    result = out.getvalue()
+    if len(result) != decompressed_size:
+        raise LzxError(f"LZX stream decoded to {len(result)} bytes, expected {decompressed_size}.")
+    return result
+
+# ===========================================================================
+#                                 LZ4
+# ===========================================================================
+
+class Lz4Error(ValueError):
+    pass
+
+def decompress_lz4_block(data: bytes, decompressed_size: int) -> bytes:
+    out = bytearray()
+    pos, end = 0, len(data)
+    while pos < end:
+        token = data[pos]
+        pos += 1
+
+        literal_length = token >> 4
+        if literal_length == 15:
+            while True:
+                extra = data[pos]
+                pos += 1
+                literal_length += extra
+                if extra != 255:
+                    break
+        out += data[pos:pos + literal_length]
+        pos += literal_length
+        if pos >= end:
+            break  # The last sequence only has literals.
+
+        offset = data[pos] | (data[pos + 1] << 8)
+        pos += 2
+        if offset == 0 or offset > len(out):
+            raise Lz4Error("Invalid LZ4 match offset.")
+        match_length = token & 0x0F
+        if match_length == 15:
+            while True:
+                extra = data[pos]
+                pos += 1
+                match_length += extra
+                if extra != 255:
+                    break
+        match_length += 4
+
+        start = len(out) - offset
+        if offset >= match_length:
+            out += out[start:start + match_length]
+        else:
+            period = out[start:]
+            out += (period * (-(-match_length // offset)))[:match_length]
+
+    if len(out) != decompressed_size:
+        raise Lz4Error(f"LZ4 block decoded to {len(out)} bytes, expected {decompressed_size}.")
+    return bytes(out)
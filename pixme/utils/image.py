@@ -1,8 +1,10 @@
 import os
 import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import FilePath
 
-from .path import validate_folder
+from .path import validate_folder, link_file, LinkStrategy
 
 # ===========================================================================
 #                      IMAGE FILE PATH SHENANIGANS
@@ -11,7 +13,7 @@ from .path import validate_folder
 def is_image_file(filename: FilePath) -> bool:
     return filename.endswith('.png')
 
-def copy_images_recursively(top_folder: FilePath, copy_to: FilePath) -> None:
+def copy_images_recursively(top_folder: FilePath, copy_to: FilePath, strategy: LinkStrategy = 'auto') -> None:
     validate_folder(top_folder)
     validate_folder(copy_to)
 
@@ -20,4 +22,39 @@ def copy_images_recursively(top_folder: FilePath, copy_to: FilePath) -> None:
             if not is_image_file(file):
                 continue
             file = os.path.join(current_folder, file)
-            shutil.copy(file, copy_to)
+            link_file(file, copy_to, strategy)
+
+
+def extract_images_from_archive(archive: FilePath, copy_to: FilePath, prefix: str = '', n_workers: int = 1) -> int:
+    # Same flattened layout as `copy_images_recursively`, but the .png members are streamed straight
+    # out of the archive instead of extracting everything to disk first.
+    validate_folder(copy_to)
+
+    with zipfile.ZipFile(archive, 'r') as zf:
+        members = {}
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.startswith(prefix) or not is_image_file(info.filename):
+                continue
+            # Later members win on a name clash, just like the sequential copy would.
+            members[os.path.basename(info.filename)] = info
+        members = list(members.items())
+
+        if n_workers <= 1 or len(members) <= 1:
+            _write_archive_members(zf, members, copy_to)
+            return len(members)
+
+    # ZipFile handles aren't safe to share between threads, so each chunk opens its own.
+    chunks = [members[i::n_workers] for i in range(n_workers)]
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for future in [pool.submit(_write_archive_chunk, archive, chunk, copy_to) for chunk in chunks if chunk]:
+            future.result()
+    return len(members)
+
+def _write_archive_chunk(archive: FilePath, members: list[tuple[str, zipfile.ZipInfo]], copy_to: FilePath) -> None:
+    with zipfile.ZipFile(archive, 'r') as zf:
+        _write_archive_members(zf, members, copy_to)
+
+def _write_archive_members(zf: zipfile.ZipFile, members: list[tuple[str, zipfile.ZipInfo]], copy_to: FilePath) -> None:
+    for name, info in members:
+        with zf.open(info) as src, open(os.path.join(copy_to, name), 'wb') as dst:
+            shutil.copyfileobj(src, dst)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from pydantic import FilePath
+from typing import List
+
+import json
+import os
+
+from .path import generate_random_string, hash_file
+
+class FileManifest:
+    # Remembers which input files were already converted (and into what), so a rerun only redoes the changed ones.
+
+    def __init__(self, file: FilePath, version: str = ""):
+        self.file = file
+        self.version = version  # Identifies the converter; when it changes every file counts as changed.
+        self.entries: dict[str, dict] = {}
+        self._valid = True
+
+        if os.path.isfile(file):
+            try:
+                with open(file) as f:
+                    data = json.load(f)
+                self.entries = data.get("files", {})
+                self._valid = data.get("version") == version
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def keys(self) -> List[str]:
+        return list(self.entries.keys())
+
+    def outputs(self, key: str) -> List[str]:
+        entry = self.entries.get(key)
+        return [] if entry is None else entry["outputs"]
+
+    def is_current(self, key: str, path: FilePath) -> bool:
+        entry = self.entries.get(key)
+        if not self._valid or entry is None:
+            return False
+        stat = os.stat(path)
+        if entry["size"] != stat.st_size:
+            return False
+        if entry["mtime"] == stat.st_mtime_ns:
+            return True
+        # Only the mtime moved (a reinstall, a copy, ...); the content decides.
+        if entry["sha256"] != hash_file(path):
+            return False
+        entry["mtime"] = stat.st_mtime_ns
+        return True
+
+    def update(self, key: str, path: FilePath, outputs: List[str]) -> None:
+        stat = os.stat(path)
+        self.entries[key] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": hash_file(path), "outputs": outputs}
+
+    def remove(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.file)), exist_ok=True)
+        temp_file = f"{self.file}.{generate_random_string(8)}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump({"version": self.version, "files": self.entries}, f)
+        os.replace(temp_file, self.file)
+        self._valid = True
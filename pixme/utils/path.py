@@ -1,8 +1,15 @@
 import random
 import os
+import sys
 import shutil
+import hashlib
 
 from pydantic import FilePath
+from typing import Literal
+
+# `auto` tries a hardlink, then a reflink (copy-on-write clone), then falls back to a real copy.
+LinkStrategy = Literal['auto', 'hardlink', 'reflink', 'copy']
+FICLONE = 0x40049409  # linux/fs.h
 
 
 def generate_random_string(length: int = 50) -> str:
@@ -31,12 +38,65 @@ def validate_folder(folder: FilePath) -> None:
     if not os.path.exists(folder) or not os.path.isdir(folder):
         raise FileNotFoundError(f"Could not find folder `{folder}`.")
 
-def copy_entity(to_copy: FilePath, dest: FilePath) -> None:
+def copy_entity(to_copy: FilePath, dest: FilePath, strategy: LinkStrategy = 'auto') -> None:
     if not os.path.exists(to_copy):
         raise FileNotFoundError(f"Could not find file or directory `{to_copy}`.")
     if os.path.isdir(to_copy):
         tp_lvl = os.path.join(dest, os.path.split(to_copy)[1])
         os.makedirs(tp_lvl, exist_ok=True)
-        shutil.copytree(to_copy, tp_lvl, dirs_exist_ok=True)
+        shutil.copytree(to_copy, tp_lvl, dirs_exist_ok=True, copy_function=lambda src, dst: link_file(src, dst, strategy))
     elif os.path.isfile(to_copy):
-        shutil.copy(to_copy, dest)
+        link_file(to_copy, dest, strategy)
+
+def link_file(src: FilePath, dest: FilePath, strategy: LinkStrategy = 'auto') -> str:
+    # Drop-in for `shutil.copy` that avoids copying bytes when the filesystem allows it.
+    # Returns the strategy that was actually used ('same' when `dest` already is `src`, so nothing was done).
+    # Links share their data with `src`, so only use them for files that are never modified in place (which is all of ours).
+    if os.path.isdir(dest):
+        dest = os.path.join(dest, os.path.basename(src))
+    if os.path.exists(dest):
+        if os.path.samefile(src, dest):
+            return 'same'
+        os.remove(dest)  # `shutil.copy` overwrites, links don't.
+
+    if strategy in ('auto', 'hardlink'):
+        try:
+            os.link(src, dest)
+            return 'hardlink'
+        except OSError:
+            if strategy == 'hardlink':
+                raise
+    if strategy in ('auto', 'reflink'):
+        try:
+            _reflink(src, dest)
+            return 'reflink'
+        except OSError:
+            if strategy == 'reflink':
+                raise
+    shutil.copy(src, dest)
+    return 'copy'
+
+def _reflink(src: FilePath, dest: FilePath) -> None:
+    if sys.platform.startswith('linux'):
+        import fcntl
+        try:
+            with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+                fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            if os.path.exists(dest):
+                os.remove(dest)  # Don't leave an empty file behind for the fallback.
+            raise
+    elif sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dest), 0) != 0:
+            raise OSError(ctypes.get_errno(), f"Could not clone `{src}`.")
+    else:
+        raise OSError(f"Reflinks are not supported on `{sys.platform}`.")
+
+def hash_file(file: FilePath, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
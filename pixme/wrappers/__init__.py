@@ -1 +1,3 @@
-from .libpath import *
\ No newline at end of file
+from .libpath import *
+from .limits import create_tool_limits, set_tool_limits, get_tool_limits, tool_slot
+from .versions import get_tool_path, get_tool_version, get_tool_versions
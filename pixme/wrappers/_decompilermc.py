@@ -5,6 +5,7 @@ import zipfile
 
 from pydantic import FilePath
 from .libpath import get_lib_path
+from .limits import tool_slot
 from ..utils.path import get_file_from_extension, generate_temporary_folder_name, get_singleton_subfolder, copy_entity
 
 def decompile_minecraft(version: str = 'latest', copy_to: FilePath = '.', verbose: bool = True) -> bool:
@@ -12,7 +13,8 @@ def decompile_minecraft(version: str = 'latest', copy_to: FilePath = '.', verbos
         raise NotADirectoryError(f'Directory `{copy_to}` does not exist.')
     mc_path = os.path.join(get_lib_path(), 'DecompilerMC')
     if verbose: print(f'Decompiling and Extracting Minecraft (version: {version})...', end='')
-    p = subprocess.run(['python', os.path.join(mc_path, 'main.py'), '--mcversion', version, '-c', '-f'], stdout=subprocess.DEVNULL)
+    with tool_slot('decompilermc'):
+        p = subprocess.run(['python', os.path.join(mc_path, 'main.py'), '--mcversion', version, '-c', '-f'], stdout=subprocess.DEVNULL)
     if verbose: print(f' [Done]')
     src_path = os.path.join(mc_path, 'src')
 
@@ -1,8 +1,15 @@
 import subprocess
 import os
+import shutil
 
 from pydantic import FilePath
 from .libpath import get_lib_path
+from .limits import tool_slot
+from .batching import split_batches, scratch_folder, move_contents
+
+def _project_file(dll: FilePath, folder: FilePath) -> FilePath:
+    # ilspycmd -p names the project after the dll, and writes it once the whole project is decompiled.
+    return os.path.join(folder, os.path.splitext(os.path.basename(dll))[0] + '.csproj')
 
 def decompile_dll(dll: FilePath, copy_to: FilePath = '.', verbose: bool = True) -> bool:
     if not os.path.exists(copy_to) or not os.path.isdir(copy_to):
@@ -10,8 +17,48 @@ def decompile_dll(dll: FilePath, copy_to: FilePath = '.', verbose: bool = True)
     if not os.path.exists(dll) or not os.path.isfile(dll):
         raise FileNotFoundError(f'File `{dll}` does not exist.')
 
+    # `copy_to` may already hold other output (e.g. TML.Patcher's for tmods), so only ilspycmd's own project counts.
+    project = _project_file(dll, copy_to)
+    if os.path.exists(project):
+        os.remove(project)
+
     if verbose: print(f'Decompiling C# and .NET code of `{dll}`...', end='')
-    p = subprocess.run([os.path.join(get_lib_path(), 'ILSpyCMD', 'ilspycmd'), '--nested-directories', '-p', '-o', copy_to, os.path.abspath(dll)], stdout=subprocess.DEVNULL)
-    if verbose: print(f' [Done]')
-    if os.listdir(copy_to): return True
-    return False
+    with tool_slot('ilspycmd'):
+        p = subprocess.run([os.path.join(get_lib_path(), 'ILSpyCMD', 'ilspycmd'), '--nested-directories', '-p', '-o', copy_to, os.path.abspath(dll)], stdout=subprocess.DEVNULL)
+    if verbose: print(f' [Done]' if p.returncode == 0 else f' [Failed ({p.returncode})]')
+    return p.returncode == 0 and os.path.isfile(project)
+
+def decompile_dlls(dlls: dict[FilePath, FilePath], verbose: bool = True, retry: bool = True) -> dict[FilePath, bool]:
+    # Batch version of `decompile_dll`: one ilspycmd run per batch. With several inputs, ilspycmd puts every
+    # project in its own `<output>/<assembly name>` folder, which is then merged into that dll's `copy_to`.
+    for dll, copy_to in dlls.items():
+        if not os.path.exists(copy_to) or not os.path.isdir(copy_to):
+            raise NotADirectoryError(f'Directory `{copy_to}` does not exist.')
+        if not os.path.exists(dll) or not os.path.isfile(dll):
+            raise FileNotFoundError(f'File `{dll}` does not exist.')
+
+    results = {}
+    for batch in split_batches(list(dlls)):
+        if len(batch) == 1:
+            results[batch[0]] = decompile_dll(batch[0], dlls[batch[0]], verbose=verbose)
+            continue
+
+        scratch = scratch_folder(dlls[batch[0]])
+        try:
+            if verbose: print(f'Decompiling C# and .NET code of {len(batch)} assemblies...', end='')
+            with tool_slot('ilspycmd'):
+                p = subprocess.run([os.path.join(get_lib_path(), 'ILSpyCMD', 'ilspycmd'), '--nested-directories', '-p', '-o', scratch, *[os.path.abspath(dll) for dll in batch]], stdout=subprocess.DEVNULL)
+            if verbose: print(f' [Done]' if p.returncode == 0 else f' [Failed ({p.returncode})]')
+
+            for dll in batch:
+                output = os.path.join(scratch, os.path.splitext(os.path.basename(dll))[0])
+                # A failed run may have stopped halfway through an assembly; those (and everything else) get retried.
+                results[dll] = p.returncode == 0 and os.path.isfile(_project_file(dll, output)) and move_contents(output, dlls[dll])
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        if retry:
+            for dll in batch:
+                if not results[dll]:
+                    results[dll] = decompile_dll(dll, dlls[dll], verbose=verbose)
+    return results
@@ -2,62 +2,101 @@ import subprocess
 import os
 import shutil
 import warnings
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Type
 
 from pydantic import FilePath
 
 from .libpath import get_lib_path
-from ..utils.path import generate_random_string
+from .limits import tool_slot
+from .batching import scratch_folder
+from .versions import get_tool_version
+from ..image.XnbTexture import XnbTexture, XnbTypeError
+from ..utils.manifest import FileManifest
+from ..utils.path import LinkStrategy, link_file
 
-def decompile_xnbs(top: FilePath, copy_to: FilePath = '.', verbose: bool = True) -> bool:
-    overall_success = False
-    display_top = os.path.split(top)[1]
-    print('Decoding Terraria assets...')
+DECODER_VERSION = 1  # Bump whenever `decode_xnbs` would produce different pngs, so cached ones get redone.
+DECODE_BATCH_SIZE = 32
+
+# A batch result maps every .xnb (relative to `top`) to the files it produced (relative to the output
+# folder), or to an error message. An empty list means the .xnb simply isn't an image (sounds, fonts, ...).
+BatchResult = list[tuple[str, list[str] | str]]
+
+def decompile_xnbs(top: FilePath, copy_to: FilePath = '.', verbose: bool = True, n_workers: int | None = None, cache_dir: FilePath | None = None, strategy: LinkStrategy = 'auto') -> bool:
+    # TerrariaXNB2PNG writes its output next to its inputs (and litters its working directory), so every batch
+    # gets its own scratch folder with links to its .xnb files and runs from there. `top` is never written to,
+    # and the batches of every folder can run at the same time.
+    return _convert_xnbs(
+        top, copy_to, _decompile_xnbs, ThreadPoolExecutor, _folder_batches,
+        n_workers, verbose, cache_dir, f'terrariaxnb2png:{get_tool_version("terrariaxnb2png")}', (strategy,),
+    )
+
+def decode_xnbs(top: FilePath, copy_to: FilePath = '.', n_workers: int | None = None, verbose: bool = True, unpremultiply: bool = False, cache_dir: FilePath | None = None) -> bool:
+    # Native replacement for `decompile_xnbs`: same output layout (`copy_to` mirrors the folders inside `top`),
+    # but the textures are decoded in-process across a process pool.
+    return _convert_xnbs(
+        top, copy_to, _decode_xnbs, ProcessPoolExecutor, _sized_batches,
+        n_workers, verbose, cache_dir, f'native:{DECODER_VERSION}:{unpremultiply}', (unpremultiply,),
+    )
+
+def _convert_xnbs(top: FilePath, copy_to: FilePath, convert: Callable[..., BatchResult], executor_type: Type[Executor],
+                  make_batches: Callable[[list[str]], list[list[str]]], n_workers: int | None, verbose: bool,
+                  cache_dir: FilePath | None, version: str, extra: tuple) -> bool:
+    # Without `cache_dir`, everything gets converted straight into `copy_to`. With it, the pngs are kept in
+    # `cache_dir` along with a manifest of what they were made from; only new/changed .xnb files are converted,
+    # and the (up to date) cache is then linked into `copy_to`.
+    if not os.path.exists(copy_to) or not os.path.isdir(copy_to):
+        raise NotADirectoryError(f'Directory `{copy_to}` does not exist.')
+
+    xnbs = []
     for current_folder, _, files in os.walk(top):
-        xnbs = []
         for file in files:
-            if '.xnb' not in file:
+            if os.path.splitext(file)[1] == '.xnb':
+                xnbs.append(os.path.relpath(os.path.join(current_folder, file), top))
+    xnbs.sort()
+
+    out_root = copy_to if cache_dir is None else cache_dir
+    manifest = None if cache_dir is None else FileManifest(os.path.join(cache_dir, 'manifest.json'), version)
+    pending = xnbs if manifest is None else [xnb for xnb in xnbs if not manifest.is_current(xnb, os.path.join(top, xnb))]
+    if manifest is not None:
+        # Outputs are removed (not overwritten) since `copy_to` may hold hardlinks to them.
+        for xnb in set(pending) | (set(manifest.keys()) - set(xnbs)):
+            for output in manifest.outputs(xnb):
+                if os.path.isfile(os.path.join(cache_dir, output)):
+                    os.remove(os.path.join(cache_dir, output))
+            manifest.remove(xnb)
+
+    batches = make_batches(pending)
+    if verbose: print(f'Converting {len(pending)} of {len(xnbs)} .xnb files of `{top}` to .png...', end='')
+    n_workers = (os.cpu_count() or 1) if n_workers is None else n_workers
+    if n_workers <= 1 or len(batches) <= 1:
+        results = [convert(top, out_root, batch, *extra) for batch in batches]
+    else:
+        with executor_type(max_workers=n_workers) as pool:
+            n = len(batches)
+            results = list(pool.map(convert, [top] * n, [out_root] * n, batches, *[[arg] * n for arg in extra]))
+    if verbose: print(' [Done]')
+
+    outputs = {}
+    for result in results:
+        for xnb, produced in result:
+            if isinstance(produced, str):
+                warnings.warn(f'Could not convert {os.path.join(top, xnb)} from .xnb to .png: {produced}')
                 continue
-            xnbs.append(os.path.join(current_folder, file))
-        if xnbs:
-            display_current = _prune_path(display_top, current_folder)
-            os.makedirs(os.path.join(copy_to, display_current), exist_ok=True)
-            if verbose: print(f'    Decoding .xnb to .png (Terraria asset) of `{current_folder}`...', end='')
-            success = _decompile_xnbs(xnbs, os.path.join(copy_to, display_current))
-            if verbose: print(f' [Done]')
-            if not success:
-                warnings.warn(f'Could not convert {current_folder} from .xnb to .png')
-            else:
-                overall_success = True
-
-    temp_name = generate_random_string()
-    curr_top = os.path.join(copy_to, display_top)
-    temp_top = os.path.join(copy_to, temp_name)
-    os.rename(curr_top, temp_top)
-    for file in os.listdir(temp_top):
-        shutil.move(os.path.join(temp_top, file), copy_to)
-    os.rmdir(temp_top)
-
-    return overall_success
-
-def _prune_path(start: str, current: str) -> str:
-    current = _splitall(current)
-    current = current[current.index(start):]
-    return os.path.join(*current)
-
-def _splitall(path):
-    allparts = []
-    while 1:
-        parts = os.path.split(path)
-        if parts[0] == path:  # sentinel for absolute paths
-            allparts.insert(0, parts[0])
-            break
-        elif parts[1] == path: # sentinel for relative paths
-            allparts.insert(0, parts[1])
-            break
-        else:
-            path = parts[0]
-            allparts.insert(0, parts[1])
-    return allparts
+            outputs[xnb] = produced
+            if manifest is not None:
+                manifest.update(xnb, os.path.join(top, xnb), produced)
+
+    if manifest is None:
+        return any(outputs.values())
+    manifest.save()
+    linked = False
+    for xnb in manifest.keys():
+        for output in manifest.outputs(xnb):
+            os.makedirs(os.path.dirname(os.path.join(copy_to, output)), exist_ok=True)
+            link_file(os.path.join(cache_dir, output), os.path.join(copy_to, output))
+            linked = True
+    return linked
 
 def _split_files(paths: list[str], max_size: int = 28000) -> list[list[str]]:
     out = []
@@ -74,28 +113,67 @@ def _split_files(paths: list[str], max_size: int = 28000) -> list[list[str]]:
         out.append(bus)
     return out
 
-def _decompile_xnbs(xnbs: list[str], copy_to: FilePath = '.') -> bool:
-    if not os.path.exists(copy_to) or not os.path.isdir(copy_to):
-        raise NotADirectoryError(f'Directory `{copy_to}` does not exist.')
+def _folder_batches(xnbs: list[str]) -> list[list[str]]:
+    # TerrariaXNB2PNG outputs are matched back by file name, so a batch never spans two folders.
+    folders: dict[str, list[str]] = {}
+    for xnb in xnbs:
+        folders.setdefault(os.path.dirname(xnb), []).append(xnb)
+    return [batch for folder in folders.values() for batch in _split_files(folder)]
+
+def _sized_batches(xnbs: list[str]) -> list[list[str]]:
+    return [xnbs[i:i + DECODE_BATCH_SIZE] for i in range(0, len(xnbs), DECODE_BATCH_SIZE)]
+
+def _decompile_xnbs(top: FilePath, out_root: FilePath, xnbs: list[str], strategy: LinkStrategy = 'auto') -> BatchResult:
+    folder = os.path.dirname(xnbs[0])
+    copy_to = os.path.join(out_root, folder)
+    scratch = scratch_folder(os.path.join(copy_to, os.path.basename(xnbs[0])))
+    try:
+        stems = {}
+        for xnb in xnbs:
+            link_file(os.path.join(top, xnb), os.path.join(scratch, os.path.basename(xnb)), strategy)
+            stems[os.path.splitext(os.path.basename(xnb))[0]] = xnb
+
+        with tool_slot('terrariaxnb2png'):
+            p = subprocess.run([os.path.join(os.path.abspath(get_lib_path()), 'TerrariaXNB2PNG'), *[os.path.basename(xnb) for xnb in xnbs]], cwd=scratch, stdout=subprocess.DEVNULL)
+
+        outputs = {xnb: [] for xnb in xnbs}
+        for file in os.listdir(scratch):
+            if os.path.splitext(file)[1] == '.xnb' or not os.path.splitext(file)[1]:
+                continue
+            # Outputs are named after their .xnb (possibly with a suffix); the longest matching name wins.
+            matches = [stem for stem in stems if file.startswith(stem)]
+            if not matches:
+                continue
+            os.replace(os.path.join(scratch, file), os.path.join(copy_to, file))
+            outputs[stems[max(matches, key=len)]].append(os.path.join(folder, file))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if p.returncode == 0:
+        return list(outputs.items())
+    # After a crash, "no output" can't be told apart from "not an image", so those are errors (and get retried next time).
+    return [(xnb, produced if produced else f'TerrariaXNB2PNG exited with code {p.returncode}') for xnb, produced in outputs.items()]
+
+def _decode_xnbs(top: FilePath, out_root: FilePath, xnbs: list[str], unpremultiply: bool = False) -> BatchResult:
+    results = []
     for xnb in xnbs:
-        if not os.path.exists(xnb) or not os.path.isfile(xnb):
-            raise FileNotFoundError(f'File `{xnb}` does not exist.')
-
-    split_xnbs = _split_files(xnbs)
-    for sxnbs in split_xnbs:
-        p = subprocess.run([os.path.join(get_lib_path(), 'TerrariaXNB2PNG'), *sxnbs], stdout=subprocess.DEVNULL)
-    for file in os.listdir(get_lib_path()):
-        if os.path.splitext(file)[1] == '.xnb': os.remove(os.path.join(get_lib_path(), file))
-    names = [os.path.split(os.path.splitext(xnb)[0])[1] for xnb in xnbs]
-    parent_dirs = list(set(os.path.dirname(xnb) for xnb in xnbs))
-    files = [os.path.join(pdir, file) for pdir in parent_dirs for file in os.listdir(pdir) if any([name in file and '.xnb' not in file and os.path.splitext(file)[1] for name in names])]
-    if not files: return False
-
-    for file in files:
-        try:
-            shutil.copy(file, copy_to)
-            os.remove(file)
-        except PermissionError:
-            warnings.warn(f'Could not copy {file} to {copy_to}.')
-            continue
+        output = os.path.splitext(xnb)[0] + '.png'
+        os.makedirs(os.path.dirname(os.path.join(out_root, output)), exist_ok=True)
+        result = _decode_xnb(os.path.join(top, xnb), os.path.join(out_root, output), unpremultiply)
+        if result is True:
+            results.append((xnb, [output]))
+        elif result is None:
+            results.append((xnb, []))
+        else:
+            results.append((xnb, result))
+    return results
+
+def _decode_xnb(src: FilePath, dest: FilePath, unpremultiply: bool = False) -> bool | str | None:
+    # True when decoded, None for .xnb files that aren't textures (fonts, effects, ...), the error otherwise.
+    try:
+        XnbTexture(src, unpremultiply=unpremultiply).save(dest)
+    except XnbTypeError:
+        return None
+    except (OSError, ValueError, IndexError) as e:
+        return str(e)
     return True
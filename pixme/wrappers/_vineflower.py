@@ -1,8 +1,11 @@
 import subprocess
 import os
+import shutil
 
 from pydantic import FilePath
 from .libpath import get_lib_path
+from .limits import tool_slot
+from .batching import split_batches, scratch_folder
 
 def decompile_jar(jar: FilePath, copy_to: FilePath = '.', verbose: bool = True) -> bool:
     if not os.path.exists(copy_to) or not os.path.isdir(copy_to):
@@ -10,7 +13,50 @@ def decompile_jar(jar: FilePath, copy_to: FilePath = '.', verbose: bool = True)
     if not os.path.exists(jar) or not os.path.isfile(jar):
         raise FileNotFoundError(f'File `{jar}` does not exist.')
     if verbose: print(f'Decompiling .jar and .java code of `{jar}`...', end='')
-    p = subprocess.run(['java', '-jar', os.path.join(get_lib_path(), 'vineflower-1.11.1.jar'), jar, copy_to], stdout=subprocess.DEVNULL)
+    with tool_slot('vineflower'):
+        p = subprocess.run(['java', '-jar', os.path.join(get_lib_path(), 'vineflower-1.11.1.jar'), jar, copy_to], stdout=subprocess.DEVNULL)
     if verbose: print(' [Done]')
     if os.listdir(copy_to): return True
     return False
+
+def decompile_jars(jars: dict[FilePath, FilePath], verbose: bool = True, retry: bool = True) -> dict[FilePath, bool]:
+    # Batch version of `decompile_jar`: maps every jar to its own `copy_to`, but starts one JVM per batch
+    # instead of one per jar. Vineflower writes one output per input (named after it) into a scratch folder,
+    # which is then moved to the right `copy_to`, so a failure is still pinned on the jar that caused it.
+    for jar, copy_to in jars.items():
+        if not os.path.exists(copy_to) or not os.path.isdir(copy_to):
+            raise NotADirectoryError(f'Directory `{copy_to}` does not exist.')
+        if not os.path.exists(jar) or not os.path.isfile(jar):
+            raise FileNotFoundError(f'File `{jar}` does not exist.')
+
+    results = {}
+    for batch in split_batches(list(jars)):
+        if len(batch) == 1:
+            results[batch[0]] = decompile_jar(batch[0], jars[batch[0]], verbose=verbose)
+            continue
+
+        scratch = scratch_folder(jars[batch[0]])
+        try:
+            if verbose: print(f'Decompiling .jar and .java code of {len(batch)} jars...', end='')
+            with tool_slot('vineflower'):
+                p = subprocess.run(['java', '-jar', os.path.join(get_lib_path(), 'vineflower-1.11.1.jar'), *batch, scratch], stdout=subprocess.DEVNULL)
+            if verbose: print(' [Done]')
+
+            outputs = {}
+            for entry in os.listdir(scratch):
+                outputs.setdefault(os.path.splitext(entry)[0].lower(), []).append(entry)
+            for jar in batch:
+                moved = False
+                for entry in outputs.get(os.path.splitext(os.path.basename(jar))[0].lower(), []):
+                    shutil.move(os.path.join(scratch, entry), os.path.join(jars[jar], entry))
+                    moved = True
+                results[jar] = moved
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        # A jar that crashed the whole JVM takes the rest of its batch down with it; give those their own run.
+        if retry:
+            for jar in batch:
+                if not results[jar]:
+                    results[jar] = decompile_jar(jar, jars[jar], verbose=verbose)
+    return results
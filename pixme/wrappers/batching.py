@@ -0,0 +1,48 @@
+import os
+import shutil
+
+from pydantic import FilePath
+
+from ..utils.path import generate_temporary_folder_name
+
+def split_batches(paths: list[FilePath], max_size: int = 28000) -> list[list[FilePath]]:
+    # Keeps every command line under the Windows limit, and never puts two inputs with the same
+    # file name in one batch, since the tools name their per-input output after it.
+    batches, names, sizes = [], [], []
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0].lower()
+        for i, batch in enumerate(batches):
+            if name not in names[i] and sizes[i] + len(path) <= max_size:
+                break
+        else:
+            batches.append([])
+            names.append(set())
+            sizes.append(0)
+            i = len(batches) - 1
+        batches[i].append(path)
+        names[i].add(name)
+        sizes[i] += len(path) + 1
+    return batches
+
+def scratch_folder(near: FilePath) -> FilePath:
+    # Next to the final destination, so moving the outputs out of it is a rename.
+    folder = os.path.join(os.path.dirname(os.path.abspath(near)), generate_temporary_folder_name())
+    os.makedirs(folder)
+    return folder
+
+def move_contents(src: FilePath, dest: FilePath) -> bool:
+    # Merges `src` into `dest`; returns whether anything was moved.
+    moved = False
+    os.makedirs(dest, exist_ok=True)
+    for entry in os.listdir(src):
+        src_entry, dest_entry = os.path.join(src, entry), os.path.join(dest, entry)
+        if os.path.isdir(src_entry) and os.path.isdir(dest_entry):
+            moved = move_contents(src_entry, dest_entry) or moved
+            continue
+        if os.path.isdir(dest_entry):
+            shutil.rmtree(dest_entry)
+        elif os.path.exists(dest_entry):
+            os.remove(dest_entry)
+        shutil.move(src_entry, dest_entry)
+        moved = True
+    return moved
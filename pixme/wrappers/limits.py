@@ -0,0 +1,32 @@
+import contextlib
+import multiprocessing
+from typing import Literal
+
+Tools = Literal['vineflower', 'ilspycmd', 'tml_patcher', 'terrariaxnb2png', 'decompilermc']
+
+TOOL_SEMAPHORES: dict[str, object] = {}
+
+def create_tool_limits(limits: dict[Tools, int], context=None) -> dict[Tools, object]:
+    # Semaphores have to be created before the worker processes are, so they can be handed over on spawn.
+    context = multiprocessing.get_context() if context is None else context
+    for tool, limit in limits.items():
+        if limit < 1:
+            raise ValueError(f'Tool limit for `{tool}` must be at least 1, got {limit}.')
+    return {tool: context.BoundedSemaphore(limit) for tool, limit in limits.items()}
+
+def set_tool_limits(semaphores: dict[Tools, object]) -> None:
+    global TOOL_SEMAPHORES
+    TOOL_SEMAPHORES = dict(semaphores)
+
+def get_tool_limits() -> dict[Tools, object]:
+    global TOOL_SEMAPHORES
+    return TOOL_SEMAPHORES
+
+@contextlib.contextmanager
+def tool_slot(tool: Tools):
+    semaphore = TOOL_SEMAPHORES.get(tool)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
@@ -1,3 +1,3 @@
-from ._ilspycmd import decompile_dll
+from ._ilspycmd import decompile_dll, decompile_dlls
 from ._tmlpatcher import decompile_tmod
-from ._terrariaxnb2png import decompile_xnbs
+from ._terrariaxnb2png import decompile_xnbs, decode_xnbs
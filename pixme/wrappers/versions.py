@@ -0,0 +1,30 @@
+import os
+from pydantic import FilePath
+
+from .libpath import get_lib_path
+from .limits import Tools
+
+TOOL_PATHS: dict[Tools, tuple[str, ...]] = {
+    'vineflower': ('vineflower-1.11.1.jar',),
+    'ilspycmd': ('ILSpyCMD', 'ilspycmd'),
+    'tml_patcher': ('TML.Patcher', 'TML.Patcher.exe'),
+    'terrariaxnb2png': ('TerrariaXNB2PNG',),
+    'decompilermc': ('DecompilerMC', 'main.py'),
+}
+
+def get_tool_path(tool: Tools) -> FilePath:
+    path = os.path.join(get_lib_path(), *TOOL_PATHS[tool])
+    if not os.path.exists(path) and os.path.exists(path + '.exe'):
+        return path + '.exe'
+    return path
+
+def get_tool_version(tool: Tools) -> str:
+    # None of these tools report a version in a consistent way, so the executable itself is fingerprinted.
+    path = get_tool_path(tool)
+    if not os.path.isfile(path):
+        return 'missing'
+    stat = os.stat(path)
+    return f'{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+def get_tool_versions(tools: tuple[Tools, ...]) -> dict[Tools, str]:
+    return {tool: get_tool_version(tool) for tool in tools}
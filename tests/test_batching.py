@@ -0,0 +1,72 @@
+import os
+import subprocess
+
+import pytest
+
+from pixme.wrappers import _ilspycmd, _vineflower
+from pixme.wrappers.batching import split_batches
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    # Stands in for the decompilers: every input writes its output, except those named `crash*`, which take a batch
+    # run down with them (but decompile fine on their own).
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        if args[0] == 'java':
+            inputs, out = args[3:-1], args[-1]
+            ok = len(inputs) == 1 or not any(os.path.basename(jar).startswith('crash') for jar in inputs)
+            for jar in inputs:
+                if ok or not os.path.basename(jar).startswith('crash'):
+                    open(os.path.join(out, os.path.splitext(os.path.basename(jar))[0] + '.java'), 'w').close()
+            return subprocess.CompletedProcess(args, 0)
+
+        out, inputs = args[args.index('-o') + 1], args[args.index('-o') + 2:]
+        crashed = len(inputs) > 1 and any(os.path.basename(dll).startswith('crash') for dll in inputs)
+        for dll in inputs:
+            name = os.path.splitext(os.path.basename(dll))[0]
+            folder = out if len(inputs) == 1 else os.path.join(out, name)
+            os.makedirs(folder, exist_ok=True)
+            open(os.path.join(folder, 'Program.cs'), 'w').close()
+            if not crashed or dll != inputs[-1]:
+                open(os.path.join(folder, name + '.csproj'), 'w').close()
+        return subprocess.CompletedProcess(args, 1 if crashed else 0)
+
+    monkeypatch.setattr(subprocess, 'run', run)
+    return calls
+
+def make_inputs(tmp_path, names):
+    inputs = {}
+    for name in names:
+        (tmp_path / name).write_bytes(b'')
+        os.makedirs(tmp_path / 'out' / name)
+        inputs[str(tmp_path / name)] = str(tmp_path / 'out' / name)
+    return inputs
+
+def test_split_batches():
+    assert split_batches(['a/x.jar', 'b/X.jar', 'c/y.jar']) == [['a/x.jar', 'c/y.jar'], ['b/X.jar']]
+    assert split_batches(['a.jar', 'b.jar', 'c.jar'], max_size=12) == [['a.jar', 'b.jar'], ['c.jar']]
+
+def test_decompile_jars_retry(tmp_path, runs):
+    jars = make_inputs(tmp_path, ['a.jar', 'crash.jar', 'b.jar'])
+    assert _vineflower.decompile_jars(jars, verbose=False) == dict.fromkeys(jars, True)
+    # One batch run, then only the jar that came out empty on its own.
+    assert len(runs) == 2 and runs[1][3] == str(tmp_path / 'crash.jar')
+    for jar, out in jars.items():
+        assert os.listdir(out) == [os.path.splitext(os.path.basename(jar))[0] + '.java']
+
+    runs.clear()
+    (tmp_path / 'again').mkdir()
+    jars = make_inputs(tmp_path / 'again', ['crash.jar', 'c.jar'])
+    assert list(_vineflower.decompile_jars(jars, verbose=False, retry=False).values()) == [False, True]
+    assert len(runs) == 1
+
+def test_decompile_dlls_retry(tmp_path, runs):
+    # A failed batch run counts against every dll in it, even those that left a project behind.
+    dlls = make_inputs(tmp_path, ['a.dll', 'crash.dll'])
+    assert _ilspycmd.decompile_dlls(dlls, verbose=False) == dict.fromkeys(dlls, True)
+    assert [run[-1] for run in runs[1:]] == [os.path.abspath(dll) for dll in dlls]
+    for dll, out in dlls.items():
+        assert sorted(os.listdir(out)) == ['Program.cs', os.path.splitext(os.path.basename(dll))[0] + '.csproj']
@@ -0,0 +1,79 @@
+import random
+
+import numpy as np
+import pytest
+import torch
+
+from pixme.benchmarks.pipeline import synthetic_manifest
+from pixme.image.ImageData import MAX_TILE_SIZE, content_bbox, pad_to_power_of_two_square, split_tiles, square_placement
+from pixme.model.Dataloader import ImageDataloader
+from pixme.model.BucketBuffers import BucketBuffers
+
+
+def random_tiles(rng, t_y, t_x, h, w):
+    # Sprites with an empty border, an empty row and column inside, and some fully empty tiles.
+    tiles = rng.integers(0, 256, (t_y, t_x, h, w, 4), dtype=np.uint8)
+    tiles[:, :, :1] = 0
+    tiles[:, :, :, -2:] = 0
+    tiles[:, :, h // 2] = 0
+    tiles[:, :, :, w // 3] = 0
+    empty = rng.random((t_y, t_x)) < 0.3
+    empty[0, 0] = False
+    tiles[empty] = 0
+    return tiles
+
+def test_square_placement():
+    assert square_placement(5, 12, random_pad=False) == (16, 0, 0, 5, 12, 0, 0)
+    assert square_placement(MAX_TILE_SIZE + 40, 3, random_pad=False) == (MAX_TILE_SIZE, 0, 0, MAX_TILE_SIZE, 3, 0, 0)
+    random.seed(0)
+    for _ in range(100):
+        h, w = random.randint(1, 300), random.randint(1, 300)
+        size, off_y, off_x, crop_h, crop_w, pad_y, pad_x = square_placement(h, w)
+        assert size == min(MAX_TILE_SIZE, 2 ** int(np.ceil(np.log2(max(crop_h, crop_w)))))
+        assert (crop_h, crop_w) == (min(h, MAX_TILE_SIZE), min(w, MAX_TILE_SIZE))
+        assert off_y + crop_h <= h and off_x + crop_w <= w
+        assert pad_y + crop_h <= size and pad_x + crop_w <= size
+
+@pytest.mark.parametrize("random_pad", [False, True])
+def test_add_matches_pad(random_pad):
+    rng = np.random.default_rng(0)
+    buffers = BucketBuffers(capacity={16: 2, 32: 2, 64: 2})  # Small enough to have to grow.
+    expected = {16: [], 32: [], 64: []}
+    for t_y, t_x, h, w in [(2, 3, 12, 9), (1, 1, 30, 30), (4, 2, 16, 16), (1, 3, 40, 17), (3, 3, 12, 12)]:
+        tiles = random_tiles(rng, t_y, t_x, h, w)
+        image = tiles.transpose(0, 2, 1, 3, 4).reshape(t_y * h, t_x * w, 4)
+        bbox = content_bbox(split_tiles(image, t_y, t_x))
+        random.seed(t_y * 100 + h)
+        padded = pad_to_power_of_two_square(split_tiles(image, t_y, t_x), random_pad, bbox=bbox)
+        random.seed(t_y * 100 + h)
+        assert buffers.add(tiles, random_pad, bbox=bbox) == len(padded)
+        expected[padded.shape[1]].append(padded)
+    for size, tiles in buffers.views().items():
+        np.testing.assert_array_equal(tiles.numpy(), np.concatenate(expected[size]) if expected[size] else np.zeros((0, size, size, 4)))
+
+def test_take():
+    buffers = BucketBuffers(capacity={16: 64}, normalized=False)
+    buffers.add(np.full((3, 16, 16, 4), 7, dtype=np.uint8))
+    views, taken = buffers.views(), buffers.take()
+    assert views[16].data_ptr() == buffers.tiles[16].data_ptr()
+    # Just the filled part, in memory of its own.
+    assert taken[16].shape == (3, 16, 16, 4) and taken[16].untyped_storage().nbytes() == taken[16].nbytes
+    buffers.reset()
+    buffers.add(np.full((3, 16, 16, 4), 9, dtype=np.uint8))
+    assert (taken[16] == 7).all() and (views[16] == 9).all()
+    assert torch.equal(buffers.take(normalize=True)[16], torch.full((3, 16, 16, 4), 9 / 255))
+
+def test_generate_sample(tmp_path):
+    manifest = synthetic_manifest(tmp_path, 8, 64)
+    loader = ImageDataloader(str(tmp_path / "data"), manifest=manifest, seed=0)
+    loader.N_FILES_PER_SAMPLE = 4
+    kept = loader.generate_sample()
+    kept_copy = {k: v.clone() for k, v in kept.items()}
+    loader.generate_sample()
+    # Samples are the caller's to keep; only `reuse_buffers` hands out views that the next call overwrites.
+    assert any(len(v) for v in kept.values())
+    assert all(torch.equal(kept[k], kept_copy[k]) for k in kept)
+    reused = loader.generate_sample(reuse_buffers=True)
+    pointers = {k: v.data_ptr() for k, v in reused.items() if len(v)}
+    again = loader.generate_sample(reuse_buffers=True)
+    assert pointers and all(again[k].data_ptr() == pointer for k, pointer in pointers.items())
@@ -0,0 +1,39 @@
+import warnings
+
+import pytest
+import torch
+
+from pixme.model.PixelEncoder import D_KERNEL, Conv2DDownsampler
+from pixme.model.convolutions import CONV_BACKENDS, FFTConv2d, make_conv
+
+
+@pytest.mark.parametrize("kernel", [D_KERNEL, 5])
+def test_dense_pads_symmetrically(kernel):
+    torch.manual_seed(0)
+    conv = make_conv('dense', 3, kernel)
+    x = torch.rand((2, 3, 20, 20))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # `padding='same'` warns (and copies the input) for even kernels.
+        y = conv(x)
+    # k//2 on every side: an even kernel grows the output by one row and column.
+    size = 20 + 1 - kernel % 2
+    assert y.shape == (2, 3, size, size)
+    expected = torch.nn.functional.conv2d(torch.nn.functional.pad(x, (kernel // 2,) * 4), conv.weight, conv.bias)
+    torch.testing.assert_close(y, expected)
+
+@pytest.mark.parametrize("kernel", [D_KERNEL, 5])
+def test_fft_matches_dense(kernel):
+    torch.manual_seed(0)
+    fft = FFTConv2d(4, kernel)
+    dense = make_conv('dense', 4, kernel)
+    dense.weight.data.copy_(fft.weight.data)
+    dense.bias.data.copy_(fft.bias.data)
+    x = torch.rand((2, 4, 24, 24))
+    with torch.no_grad():
+        torch.testing.assert_close(fft(x), dense(x), atol=1e-5, rtol=1e-5)
+
+@pytest.mark.parametrize("backend", CONV_BACKENDS)
+def test_stage_shapes(backend):
+    downsampler = Conv2DDownsampler(Conv2DDownsampler.Config(d_in=32, d_latent=4, d_kernel=D_KERNEL, f_downsample=2, backend=backend))
+    with torch.no_grad():
+        assert downsampler(torch.rand((2, 4, 32, 32))).shape == (2, 4, 16, 16)
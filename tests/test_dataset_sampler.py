@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from pixme.extractors.DatasetSampler import DatasetSampler
+
+SIZES = np.array([100, 0, 300, 600])
+
+
+def test_uniform_over_images():
+    sampler = DatasetSampler(SIZES, seed=0)
+    ids = sampler.sample(200_000)
+    assert ids.min() >= 0 and ids.max() < 1000
+    counts = np.bincount(np.searchsorted(sampler.partitions, ids, side='right') - 1, minlength=4)
+    np.testing.assert_allclose(counts / len(ids), SIZES / SIZES.sum(), atol=0.01)
+
+def test_weights_and_balanced():
+    sampler = DatasetSampler(SIZES, weights=[1, 1, 0, 1], balanced=True, seed=0)
+    extractors = sampler.sample_extractors(200_000)
+    counts = np.bincount(extractors, minlength=4)
+    assert counts[1] == counts[2] == 0
+    np.testing.assert_allclose(counts[[0, 3]] / len(extractors), 0.5, atol=0.01)
+
+    ids = sampler.sample(10_000)
+    assert not np.any((ids >= 100) & (ids < 400))  # Extractor 2 has weight 0.
+
+def test_without_replacement():
+    sampler = DatasetSampler(SIZES, weights=[2, 1, 0, 1], seed=0)
+    ids = sampler.sample(400, replace=False)
+    assert len(np.unique(ids)) == 400
+    assert not np.any((ids >= 100) & (ids < 400))
+    with pytest.raises(ValueError):
+        sampler.sample(1001, replace=False)
+    # Only 700 images have a non-zero weight.
+    assert len(np.unique(sampler.sample(700, replace=False))) == 700
+    with pytest.raises(ValueError):
+        sampler.sample(701, replace=False)
+
+    uniform = DatasetSampler(SIZES, seed=0)
+    assert len(np.unique(uniform.sample(1000, replace=False))) == 1000
+
+def test_epochs():
+    sampler = DatasetSampler(SIZES, weights=[2, 1, 0, 1], seed=3)
+    first = sampler.epoch(0)
+    # Every image that can be drawn, exactly once.
+    np.testing.assert_array_equal(np.sort(first), np.r_[0:100, 400:1000])
+    np.testing.assert_array_equal(DatasetSampler(SIZES, weights=[2, 1, 0, 1], seed=3).epoch(0), first)
+    assert not np.array_equal(sampler.epoch(1), first)
+    assert len(sampler.epoch(0, replace=True)) == 1000
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        DatasetSampler(SIZES, weights=[1, 1])
+    with pytest.raises(ValueError):
+        DatasetSampler(SIZES, weights=[1, 1, -1, 1])
+    with pytest.raises(ValueError):
+        DatasetSampler(np.array([0, 0]))
+    with pytest.raises(ValueError):
+        DatasetSampler(SIZES, weights=[0, 1, 0, 0])
@@ -0,0 +1,115 @@
+import os
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixme.extractors import ExtractorBase, ZipExtractor
+from pixme.extractors.ExtractionCache import ExtractionCache
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # Every test starts from an empty set of registered extractors.
+    monkeypatch.setattr(ExtractorBase, "registered_extractors", {})
+    monkeypatch.setattr(ExtractorBase, "banned_extractors", set())
+    monkeypatch.setattr(ExtractorBase, "total_size", 0)
+    monkeypatch.setattr(ExtractorBase, "partitions", [0])
+    monkeypatch.setattr(ExtractorBase, "sampler", None)
+    monkeypatch.setattr(ExtractorBase, "JSON_WARNED", True)  # None of these archives has json.
+
+@pytest.fixture
+def extractions(monkeypatch):
+    # Counts the archives that actually got extracted.
+    calls = []
+    extract_files = ZipExtractor._extract_files
+    monkeypatch.setattr(ZipExtractor, "_extract_files", lambda self: (calls.append(self._file), extract_files(self))[1])
+    return calls
+
+def make_zip(file, n_images=5, seed=0):
+    rng = np.random.default_rng(seed)
+    with zipfile.ZipFile(file, 'w') as zf:
+        for i in range(n_images):
+            path = file.parent / f"{i}.png"
+            Image.fromarray(rng.integers(0, 256, (16, 16, 4), dtype=np.uint8)).save(path)
+            zf.write(path, f"assets/{i}.png")
+            os.remove(path)
+        zf.writestr("readme.txt", "not an image")
+    return file
+
+def reregister():
+    ExtractorBase.registered_extractors.clear()
+    ExtractorBase.total_size, ExtractorBase.partitions = 0, [0]
+
+def test_lookup(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    image_dir = tmp_path / "image" / "a"
+    os.makedirs(image_dir)
+    (image_dir / "0.png").write_bytes(b"png")
+    key = cache.make_key({"file": "abc", "tools": {}})
+    assert cache.lookup(key) is None
+
+    cache.store(key, "a", image_dir)
+    assert os.path.samefile(cache.lookup(key), image_dir)
+    assert cache.lookup(cache.make_key({"file": "abd", "tools": {}})) is None
+
+    # The id got re-extracted from another archive: the old key is stale.
+    cache.store(cache.make_key({"file": "abd", "tools": {}}), "a", image_dir)
+    assert cache.lookup(key) is None
+
+def test_lookup_missing_and_empty_output(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    image_dir = tmp_path / "image" / "a"
+    os.makedirs(image_dir)
+    (image_dir / "0.png").write_bytes(b"png")
+    cache.store("k", "a", image_dir)
+    os.remove(image_dir / "0.png")
+    assert cache.lookup("k") is None  # The images it recorded are gone.
+
+    # An archive without images is recorded as such, and stays a hit.
+    cache.store("k", "a", image_dir)
+    assert cache.lookup("k") is not None
+    cache.invalidate("a")
+    assert cache.lookup("k") is None
+
+def test_extractor_skips_unchanged_archive(tmp_path, registry, extractions):
+    archive = make_zip(tmp_path / "mod.zip")
+    outdir = tmp_path / "data"
+    os.makedirs(outdir)
+
+    assert not ZipExtractor.is_cached(archive, outdir)
+    assert len(ZipExtractor(archive, outdir)) == 5
+    assert ZipExtractor.is_cached(archive, outdir)
+    reregister()
+    assert len(ZipExtractor(archive, outdir)) == 5
+    assert extractions == [archive]
+
+    # New content under the same name: the fingerprint changes, so it's extracted again.
+    make_zip(archive, n_images=6, seed=1)
+    reregister()
+    assert len(ZipExtractor(archive, outdir)) == 6
+    assert extractions == [archive, archive]
+
+def test_extractor_tool_versions_invalidate(tmp_path, registry, extractions, monkeypatch):
+    archive = make_zip(tmp_path / "mod.zip")
+    outdir = tmp_path / "data"
+    os.makedirs(outdir)
+    ZipExtractor(archive, outdir)
+    reregister()
+    monkeypatch.setattr(ZipExtractor, "_cache_signature", classmethod(
+        lambda cls, file: {**ExtractorBase._cache_signature.__func__(cls, file), "tools": {"vineflower": "2.0"}}))
+    ZipExtractor(archive, outdir)
+    assert extractions == [archive, archive]
+
+def test_extractor_renamed_archive(tmp_path, registry, extractions):
+    # Identical content under a new name reuses the images already on disk.
+    archive = make_zip(tmp_path / "mod.zip")
+    outdir = tmp_path / "data"
+    os.makedirs(outdir)
+    ZipExtractor(archive, outdir)
+    renamed = tmp_path / "mod-1.0.zip"
+    os.replace(archive, renamed)
+    assert len(ZipExtractor(renamed, outdir)) == 5
+    assert extractions == [archive]
+    assert sorted(os.listdir(outdir / "image" / "mod-1.0")) == sorted(os.listdir(outdir / "image" / "mod"))
@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixme.extractors.ImageIndex import ImageIndex
+
+
+@pytest.fixture
+def folders(tmp_path):
+    image_dir, json_dir = tmp_path / "image", tmp_path / "json"
+    os.makedirs(image_dir)
+    os.makedirs(json_dir)
+    for i, size in enumerate([(8, 8), (16, 4), (4, 32)]):
+        Image.new('RGBA', size).save(image_dir / f"{i}.png")
+    (image_dir / "notes.txt").write_text("not an image")
+    (json_dir / "1.json").write_text(json.dumps({"name": "one"}))
+    return image_dir, json_dir
+
+@pytest.fixture
+def header_reads(monkeypatch):
+    # Names of the images whose header actually got read.
+    reads = []
+    read = ImageIndex._ImageIndex__read_dimensions
+    monkeypatch.setattr(ImageIndex, "_ImageIndex__read_dimensions", staticmethod(lambda file: (reads.append(os.path.basename(file)), read(file))[1]))
+    return reads
+
+def test_build_and_load(tmp_path, folders):
+    image_dir, json_dir = folders
+    index = ImageIndex.load_or_build(tmp_path / "index", "a", image_dir, json_dir)
+    assert [index.name(i) for i in range(len(index))] == ["0.png", "1.png", "2.png"]
+    assert [(int(r['width']), int(r['height'])) for r in index.records] == [(8, 8), (16, 4), (4, 32)]
+    assert index.metadata(1) == {"name": "one"} and index.metadata(0) == {}
+    np.testing.assert_array_equal(index.has_metadata(), [False, True, False])
+
+    loaded = ImageIndex.load(tmp_path / "index")
+    assert os.path.samefile(loaded.path(2), image_dir / "2.png")
+    assert loaded.metadata(1) == {"name": "one"}
+
+def test_unchanged_folder_is_reused(tmp_path, folders, header_reads):
+    image_dir, json_dir = folders
+    ImageIndex.load_or_build(tmp_path / "index", "a", image_dir, json_dir)
+    assert len(header_reads) == 3
+    ImageIndex.load_or_build(tmp_path / "index", "a", image_dir, json_dir)
+    assert len(header_reads) == 3
+
+def test_incremental_rebuild(tmp_path, folders, header_reads):
+    image_dir, json_dir = folders
+    ImageIndex.load_or_build(tmp_path / "index", "a", image_dir, json_dir)
+    Image.new('RGBA', (2, 2)).save(image_dir / "3.png")
+    index = ImageIndex.load_or_build(tmp_path / "index", "a", image_dir, json_dir)
+    # Only the new image gets its header read; the others keep their records.
+    assert header_reads[3:] == ["3.png"]
+    assert len(index) == 4 and (int(index.records[3]['width']), int(index.records[3]['height'])) == (2, 2)
+
+    os.remove(image_dir / "0.png")
+    index = ImageIndex.load_or_build(tmp_path / "index", "a", image_dir, json_dir)
+    assert [index.name(i) for i in range(len(index))] == ["1.png", "2.png", "3.png"]
+    assert header_reads[4:] == []
+
+def test_overwritten_image_is_detected(tmp_path, folders, header_reads):
+    image_dir, json_dir = folders
+    ImageIndex.load_or_build(tmp_path / "index", "a", image_dir, json_dir)
+    mtime = os.stat(image_dir).st_mtime_ns
+    # Rewriting a file in place leaves the folder's mtime alone.
+    with open(image_dir / "1.png", "wb") as f:
+        Image.new('RGBA', (64, 2), (255, 0, 0, 255)).save(f, format='png')
+    os.utime(image_dir, ns=(mtime, mtime))
+    index = ImageIndex.load_or_build(tmp_path / "index", "a", image_dir, json_dir)
+    assert header_reads[3:] == ["1.png"]
+    assert (int(index.records[1]['width']), int(index.records[1]['height'])) == (64, 2)
+
+def test_concatenate(tmp_path, folders):
+    image_dir, json_dir = folders
+    a = ImageIndex.build("a", image_dir, json_dir)
+    b = ImageIndex.build("b", image_dir)
+    merged = ImageIndex.concatenate([a, b])
+    assert merged.extractors == ["a", "b"]
+    np.testing.assert_array_equal(merged.partitions, [0, 3, 6])
+    assert merged.name(4) == "1.png" and merged.metadata(1) == {"name": "one"} and merged.metadata(4) == {}
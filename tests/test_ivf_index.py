@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from pixme.model.IVFIndex import IVFIndex
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(16, 32)) * 4
+    return (centers[rng.integers(0, 16, 2000)] + rng.normal(size=(2000, 32))).astype(np.float32)
+
+def exact(vectors, queries, k):
+    d = ((queries[:, None] - vectors[None]) ** 2).sum(-1)
+    return np.argsort(d, axis=1)[:, :k]
+
+@pytest.mark.parametrize("metric", ['l2', 'cosine'])
+def test_search_all_lists_is_exact(vectors, metric):
+    index = IVFIndex.train(vectors, n_lists=8, metric=metric)
+    index.add(vectors, ids=np.arange(len(vectors)) + 10)
+    queries = vectors[:20]
+    _, ids = index.search(queries, k=5, n_probe=index.n_lists)
+    if metric == 'cosine':
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = vectors[:20]
+    np.testing.assert_array_equal(ids, exact(vectors, queries, 5) + 10)
+
+def test_save_load(tmp_path, vectors):
+    index = IVFIndex.train(vectors, n_lists=8, n_probe=3)
+    index.add(vectors[:1500])
+    index.add(vectors[1500:])  # Pending overflow chunks get compacted by `save`.
+    queries = vectors[::97]
+    expected = index.search(queries, k=4)
+
+    assert IVFIndex.load(tmp_path / "index") is None
+    index.save(tmp_path / "index")
+    loaded = IVFIndex.load(tmp_path / "index")
+    assert (len(loaded), loaded.n_lists, loaded.dim, loaded.n_probe, loaded.metric) == (2000, 8, 32, 3, 'l2')
+    assert isinstance(loaded.vectors, np.memmap)
+    for a, b in zip(loaded.search(queries, k=4), expected):
+        np.testing.assert_array_equal(a, b)
+
+def test_save_over_own_memmap(tmp_path, vectors):
+    # `load(path).save(path)` with the arrays mapped from the files being replaced.
+    index = IVFIndex.train(vectors, n_lists=8)
+    index.add(vectors)
+    index.save(tmp_path)
+    expected = index.search(vectors[:10], k=3)
+    index = IVFIndex.load(tmp_path)
+    assert isinstance(index.vectors, np.memmap)
+    index.save(tmp_path)
+    for a, b in zip(index.search(vectors[:10], k=3), expected):
+        np.testing.assert_array_equal(a, b)
+    index.add(vectors[:100] + 100)  # Far from every query below.
+    index.save(tmp_path)
+    reloaded = IVFIndex.load(tmp_path)
+    assert len(reloaded) == 2100
+    for a, b in zip(reloaded.search(vectors[:10], k=3), expected):
+        np.testing.assert_array_equal(a, b)
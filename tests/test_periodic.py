@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixme.benchmarks.synthetic import SheetSpec, random_spec, sprite_sheet
+from pixme.image.ImageData import ImageData, alpha_mask, detect_periodic
+
+# (t_y, t_x) that the original detector (a full fft per channel, scipy's convolve for the alpha mask) rounded the
+# synthetic sheets of `test_default_tilings` to, by size.
+BASELINE_TILINGS = {
+    64: [(1, 1), (1, 1), (4, 1), (1, 4), (1, 1), (4, 1), (4, 1), (1, 1), (4, 4), (4, 1),
+         (1, 1), (4, 4), (1, 1), (4, 1), (1, 1), (2, 1), (4, 1), (4, 1), (4, 1), (4, 4)],
+    128: [(4, 1), (4, 1), (4, 8), (4, 4), (4, 1), (4, 4), (8, 1), (4, 4), (4, 4), (4, 4),
+          (1, 1), (4, 1), (4, 4), (1, 1), (4, 4), (4, 1), (4, 4), (1, 4), (4, 8), (1, 1)],
+    256: [(4, 4), (1, 1), (1, 16), (8, 4), (8, 8), (4, 8), (1, 16), (8, 8), (1, 8), (8, 1),
+          (4, 4), (4, 1), (4, 4), (16, 1), (4, 1), (4, 1), (4, 4), (4, 8), (1, 1), (4, 1)],
+}
+# Its spectra were only symmetric up to rounding; this sheet's horizontal peaks tie at the percentile cutoff.
+TIE_BREAKS = {(128, 5): (4, 1)}
+
+def test_default_tilings(tmp_path):
+    for size, expected in BASELINE_TILINGS.items():
+        rng = np.random.default_rng([0, size])
+        for i, tiling in enumerate(expected):
+            file = tmp_path / f"{size}_{i}.png"
+            Image.fromarray(sprite_sheet(random_spec(rng, size), rng)).save(file)
+            detected = ImageData(file).analyze_tiling()
+            assert (detected.t_y, detected.t_x) == TIE_BREAKS.get((size, i), tiling), file.name
+
+def test_spectrum():
+    spec = SheetSpec(t_y=4, t_x=8, tile=16, margin=2, noise=0.0, translucent=0.0, empty=0.0, n_colors=8)
+    sheet = sprite_sheet(spec, np.random.default_rng(1))
+    blue = detect_periodic(sheet[None])
+    np.testing.assert_array_equal(detect_periodic(sheet[None], spectrum='rgb'), blue)
+
+    # Only the blue channel counts by default, so a sheet without any blue has no period.
+    sheet[..., 2] = 0
+    np.testing.assert_array_equal(detect_periodic(sheet[None]), [[0, 0]])
+    np.testing.assert_array_equal(detect_periodic(sheet[None], spectrum='rgb'), blue)
+
+    with pytest.raises(ValueError):
+        detect_periodic(sheet[None], spectrum='grey')
+
+def test_batches():
+    # Stacks go through in chunks, and lists are grouped by shape; either way every image gets its own period.
+    rng = np.random.default_rng(2)
+    images = [sprite_sheet(random_spec(rng, size), rng) for size in (64, 128, 64, 128, 64)]
+    single = np.concatenate([detect_periodic(image[None]) for image in images])
+    np.testing.assert_array_equal(detect_periodic(images, batch_size=2), single)
+
+@pytest.mark.parametrize("shape", [(1, 1), (5, 200), (64, 64), (97, 131), (3, 40, 70)])
+def test_alpha_mask(shape):
+    # The summed-area table has to reproduce scipy's uint8 convolution exactly, right at the threshold too: a few
+    # opaque pixels per 64x64 window is about what it takes to reach a (truncated) mean of 1.
+    rng = np.random.default_rng(shape)
+    for density in (0.002, 0.004, 0.01, 0.1):
+        alpha = np.where(rng.random(shape) < density, rng.integers(1, 256, shape), 0).astype(np.uint8)
+        mask = alpha_mask(alpha, 'sat')
+        np.testing.assert_array_equal(mask, alpha_mask(alpha, 'convolve'))
+    full = np.full(shape, 255, dtype=np.uint8)
+    np.testing.assert_array_equal(alpha_mask(full), np.ones(shape))
+
+    with pytest.raises(ValueError):
+        alpha_mask(full, 'blur')
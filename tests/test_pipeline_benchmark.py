@@ -0,0 +1,15 @@
+from pixme.benchmarks.pipeline import run, synthetic_manifest
+
+
+def test_run_with_empty_buckets(tmp_path):
+    # 128px sheets never fill the 256x256 bucket, which used to crash `PixelEncoder.encode`.
+    manifest = synthetic_manifest(tmp_path, 4, 128)
+    result = run(manifest, iterations=2, n_files=4, warmup=0, autocast=False)
+    assert result["tiles"] > 0
+    assert {"sample", "decode", "tiling", "pad", "to_tensor", "encode"} <= set(result["stages_ms"])
+
+def test_run_with_tiling_cache(tmp_path):
+    manifest = synthetic_manifest(tmp_path, 4, 128)
+    result = run(manifest, iterations=2, n_files=4, warmup=1, encode=False, tiling_cache=True)
+    assert result["tiles"] > 0
+    assert result["stages_ms"]["encode"]["mean"] == 0.0
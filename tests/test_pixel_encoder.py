@@ -0,0 +1,54 @@
+import pytest
+import torch
+
+from pixme.model.BucketBuffers import BucketBuffers
+from pixme.model.PixelEncoder import D_LATENT, PixelEncoder
+
+
+@pytest.fixture(scope="module")
+def encoder():
+    torch.manual_seed(0)
+    encoder = PixelEncoder().eval()
+    encoder.AUTOCAST = False  # Exact comparisons below.
+    return encoder
+
+def test_encode_skips_empty_buckets(encoder):
+    # A larger bucket being empty used to leave a (0, D, 256, 256) batch that the next bucket couldn't join.
+    sample = {
+        '256x256': torch.zeros((0, 256, 256, 4)),
+        '128x128': torch.rand((1, 128, 128, 4)),
+        '64x64': torch.zeros((0, 64, 64, 4)),
+        '16x16': torch.rand((3, 16, 16, 4)),
+    }
+    with torch.inference_mode():
+        out = encoder.encode(sample)
+    assert {bucket: tuple(e.shape) for bucket, e in out.items()} == {
+        '256x256': (0, D_LATENT), '128x128': (1, D_LATENT), '64x64': (0, D_LATENT), '16x16': (3, D_LATENT),
+    }
+
+    with torch.inference_mode():
+        alone = encoder.encode({bucket: tiles for bucket, tiles in sample.items() if len(tiles)})
+    for bucket, embeddings in alone.items():
+        torch.testing.assert_close(out[bucket], embeddings)
+
+def test_encode_all_empty(encoder):
+    with torch.inference_mode():
+        out = encoder.encode({'32x32': torch.zeros((0, 32, 32, 4)), '16x16': torch.zeros((0, 16, 16, 4), dtype=torch.uint8)})
+    assert {bucket: tuple(e.shape) for bucket, e in out.items()} == {'32x32': (0, D_LATENT), '16x16': (0, D_LATENT)}
+    assert encoder.encode({}) == {}
+
+def test_encode_matches_forward(encoder):
+    tiles = torch.rand((2, 32, 32, 4))
+    with torch.inference_mode():
+        joined = encoder.encode({'64x64': torch.rand((2, 64, 64, 4)), '32x32': tiles})['32x32']
+        torch.testing.assert_close(joined, encoder(tiles))
+
+def test_encode_buffer_views(encoder):
+    # What the decode-mode loader hands out: every bucket, most of them empty.
+    buffers = BucketBuffers(normalized=False)
+    buffers.add(torch.randint(1, 255, (2, 2, 32, 32, 4), dtype=torch.uint8).numpy(), random_pad=False)
+    sample = {f"{size}x{size}": tiles for size, tiles in buffers.views().items()}
+    with torch.inference_mode():
+        out = encoder.encode(sample)
+    assert tuple(out['32x32'].shape) == (4, D_LATENT)
+    assert all(len(e) == 0 for bucket, e in out.items() if bucket != '32x32')
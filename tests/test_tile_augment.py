@@ -0,0 +1,69 @@
+import pytest
+import torch
+
+from pixme.model.TileAugment import TileAugment
+
+
+def sprites(n=64, s=16, dtype=torch.uint8):
+    # Random content in a random sub-rectangle of every tile, padding elsewhere (one tile fully empty).
+    generator = torch.Generator().manual_seed(0)
+    tiles = torch.zeros((n, s, s, 4), dtype=torch.uint8)
+    for i in range(1, n):
+        h, w = torch.randint(1, s + 1, (2,), generator=generator).tolist()
+        y, x = torch.randint(0, s - h + 1, (1,), generator=generator).item(), torch.randint(0, s - w + 1, (1,), generator=generator).item()
+        tiles[i, y:y + h, x:x + w] = torch.randint(1, 256, (h, w, 4), dtype=torch.uint8, generator=generator)
+    return tiles if dtype == torch.uint8 else tiles.to(dtype) / 255
+
+def dihedral(tile):
+    return [torch.rot90(t, k, dims=(0, 1)) for t in (tile, tile.flip(1)) for k in range(4)]
+
+def content(tile):
+    occupied = tile.any(dim=-1)
+    rows, cols = occupied.any(dim=1).nonzero(), occupied.any(dim=0).nonzero()
+    return tile[rows.min():rows.max() + 1, cols.min():cols.max() + 1]
+
+GEOMETRY_ONLY = dict(palette_swap=0, hue=0, alpha_jitter=0)
+
+@pytest.mark.parametrize("dtype", [torch.uint8, torch.float32])
+def test_rotations_and_flips(dtype):
+    tiles = sprites(dtype=dtype)
+    out = TileAugment(translate=False, flip=0.5, rotate=0.5, seed=0, **GEOMETRY_ONLY)(tiles)
+    assert out.dtype == dtype and out.shape == tiles.shape
+    for tile, augmented in zip(tiles, out):
+        assert any(torch.equal(augmented, candidate) for candidate in dihedral(tile))
+    # Both flips and all rotations actually happen.
+    variants = {next(k for k, c in enumerate(dihedral(t)) if torch.equal(a, c)) for t, a in zip(tiles[1:], out[1:])
+                if not any(torch.equal(c, dihedral(t)[0]) for c in dihedral(t)[1:])}
+    assert len(variants) > 4
+
+def test_translation_is_lossless():
+    tiles = sprites()
+    out = TileAugment(translate=True, flip=0.5, rotate=0.5, seed=1, **GEOMETRY_ONLY)(tiles)
+    assert torch.equal(out[0], tiles[0])
+    moved = 0
+    for tile, augmented in zip(tiles[1:], out[1:]):
+        # The whole content survives (no cropping), only rotated/flipped and moved inside the padding.
+        assert any(torch.equal(content(augmented), candidate) for candidate in dihedral(content(tile)))
+        assert augmented.any(dim=-1).sum() == tile.any(dim=-1).sum()
+        moved += not any(torch.equal(augmented, candidate) for candidate in dihedral(tile))
+    assert moved > 0
+
+def test_deterministic():
+    tiles = sprites()
+    sample = {'16x16': tiles, '8x8': tiles[:, :8, :8].contiguous()}
+    augment = TileAugment(seed=5)
+    first = augment(sample)
+    augment.reseed(5)
+    second = augment(sample)
+    for bucket in sample:
+        assert torch.equal(first[bucket], second[bucket])
+    assert not torch.equal(TileAugment(seed=6)(tiles), first['16x16'])
+
+def test_colors_keep_transparency():
+    tiles = sprites()
+    out = TileAugment(translate=False, flip=0, rotate=0, palette_swap=1, hue=0.2, alpha_jitter=0.3, seed=0)(tiles)
+    assert torch.equal(out[..., 3] > 0, tiles[..., 3] > 0)
+
+def test_empty():
+    tiles = torch.zeros((0, 8, 8, 4), dtype=torch.uint8)
+    assert TileAugment(seed=0)(tiles) is tiles
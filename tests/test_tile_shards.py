@@ -0,0 +1,66 @@
+import importlib
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixme.extractors.ImageIndex import ImageIndex
+from pixme.model.TileShards import TileShards
+
+tile_shards_module = importlib.import_module("pixme.model.TileShards")
+
+
+class InlinePool:
+    # Runs tasks as they're submitted, and remembers the most of them that were ever waiting to be collected.
+    def __init__(self, max_workers, initializer, initargs):
+        initializer(*initargs)
+        self.waiting = self.most_waiting = 0
+        pools.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        self.waiting += 1
+        self.most_waiting = max(self.most_waiting, self.waiting)
+        result = future.result
+        future.result = lambda: (setattr(self, "waiting", self.waiting - 1), result())[1]
+        return future
+
+pools = []
+
+@pytest.fixture
+def index(tmp_path):
+    rng = np.random.default_rng(0)
+    (tmp_path / "image").mkdir()
+    for i in range(50):
+        size = (16, 16) if i % 3 else (32, 64)
+        Image.fromarray(rng.integers(0, 256, (*size, 4), dtype=np.uint8)).save(tmp_path / "image" / f"{i:02d}.png")
+    (tmp_path / "image" / "broken.png").write_bytes(b"not a png")
+    return ImageIndex.build("a", tmp_path / "image")
+
+def test_build(tmp_path, index, monkeypatch):
+    with pytest.warns(UserWarning, match="1 of 51"):
+        shards = TileShards.build(index, tmp_path / "shards", shard_bytes=16 * 16 * 4 * 10)
+    assert shards.buckets == ["16x16", "32x32", "64x64"]
+    assert sum(shards.n_tiles(bucket) for bucket in shards.buckets) == sum(len(shards.image_ids(bucket, i)) for bucket in shards.buckets for i in range(len(shards.shards[bucket])))
+    assert max(shards.shards["16x16"]) == 10
+
+    # Workers get a few chunks at a time, and the build comes out the same.
+    pools.clear()
+    monkeypatch.setattr(tile_shards_module, "ProcessPoolExecutor", InlinePool)
+    monkeypatch.setattr(tile_shards_module, "TILE_CHUNK", 4)
+    with pytest.warns(UserWarning):
+        parallel = TileShards.build(index, tmp_path / "parallel", shard_bytes=16 * 16 * 4 * 10, n_workers=2)
+    assert pools[0].most_waiting == 4
+    assert parallel.shards == shards.shards
+    for bucket in shards.buckets:
+        for i in range(len(shards.shards[bucket])):
+            np.testing.assert_array_equal(parallel.shard(bucket, i), shards.shard(bucket, i))
+            np.testing.assert_array_equal(parallel.image_ids(bucket, i), shards.image_ids(bucket, i))
@@ -0,0 +1,90 @@
+import importlib
+import os
+import pickle
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixme.image import ImageData, TilingCache
+from pixme.image.TilingCache import Tiling
+
+# `pixme.image.TilingCache` is the class; the module is only reachable by name.
+tiling_cache_module = importlib.import_module("pixme.image.TilingCache")
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    # Counts the files that actually got hashed.
+    calls = []
+    hash_file = tiling_cache_module.hash_file
+    monkeypatch.setattr(tiling_cache_module, "hash_file", lambda file: (calls.append(os.path.basename(file)), hash_file(file))[1])
+    return calls
+
+def make_images(folder, n, seed=0):
+    rng = np.random.default_rng(seed)
+    files = []
+    for i in range(n):
+        files.append(str(folder / f"{i}.png"))
+        Image.fromarray(rng.integers(0, 256, (32, 32, 4), dtype=np.uint8)).save(files[-1])
+    return files
+
+def test_key(tmp_path, hashes):
+    a, b = make_images(tmp_path, 2)
+    cache = TilingCache()
+    key = cache.key(a)
+    assert cache.key(a) == key != cache.key(a, 'rgb')
+    assert cache.key(b) != key
+    assert hashes == ["0.png", "1.png"]
+
+    # Same content, same key. A touched file gets hashed again, and keeps its key.
+    with open(a, "rb") as f:
+        content = f.read()
+    with open(b, "wb") as f:
+        f.write(content)
+    os.utime(b, ns=(1, 1))
+    assert cache.key(b) == key
+    os.utime(a, ns=(2, 2))
+    assert cache.key(a) == key
+    assert hashes == ["0.png", "1.png", "1.png", "0.png"]
+
+    # The known hashes are bounded like the tilings.
+    (tmp_path / "many").mkdir()
+    small = TilingCache(capacity=3)
+    files = make_images(tmp_path / "many", 5)
+    for file in files:
+        small.key(file)
+    assert list(small._hashes) == files[2:]
+
+def test_lru_and_sqlite(tmp_path):
+    path = str(tmp_path / "cache" / "tiling.sqlite")
+    cache = TilingCache(path, capacity=2)
+    for i in range(3):
+        cache.put(f"k{i}", Tiling(i + 1, 1, (0, i + 1, 0, 1)))
+    assert len(cache) == 2
+    # Evicted from memory, but still in the file (and back in the LRU afterwards).
+    assert cache.get("k0") == Tiling(1, 1, (0, 1, 0, 1)) and len(cache) == 2
+    assert cache.get("missing") is None
+
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy._connection is None and copy.get("k2") == Tiling(3, 1, (0, 3, 0, 1))
+    cache.close()
+    copy.close()
+    assert TilingCache(path).get("k1") == Tiling(2, 1, (0, 2, 0, 1))
+    assert TilingCache().get("k1") is None
+
+def test_image_data(tmp_path, monkeypatch):
+    # Every unique image is analyzed once, whichever file it comes from.
+    file, = make_images(tmp_path, 1)
+    analyses = []
+    analyze_tiling = ImageData.analyze_tiling
+    monkeypatch.setattr(ImageData, "analyze_tiling", lambda self: (analyses.append(self.file), analyze_tiling(self))[1])
+
+    cache = TilingCache(str(tmp_path / "tiling.sqlite"))
+    tiling = ImageData(file, tiling_cache=cache).tiling
+    with open(file, "rb") as f:
+        open(tmp_path / "copy.png", "wb").write(f.read())
+    assert ImageData(str(tmp_path / "copy.png"), tiling_cache=cache).tiling == tiling
+    assert len(analyses) == 1
+    ImageData(file, tiling_cache=cache, spectrum='rgb').tiling
+    assert len(analyses) == 2
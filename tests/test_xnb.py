@@ -0,0 +1,215 @@
+import hashlib
+import os
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixme.image.XnbTexture import (SURFACE_BGR565, SURFACE_BGRA4444, SURFACE_COLOR, SURFACE_DXT1, TEXTURE2D_READER,
+                                    XNB_FLAG_LZ4, XNB_FLAG_LZX, XnbError, XnbTexture, XnbTypeError, decode_surface)
+from pixme.utils.compression import LZX_FRAME_SIZE, Lz4Error, LzxError, decompress_lz4_block, decompress_xnb_lzx
+from pixme.wrappers import _terrariaxnb2png, libpath
+
+DATA = Path(__file__).parent / "data"
+
+
+def texture_content(image: np.ndarray, reader: str = TEXTURE2D_READER) -> bytes:
+    # XNA 4.0 Texture2D content: the type readers, then one Color surface with a single mip level.
+    name = f"{reader}, Microsoft.Xna.Framework.Graphics, Version=4.0.0.0".encode()
+    header = bytes([1, len(name)]) + name + (0).to_bytes(4, 'little') + bytes([0, 1])
+    height, width = image.shape[:2]
+    surface = b''.join(v.to_bytes(4, 'little') for v in (SURFACE_COLOR, width, height, 1, image.nbytes))
+    return header + surface + image.tobytes()
+
+def xnb_file(content: bytes, flags: int = 0, compressed: bytes | None = None) -> bytes:
+    if compressed is None:
+        return b'XNBw' + bytes([5, flags]) + (10 + len(content)).to_bytes(4, 'little') + content
+    size = 14 + len(compressed)
+    return b'XNBw' + bytes([5, flags]) + size.to_bytes(4, 'little') + len(content).to_bytes(4, 'little') + compressed
+
+def lzx_stored(data: bytes) -> bytes:
+    # An XNB LZX stream made of a single uncompressed block: no E8 header bit, block type 3, 24-bit length, then the
+    # realignment to 16 bits, R0-R2 and the raw bytes. Framed in 32Kb output frames like XNA does.
+    bits = (0b0011 << 28) | (len(data) << 4)
+    stream = (bits >> 16).to_bytes(2, 'little') + (bits & 0xFFFF).to_bytes(2, 'little') + bytes(12) + data
+    out, pos = b'', 0
+    for start in range(0, len(data), LZX_FRAME_SIZE):
+        frame = min(LZX_FRAME_SIZE, len(data) - start)
+        end = 16 + start + frame
+        block = stream[pos:end]
+        if frame == LZX_FRAME_SIZE:
+            out += len(block).to_bytes(2, 'big') + block
+        else:
+            out += b'\xFF' + frame.to_bytes(2, 'big') + len(block).to_bytes(2, 'big') + block
+        pos = end
+    return out
+
+def lzx_frame(out_size: int, bits: str) -> bytes:
+    # Pads a frame's bits to a 16-bit word and packs them the way LZX reads them, behind an explicit-size XNB header.
+    bits += '0' * (-len(bits) % 16)
+    block = b''.join(int(bits[i:i + 16], 2).to_bytes(2, 'little') for i in range(0, len(bits), 16))
+    return b'\xFF' + out_size.to_bytes(2, 'big') + len(block).to_bytes(2, 'big') + block
+
+def lzx_verbatim_header(length: int) -> str:
+    # A verbatim block whose main tree gives all 512 symbols a 9-bit code (so each code is the symbol itself) and whose
+    # length tree is empty. Every pretree symbol up to 15 gets a 4-bit code; tree lengths are coded as (17 + old - new).
+    pretree = '0100' * 16 + '0000' * 4
+    main = pretree + '1000' * 256
+    return f'{1:03b}{length:024b}' + main + main + pretree + '0000' * 249
+
+def lzx_literals(data: bytes) -> str:
+    return ''.join(f'{c:09b}' for c in data)
+
+def lzx_repeat(length: int) -> str:
+    # A match of 2-8 bytes at the last offset (R0, initially 1).
+    return f'{256 + length - 2:09b}'
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).integers(0, 256, (37, 300, 4), dtype=np.uint8)
+
+def test_xnb_uncompressed(tmp_path, image):
+    file = tmp_path / "a.xnb"
+    file.write_bytes(xnb_file(texture_content(image)))
+    texture = XnbTexture(file)
+    assert (texture.width, texture.height) == (300, 37)
+    np.testing.assert_array_equal(texture.image, image)
+
+def test_xnb_lzx(tmp_path, image):
+    # 44400 bytes of content: one full frame plus a shorter last one.
+    content = texture_content(image)
+    assert len(content) > LZX_FRAME_SIZE
+    assert decompress_xnb_lzx(lzx_stored(content), 0, len(lzx_stored(content)), len(content)) == content
+
+    file = tmp_path / "a.xnb"
+    file.write_bytes(xnb_file(content, XNB_FLAG_LZX, lzx_stored(content)))
+    np.testing.assert_array_equal(XnbTexture(file).image, image)
+
+@pytest.mark.parametrize("name, digest", [
+    ("lzx_verbatim.bin", "856a6c5af6da488b051f8ff4690d9a84d53fe29226d440006b373a91fd03fb84"),
+    ("lzx_aligned_e8.bin", "c7c5808f45e74b6de556bdc153c9b6092ff24055e82e9dc9336aaa6fd0b20514"),
+])
+def test_lzx_encoder_output(name, digest):
+    # Two 64Kb reset intervals from the PyWin32.chm help file (Microsoft's LZX encoder) in XNB frames: one verbatim
+    # block, and one aligned offset block with an E8 header (file size 12000000) spliced in front so that 49 calls
+    # get translated. The digests are libmspack's output.
+    data = (DATA / name).read_bytes()
+    assert hashlib.sha256(decompress_xnb_lzx(data, 0, len(data), 2 * LZX_FRAME_SIZE)).hexdigest() == digest
+
+def test_lzx_match_overrun():
+    # The match runs 2 bytes past the first 16 byte frame; like MonoGame, that frame is the 16 bytes before the
+    # match ends and the overrun comes out of the block.
+    first = '0' + lzx_verbatim_header(32) + lzx_literals(b'abcdefghij') + lzx_repeat(8)
+    data = lzx_frame(16, first) + lzx_frame(14, lzx_literals(b'klmnopqrstuvwx'))
+    assert decompress_xnb_lzx(data, 0, len(data), 30) == b'cdefghij' + b'j' * 8 + b'klmnopqrstuvwx'
+
+    # Past the end of the block, though, there is nothing to take it from.
+    first = '0' + lzx_verbatim_header(12) + lzx_literals(b'abcdefghij') + lzx_repeat(8)
+    data = lzx_frame(16, first)
+    with pytest.raises(LzxError, match="end of the block"):
+        decompress_xnb_lzx(data, 0, len(data), 16)
+
+def test_xnb_lz4(tmp_path, image):
+    lz4_block = pytest.importorskip("lz4.block")
+    image[:20] = image[0, 0]  # Something to actually compress.
+    content = texture_content(image)
+    file = tmp_path / "a.xnb"
+    file.write_bytes(xnb_file(content, XNB_FLAG_LZ4, lz4_block.compress(content, store_size=False)))
+    np.testing.assert_array_equal(XnbTexture(file).image, image)
+
+def test_lz4_overlapping_match():
+    # 'ab' as literals, then a match of 6 at offset 2 that reads its own output.
+    assert decompress_lz4_block(b'\x22ab\x02\x00', 8) == b'abababab'
+    with pytest.raises(Lz4Error):
+        decompress_lz4_block(b'\x22ab\x03\x00', 8)
+    with pytest.raises(Lz4Error):
+        decompress_lz4_block(b'\x22ab\x02\x00', 9)
+
+def test_xnb_errors(tmp_path, image):
+    file = tmp_path / "a.xnb"
+    file.write_bytes(xnb_file(texture_content(image, 'Microsoft.Xna.Framework.Content.SoundEffectReader')))
+    with pytest.raises(XnbTypeError):
+        XnbTexture(file)
+    file.write_bytes(b'PNG' + xnb_file(texture_content(image))[3:])
+    with pytest.raises(XnbError):
+        XnbTexture(file)
+
+def test_xnb_unpremultiply(tmp_path):
+    image = np.array([[[64, 32, 0, 128], [10, 20, 30, 0], [255, 255, 255, 255]]], dtype=np.uint8)
+    file = tmp_path / "a.xnb"
+    file.write_bytes(xnb_file(texture_content(image)))
+    np.testing.assert_array_equal(XnbTexture(file, unpremultiply=True).image,
+                                  [[[128, 64, 0, 128], [0, 0, 0, 0], [255, 255, 255, 255]]])
+
+def test_packed_surfaces():
+    packed = np.array([0xFFFF, 0xF800, 0x07E0, 0x001F], dtype='<u2').tobytes()
+    np.testing.assert_array_equal(decode_surface(SURFACE_BGR565, 2, 2, packed).reshape(4, 4),
+                                  [[255, 255, 255, 255], [255, 0, 0, 255], [0, 255, 0, 255], [0, 0, 255, 255]])
+    packed = np.array([0xF0F0, 0x0FFF], dtype='<u2').tobytes()
+    np.testing.assert_array_equal(decode_surface(SURFACE_BGRA4444, 2, 1, packed).reshape(2, 4),
+                                  [[0, 255, 0, 255], [255, 255, 255, 0]])
+
+def test_dxt1():
+    # c0 > c1: 4 colors, row y uses index y (white, black, 2/3 white, 1/3 white).
+    opaque = (0xFFFF).to_bytes(2, 'little') + (0).to_bytes(2, 'little') + bytes([0x00, 0x55, 0xAA, 0xFF])
+    # c0 <= c1: 3 colors + transparent black for index 3.
+    punchthrough = (0).to_bytes(2, 'little') + (0xFFFF).to_bytes(2, 'little') + bytes([0xFF] * 4)
+    image = decode_surface(SURFACE_DXT1, 8, 3, opaque + punchthrough)
+    assert image.shape == (3, 8, 4)
+    np.testing.assert_array_equal(image[:, 0, :3], [[255] * 3, [0] * 3, [170] * 3])
+    assert (image[:, :4, 3] == 255).all()
+    assert (image[:, 4:] == 0).all()
+
+@pytest.fixture
+def decodes(monkeypatch):
+    # Counts the .xnb files that actually got decoded.
+    calls = []
+    decode_xnb = _terrariaxnb2png._decode_xnb
+    monkeypatch.setattr(_terrariaxnb2png, "_decode_xnb", lambda src, *args: (calls.append(os.path.basename(src)), decode_xnb(src, *args))[1])
+    return calls
+
+def test_decode_xnbs_manifest(tmp_path, image, decodes):
+    top, copy_to, cache = tmp_path / "top", tmp_path / "out", tmp_path / "cache"
+    (top / "sub").mkdir(parents=True)
+    copy_to.mkdir()
+    for name in ("a.xnb", "b.xnb", "sub/c.xnb"):
+        (top / name).write_bytes(xnb_file(texture_content(image)))
+    convert = lambda **kwargs: _terrariaxnb2png.decode_xnbs(top, copy_to, n_workers=1, verbose=False, cache_dir=cache, **kwargs)
+
+    assert convert() and sorted(decodes) == ["a.xnb", "b.xnb", "c.xnb"]
+    assert (copy_to / "sub" / "c.png").is_file()
+    decodes.clear()
+    assert convert() and decodes == []
+
+    # Only the mtime moved: the sha256 still matches, so nothing is redone.
+    os.utime(top / "a.xnb", ns=(1, 1))
+    assert convert() and decodes == []
+
+    (top / "b.xnb").write_bytes(xnb_file(texture_content(image[::-1])))
+    os.remove(top / "sub" / "c.xnb")
+    assert convert() and decodes == ["b.xnb"]
+    assert not (cache / "sub" / "c.png").exists()
+    np.testing.assert_array_equal(np.asarray(Image.open(copy_to / "b.png")), image[::-1])
+    decodes.clear()
+
+    # A different decoder version redoes everything.
+    assert convert(unpremultiply=True) and sorted(decodes) == ["a.xnb", "b.xnb"]
+
+def test_decompile_xnbs_lib_path(tmp_path, image, monkeypatch):
+    # TerrariaXNB2PNG runs from its scratch folder, so a relative lib path has to be resolved first.
+    def run(args, cwd, **kwargs):
+        assert os.path.isabs(args[0]) and args[0] == str(tmp_path / "lib" / "TerrariaXNB2PNG")
+        for xnb in args[1:]:
+            open(os.path.join(cwd, os.path.splitext(xnb)[0] + ".png"), "w").close()
+        return subprocess.CompletedProcess(args, 0)
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(libpath, "LIB_PATH", "lib")
+    monkeypatch.setattr(subprocess, "run", run)
+    (tmp_path / "top").mkdir()
+    (tmp_path / "out").mkdir()
+    (tmp_path / "top" / "a.xnb").write_bytes(xnb_file(texture_content(image)))
+    assert _terrariaxnb2png.decompile_xnbs("top", "out", verbose=False)
+    assert os.listdir(tmp_path / "out") == ["a.png"]